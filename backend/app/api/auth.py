@@ -1,40 +1,67 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, HTTPException, Depends, status
 from datetime import timedelta
-from ..models.user import UserLogin, Token, FAKE_USERS_DB
-from ..core.security import verify_password, create_access_token
+from ..models.user import UserLogin, Token
+from typing import Optional
+from ..core.security import create_access_token, revoke_access_token, get_request_token
 from ..core.config import settings
+from ..core.metrics import LOGINS
+from ..core.logger import get_logger
+from ..services.users import user_store, password_verifier, LoginBusyError
+import asyncio
 
 router = APIRouter()
+logger = get_logger(__name__)
 
 @router.post("/login", response_model=Token)
 async def login(user_data: UserLogin):
-    """用户登录"""
-    print(f"Login attempt - username: {user_data.username}")
+    """用户登录
     
-    user = FAKE_USERS_DB.get(user_data.username)
+    用户查询和 bcrypt 校验都在线程中执行，登录期间终端连接不受影响；
+    正在校验的请求过多时返回 503。
+    """
+    log = logger.bind(username=user_data.username)
+    log.debug("Login attempt")
+    
+    user = await asyncio.to_thread(user_store.get_user, user_data.username)
     if not user:
-        print(f"User not found: {user_data.username}")
+        log.info("Login failed: user not found")
+        LOGINS.labels(result="failure").inc()
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    print(f"User found, verifying password...")
-    print(f"Stored hash: {user['hashed_password']}")
+    try:
+        verified = await password_verifier.verify(user_data.password, user["hashed_password"])
+    except LoginBusyError as e:
+        LOGINS.labels(result="rejected").inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e),
+            headers={"Retry-After": "1"},
+        )
     
-    if not verify_password(user_data.password, user["hashed_password"]):
-        print("Password verification failed")
+    if not verified:
+        log.info("Login failed: wrong password")
+        LOGINS.labels(result="failure").inc()
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    print("Password verified successfully")
+    LOGINS.labels(result="success").inc()
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user_data.username}, expires_delta=access_token_expires
     )
     
     return {"access_token": access_token, "token_type": "bearer"}
+
+@router.post("/logout")
+def logout(token: Optional[str] = Depends(get_request_token)):
+    """登出：吊销当前 token，之后使用该 token 的请求和连接都会被拒绝"""
+    if not token or not revoke_access_token(token):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="未授权")
+    return {"message": "已登出"}
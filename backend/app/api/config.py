@@ -16,6 +16,14 @@ class TerminalConfig(BaseModel):
     refresh_interval: int = 3  # 仪表盘刷新间隔（秒）
     session_timeout: int = 3600  # 会话超时时间（秒），默认1小时
     buffer_size: int = 1000  # 输出缓存行数
+    memory_budget_mb: int = 256  # 所有会话常驻内存的输出缓存上限（MB），超出时换出空闲会话
+    max_sessions: int = 0  # 最大并发会话数，0 表示不限制
+    max_sessions_per_user: int = 0  # 每个用户的最大并发会话数，0 表示不限制
+    session_rate_limit_kb: int = 0  # 每个会话的输出速率上限（KB/s），0 表示不限制
+    user_rate_limit_kb: int = 0  # 每个用户所有会话合计的输出速率上限（KB/s），0 表示不限制
+    latency_tracing: bool = False  # 是否在输入消息中携带序号以追踪回显延迟
+    output_compression: bool = False  # 是否对 WebSocket 输出进行 deflate 压缩（适合慢速网络）
+    archive_after_days: int = 30  # 已结束会话不活跃超过该天数后归档到文件并从数据库删除，0 表示不归档
 
 def load_config() -> TerminalConfig:
     """加载配置"""
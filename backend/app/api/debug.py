@@ -0,0 +1,84 @@
+from fastapi import APIRouter, Query, HTTPException, Depends
+from fastapi.responses import PlainTextResponse, JSONResponse
+from ..services.terminal import terminal_manager
+from ..services.profiling import sample_stacks, format_collapsed, tracemalloc_diff, session_memory_usage
+from ..services.retention import retention_job
+from ..core.security import get_current_user
+from ..core.config import settings
+import asyncio
+import threading
+import time
+
+# 同一时间只允许一个分析任务，避免采样线程互相干扰
+_profiling_lock = threading.Lock()
+
+def _require_admin(username: str = Depends(get_current_user)) -> str:
+    """要求用户在 ADMIN_USERS 中"""
+    if username not in settings.ADMIN_USERS:
+        raise HTTPException(status_code=403, detail="需要管理员权限")
+    return username
+
+# 所有调试接口都要求管理员权限
+router = APIRouter(dependencies=[Depends(_require_admin)])
+
+def _attachment(filename: str) -> dict:
+    return {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+async def _run_exclusive(function, *args):
+    """在线程中运行分析任务，事件循环在分析期间保持正常工作"""
+    if not _profiling_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="已有分析任务正在运行")
+    try:
+        return await asyncio.to_thread(function, *args)
+    finally:
+        _profiling_lock.release()
+
+@router.get("/profile")
+async def cpu_profile(
+    seconds: float = Query(5.0, gt=0, le=60),
+    interval: float = Query(0.005, ge=0.001, le=1),
+    download: bool = Query(False)
+):
+    """对所有线程进行定时采样，返回 collapsed 格式调用栈（可直接用于火焰图）"""
+    stacks = await _run_exclusive(sample_stacks, seconds, interval)
+    headers = {"X-Profile-Samples": str(sum(stacks.values()))}
+    if download:
+        headers.update(_attachment(f"profile-{int(time.time())}.collapsed"))
+    return PlainTextResponse(format_collapsed(stacks), headers=headers)
+
+@router.get("/memory/tracemalloc")
+async def memory_diff(
+    seconds: float = Query(10.0, ge=0, le=300),
+    limit: int = Query(50, ge=1, le=1000),
+    group_by: str = Query("lineno", pattern="^(lineno|filename|traceback)$"),
+    download: bool = Query(False)
+):
+    """tracemalloc 快照对比：返回间隔内内存增长最多的分配位置"""
+    result = await _run_exclusive(tracemalloc_diff, seconds, limit, group_by)
+    headers = _attachment(f"tracemalloc-{int(time.time())}.json") if download else None
+    return JSONResponse(result, headers=headers)
+
+@router.get("/memory/sessions")
+def memory_by_session(download: bool = Query(False)):
+    """按会话统计缓冲区、输出历史和客户端状态的内存占用"""
+    sessions = sorted(
+        (session_memory_usage(session) for session in list(terminal_manager.sessions.values())),
+        key=lambda item: item["total_bytes"],
+        reverse=True,
+    )
+    result = {
+        "sessions": sessions,
+        "total_bytes": sum(item["total_bytes"] for item in sessions),
+    }
+    headers = _attachment(f"session-memory-{int(time.time())}.json") if download else None
+    return JSONResponse(result, headers=headers)
+
+@router.get("/retention")
+def retention_status():
+    """上一次归档和压缩的结果"""
+    return {"archive_after_days": retention_job.archive_after_days, "last_result": retention_job.last_result}
+
+@router.post("/retention")
+async def run_retention():
+    """立即执行一次归档和压缩（在线程中运行，已有清理在运行时等待其完成）"""
+    return await asyncio.to_thread(retention_job.run_once)
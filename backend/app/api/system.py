@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends
-import psutil
 import platform
 import socket
 from datetime import datetime, timedelta
+from ..core.metrics import SYSTEM_INFO_SECONDS
 
 router = APIRouter()
 
@@ -20,6 +20,14 @@ def get_ip_address():
 @router.get("/info")
 async def get_system_info():
     """获取系统信息"""
+    with SYSTEM_INFO_SECONDS.time():
+        return _collect_system_info()
+
+def _collect_system_info() -> dict:
+    """采集系统信息"""
+    # psutil 只有这里用到，第一次请求时才导入
+    import psutil
+    
     # CPU 信息
     cpu_percent = psutil.cpu_percent(interval=1)
     cpu_count = psutil.cpu_count()
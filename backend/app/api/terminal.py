@@ -1,101 +1,241 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, HTTPException
-from ..services.terminal import terminal_manager
-from ..core.security import decode_access_token
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, HTTPException, Request, Depends
+from fastapi.responses import StreamingResponse, FileResponse, JSONResponse
+from ..services.terminal import (
+    terminal_manager, TerminalSession, SessionLimitError, InputOverflowError,
+    INPUT_HIGH_WATER, INPUT_LOW_WATER, OUTPUT_QUANTUM
+)
+from ..services.broadcast import observer_hub, Observer
+from ..services.compression import OutputCompressor, CompressionStats
+from ..services.search import output_indexer
+from ..services.recording import get_recording_paths, read_recording_header, find_keyframe, iter_recording
+from ..services.latency import latency_tracker
+from ..services.retention import retention_job, get_archive_paths, load_archive_metadata
+from ..core.security import get_current_user, get_websocket_user
+from ..core.logger import get_logger
+from ..core.metrics import RECONNECTS, WS_SEND_SECONDS, BATCH_OPERATION_SECONDS
+from ..models.terminal import BatchCreateRequest, BatchCloseRequest, BatchResizeRequest, BatchInputRequest
 from ..api.config import load_config
 import asyncio
 import json
+import os
+import re
+import time
+from typing import Optional
 
 router = APIRouter()
+logger = get_logger(__name__)
 
-@router.websocket("/ws/{session_id}")
-async def websocket_endpoint(
-    websocket: WebSocket, 
-    session_id: str, 
-    token: str = Query(...), 
-    cwd: str = Query(None), 
-    reconnect: bool = Query(False),
-    name: str = Query("终端")
-):
-    """WebSocket 终端连接 - 支持多客户端同时连接，改进的同步机制"""
-    # 验证 token
-    payload = decode_access_token(token)
-    if not payload:
-        await websocket.close(code=1008)
-        return
-    
-    username = payload.get("sub")
-    client_id = f"{username}_{id(websocket)}"
-    
-    await websocket.accept()
-    
-    # 加载配置并更新终端管理器
+# 客户端上报的往返时间上限（毫秒），超出或类型不对的样本直接忽略
+MAX_CLIENT_RTT_MS = 60 * 1000
+
+def apply_config():
+    """加载配置并更新终端管理器"""
     config = load_config()
     terminal_manager.update_config(
         session_timeout=config.session_timeout,
-        buffer_size=config.buffer_size
+        buffer_size=config.buffer_size,
+        memory_budget_mb=config.memory_budget_mb,
+        max_sessions=config.max_sessions,
+        max_sessions_per_user=config.max_sessions_per_user,
+        session_rate_limit_kb=config.session_rate_limit_kb,
+        user_rate_limit_kb=config.user_rate_limit_kb
     )
+    retention_job.configure(archive_after_days=config.archive_after_days)
+
+def _client_rtt(data: dict) -> Optional[float]:
+    """取出客户端上报的往返时间（秒），缺失、不是数字或超出范围时返回 None"""
+    rtt = data.get("rtt")
+    if isinstance(rtt, bool) or not isinstance(rtt, (int, float)) or not 0 <= rtt <= MAX_CLIENT_RTT_MS:
+        return None
+    return rtt / 1000
+
+def _open_session(session_id: str, username: str, client_id: str, name: str, cwd: Optional[str],
+                  reconnect: bool, offset: Optional[int], epoch: Optional[str]) -> tuple[TerminalSession, list]:
+    """获取或创建会话并添加客户端，返回 (会话, 需要依次发送给客户端的消息)
     
-    # 获取或创建会话
+    超过最大会话数时抛出 SessionLimitError。
+    """
     session = terminal_manager.get_session(session_id)
     
     if session and session.is_alive():
         # 会话已存在，直接连接
-        print(f"Attaching to existing session {session_id}")
+        session.log.debug("Attaching to existing session", extra={"client_id": client_id})
         
-        # 添加客户端并获取历史缓冲区
-        buffer = session.add_client(client_id)
+        # 添加客户端并获取缺失的输出或完整的历史缓冲区
+        buffer, buffer_offset, resumed = session.add_client(client_id, offset, epoch)
         
-        if buffer:
-            await websocket.send_json({
-                "type": "reconnect",
+        RECONNECTS.labels(mode="resume" if resumed else "snapshot").inc()
+        if resumed:
+            return session, [{
+                "type": "resume",
                 "data": buffer,
-                "message": f"已连接到运行中的会话（{len(session.connected_clients)} 个客户端）"
-            })
-    elif reconnect:
+                "offset": buffer_offset,
+                "epoch": session.epoch
+            }]
+        return session, [{
+            "type": "reconnect",
+            "data": buffer,
+            "offset": buffer_offset,
+            "epoch": session.epoch,
+            "message": f"已连接到运行中的会话（{len(session.connected_clients)} 个客户端）"
+        }]
+    
+    if reconnect:
         # 尝试从数据库恢复会话
         success, buffer = terminal_manager.reconnect_session(session_id, username)
+        RECONNECTS.labels(mode="restore" if success else "restore_failed").inc()
         if success:
-            # 重新创建会话
+            # 重新创建会话，纪元改变，客户端需要完整快照
             session = terminal_manager.create_session(session_id, username, name, cwd=cwd)
-            buffer = session.add_client(client_id)
-            
-            await websocket.send_json({
+            buffer, buffer_offset, _ = session.add_client(client_id)
+            return session, [{
                 "type": "reconnect",
                 "data": buffer,
+                "offset": buffer_offset,
+                "epoch": session.epoch,
                 "message": "会话已从数据库恢复"
-            })
-        else:
-            # 恢复失败，创建新会话
-            await websocket.send_json({
-                "type": "reconnect_failed",
-                "message": buffer
-            })
-            session = terminal_manager.create_session(session_id, username, name, cwd=cwd)
-            session.add_client(client_id)
-    else:
-        # 创建新的终端会话
+            }]
+        
+        # 恢复失败，创建新会话
         session = terminal_manager.create_session(session_id, username, name, cwd=cwd)
-        session.add_client(client_id)
+        _, buffer_offset, _ = session.add_client(client_id)
+        return session, [{
+            "type": "reconnect_failed",
+            "message": buffer
+        }, {
+            "type": "attached",
+            "offset": buffer_offset,
+            "epoch": session.epoch
+        }]
+    
+    # 创建新的终端会话
+    session = terminal_manager.create_session(session_id, username, name, cwd=cwd)
+    _, buffer_offset, _ = session.add_client(client_id)
+    return session, [{
+        "type": "attached",
+        "offset": buffer_offset,
+        "epoch": session.epoch
+    }]
+
+def _next_output(session: TerminalSession, client_id: str, pending_traces: list) -> tuple[Optional[dict], list, Optional[float]]:
+    """取客户端的下一帧输出，返回 (输出消息, 这一帧回显的延迟追踪, 回显读到的时间)，没有新输出时消息为 None"""
+    available_at = None
+    if pending_traces:
+        available_at = session.get_unread_output_time(client_id, pending_traces[0][1])
+    
+    # 获取该客户端未读取的输出，每次最多发送 OUTPUT_QUANTUM，避免大流量会话长时间占用事件循环
+    output, output_offset = session.get_new_output_for_client(client_id, OUTPUT_QUANTUM)
+    if not output:
+        return None, [], None
+    
+    message = {
+        "type": "output",
+        "data": output,
+        "offset": output_offset
+    }
+    traces = []
+    if available_at is not None:
+        # 这一帧包含输入之后的输出，视为回显
+        traces = pending_traces[:]
+        pending_traces.clear()
+        message["echo_seq"] = traces[-1][0]
+    return message, traces, available_at
+
+def _record_traces(session_id: str, traces: list, available_at: Optional[float]):
+    """输出帧发送后记录回显延迟"""
+    sent_at = time.time()
+    for _, received_at, written_at in traces:
+        latency_tracker.record_echo(session_id, received_at, written_at, available_at, sent_at)
+
+async def _send(websocket: WebSocket, message: dict, compressor: Optional[OutputCompressor] = None,
+                stats: Optional[CompressionStats] = None):
+    """发送一条消息，开启压缩时由压缩器决定使用文本帧还是压缩后的二进制帧"""
+    if compressor is None:
+        await websocket.send_json(message)
+        return
+    frame = compressor.encode(message, stats)
+    if isinstance(frame, bytes):
+        await websocket.send_bytes(frame)
+    else:
+        await websocket.send_text(frame)
+
+@router.websocket("/ws/{session_id}")
+async def websocket_endpoint(
+    websocket: WebSocket, 
+    session_id: str, 
+    username: str = Depends(get_websocket_user), 
+    cwd: str = Query(None), 
+    reconnect: bool = Query(False),
+    name: str = Query("终端"),
+    offset: int = Query(None),
+    epoch: str = Query(None),
+    compress: str = Query(None)
+):
+    """WebSocket 终端连接 - 支持多客户端同时连接，改进的同步机制
+    
+    客户端重连时可携带上次收到的输出偏移 offset 和会话纪元 epoch，
+    服务端只补发缺失的部分，偏移已被淘汰时回退为完整快照。
+    compress=deflate 时较大的消息以压缩后的二进制帧发送。
+    """
+    client_id = f"{username}_{id(websocket)}"
+    log = logger.bind(session_id=session_id, client_id=client_id, username=username)
+    compressor = OutputCompressor() if compress == "deflate" else None
+    stats = CompressionStats()
+    
+    async def send(message: dict):
+        await _send(websocket, message, compressor, stats)
+    
+    await websocket.accept()
+    
+    apply_config()
+    
+    # 获取或创建会话
+    try:
+        session, messages = _open_session(session_id, username, client_id, name, cwd, reconnect, offset, epoch)
+    except SessionLimitError as e:
+        await websocket.send_json({
+            "type": "error",
+            "message": str(e)
+        })
+        await websocket.close(code=1013)
+        return
+    
+    if compressor:
+        session.compression_stats[client_id] = stats
+    for message in messages:
+        await send(message)
     
     # 用于跟踪 WebSocket 是否仍然活跃
     websocket_active = True
+    # 等待回显的带序号输入 [(seq, 收到时间, 写入时间)]，用于延迟追踪
+    pending_traces = []
+    # 输入积压，已通知客户端暂停发送；降到低水位后由发送任务通知恢复
+    input_paused = False
+    read_task = None
     
     try:
         # 创建读取任务 - 使用改进的同步机制
         async def read_from_terminal():
-            nonlocal websocket_active
+            nonlocal websocket_active, input_paused
             while session.running and client_id in session.connected_clients and websocket_active:
                 try:
-                    # 获取该客户端未读取的输出
-                    output = session.get_new_output_for_client(client_id)
-                    if output:
-                        await websocket.send_json({
-                            "type": "output",
-                            "data": output
-                        })
-                    await asyncio.sleep(0.01)
+                    if input_paused and session.pending_input_size() <= INPUT_LOW_WATER:
+                        input_paused = False
+                        await send({"type": "flow", "state": "resume"})
+                    
+                    message, traces, available_at = _next_output(session, client_id, pending_traces)
+                    if message:
+                        with WS_SEND_SECONDS.time():
+                            await send(message)
+                        _record_traces(session_id, traces, available_at)
+                    
+                    # 交互式会话更频繁地检查新输出，大流量会话让出更多时间给其他连接
+                    if terminal_manager.scheduler.is_interactive(session_id):
+                        await asyncio.sleep(0.005)
+                    else:
+                        await asyncio.sleep(0.02)
                 except Exception as e:
-                    print(f"Error sending output to client {client_id}: {e}")
+                    log.error("Error sending output: %s", e)
                     websocket_active = False
                     break
         
@@ -110,9 +250,22 @@ async def websocket_endpoint(
                 if data["type"] == "input":
                     # 确保会话仍然活跃
                     if session.running and session.is_alive():
-                        session.write(data["data"])
+                        received_at = time.time()
+                        try:
+                            pending = session.write(data["data"])
+                        except InputOverflowError as e:
+                            await send({"type": "error", "message": str(e)})
+                            continue
+                        if "seq" in data:
+                            # 客户端开启了延迟追踪
+                            pending_traces.append((data["seq"], received_at, time.time()))
+                        if pending > INPUT_HIGH_WATER and not input_paused:
+                            # 输入积压，通知客户端暂停发送；仍继续接收消息（关闭、心跳、断开），
+                            # 暂停期间到达的输入照常排队，由 INPUT_MAX_PENDING 限制总量
+                            input_paused = True
+                            await send({"type": "flow", "state": "pause"})
                     else:
-                        await websocket.send_json({
+                        await send({
                             "type": "error",
                             "message": "会话已关闭"
                         })
@@ -121,9 +274,15 @@ async def websocket_endpoint(
                 elif data["type"] == "resize":
                     session.set_winsize(data["rows"], data["cols"])
                     
+                elif data["type"] == "latency":
+                    # 客户端上报的按键到回显往返时间（毫秒）
+                    rtt = _client_rtt(data)
+                    if rtt is not None:
+                        latency_tracker.record(session_id, "client_rtt", rtt)
+                    
                 elif data["type"] == "ping":
                     # 心跳请求，回复 pong
-                    await websocket.send_json({
+                    await send({
                         "type": "pong"
                     })
                     
@@ -143,17 +302,18 @@ async def websocket_endpoint(
                 websocket_active = False
                 break
             except Exception as e:
-                print(f"Error processing message from client {client_id}: {e}")
+                log.error("Error processing message: %s", e)
                 websocket_active = False
                 break
                 
     except WebSocketDisconnect:
         pass
     except Exception as e:
-        print(f"WebSocket error for client {client_id}: {e}")
+        log.error("WebSocket error: %s", e)
     finally:
         websocket_active = False
-        read_task.cancel()
+        if read_task:
+            read_task.cancel()
         
         # 移除客户端
         if session:
@@ -166,38 +326,442 @@ async def websocket_endpoint(
             # 如果没有客户端连接，会话继续在后台运行
             # 不会被关闭，除非用户明确关闭或超时
             if not session.has_clients():
-                print(f"Session {session_id} has no clients, but keeping alive in background")
+                log.info("Session has no clients, keeping alive in background")
         
         try:
             await websocket.close()
         except:
             pass
 
-@router.get("/sessions")
-async def list_sessions(token: str = Query(...)):
-    """列出所有活跃会话"""
-    payload = decode_access_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="未授权")
+class _MuxChannel:
+    """多路复用连接上的一个会话通道"""
+    
+    def __init__(self, channel, session: TerminalSession, client_id: str):
+        self.channel = channel
+        self.session = session
+        self.client_id = client_id
+        self.pending_traces = []  # 等待回显的带序号输入
+        self.input_paused = False  # 输入积压，已通知客户端暂停发送
+        self.output_paused = False  # 客户端要求暂停输出（例如标签页不可见）
+        self.compression = CompressionStats()  # 连接开启压缩时这个通道的压缩统计
+
+@router.websocket("/mux")
+async def multiplexed_websocket(websocket: WebSocket, username: str = Depends(get_websocket_user), compress: str = Query(None)):
+    """多路复用 WebSocket 终端连接 - 一个连接承载多个会话
+    
+    除 ping/pong 外每条消息都带 channel 字段，客户端通过 attach/detach 打开和关闭通道，
+    其余消息与单会话连接相同。认证、配置加载和心跳每个连接只做一次，
+    所有通道的输出由同一个发送任务轮流发送，每个通道单独做输入和输出的流量控制。
+    compress=deflate 时所有通道共用一个压缩上下文，压缩统计按通道记录。
+    """
+    await websocket.accept()
+    apply_config()
+    
+    channels = {}
+    websocket_active = True
+    compressor = OutputCompressor() if compress == "deflate" else None
+    log = logger.bind(username=username, client_id=f"{username}_{id(websocket)}")
+    
+    async def send(channel, message: dict):
+        message["channel"] = channel
+        mux_channel = channels.get(channel)
+        await _send(websocket, message, compressor, mux_channel.compression if mux_channel else None)
+    
+    def detach(mux_channel: _MuxChannel):
+        """关闭通道，会话继续在后台运行"""
+        channels.pop(mux_channel.channel, None)
+        session = mux_channel.session
+        session.remove_client(mux_channel.client_id)
+        if session.session_id in terminal_manager.sessions:
+            session._save_buffer_to_db()
+    
+    async def attach(channel, data: dict):
+        if channel in channels:
+            detach(channels[channel])
+        
+        client_id = f"{username}_{id(websocket)}_{channel}"
+        try:
+            session, messages = _open_session(
+                data["session_id"], username, client_id, data.get("name", "终端"), data.get("cwd"),
+                bool(data.get("reconnect", False)), data.get("offset"), data.get("epoch")
+            )
+        except SessionLimitError as e:
+            await send(channel, {"type": "error", "message": str(e)})
+            await send(channel, {"type": "detached", "code": 1013})
+            return
+        
+        channels[channel] = _MuxChannel(channel, session, client_id)
+        if compressor:
+            session.compression_stats[client_id] = channels[channel].compression
+        for message in messages:
+            await send(channel, message)
+    
+    async def handle(data: dict):
+        if data["type"] == "ping":
+            # 整个连接共用一个心跳
+            await _send(websocket, {"type": "pong"}, compressor)
+            return
+        
+        channel = data.get("channel")
+        if data["type"] == "attach":
+            await attach(channel, data)
+            return
+        
+        mux_channel = channels.get(channel)
+        if not mux_channel:
+            # 通道已关闭，忽略迟到的消息
+            return
+        session = mux_channel.session
+        
+        if data["type"] == "input":
+            if session.running and session.is_alive():
+                received_at = time.time()
+                try:
+                    pending = session.write(data["data"])
+                except InputOverflowError as e:
+                    await send(channel, {"type": "error", "message": str(e)})
+                    return
+                if "seq" in data:
+                    mux_channel.pending_traces.append((data["seq"], received_at, time.time()))
+                if pending > INPUT_HIGH_WATER and not mux_channel.input_paused:
+                    # 只暂停这个通道的输入，降到低水位后由发送任务通知恢复
+                    mux_channel.input_paused = True
+                    await send(channel, {"type": "flow", "state": "pause"})
+            else:
+                detach(mux_channel)
+                await send(channel, {"type": "error", "message": "会话已关闭"})
+                await send(channel, {"type": "detached", "code": 1000})
+        
+        elif data["type"] == "resize":
+            session.set_winsize(data["rows"], data["cols"])
+        
+        elif data["type"] == "latency":
+            rtt = _client_rtt(data)
+            if rtt is not None:
+                latency_tracker.record(session.session_id, "client_rtt", rtt)
+        
+        elif data["type"] == "flow":
+            mux_channel.output_paused = data.get("state") == "pause"
+        
+        elif data["type"] == "detach":
+            detach(mux_channel)
+            await send(channel, {"type": "detached", "code": 1000})
+        
+        elif data["type"] == "close":
+            # 用户明确关闭会话，没有其他客户端时才真正关闭
+            detach(mux_channel)
+            if not session.has_clients():
+                terminal_manager.close_session(session.session_id)
+            await send(channel, {"type": "detached", "code": 1000})
+    
+    async def pump_output():
+        """轮流发送所有通道的新输出"""
+        nonlocal websocket_active
+        while websocket_active:
+            try:
+                interactive = False
+                for mux_channel in list(channels.values()):
+                    session = mux_channel.session
+                    if not session.running or mux_channel.client_id not in session.connected_clients:
+                        continue
+                    
+                    if mux_channel.input_paused and session.pending_input_size() <= INPUT_LOW_WATER:
+                        mux_channel.input_paused = False
+                        await send(mux_channel.channel, {"type": "flow", "state": "resume"})
+                    
+                    if mux_channel.output_paused:
+                        continue
+                    
+                    message, traces, available_at = _next_output(session, mux_channel.client_id, mux_channel.pending_traces)
+                    if message:
+                        with WS_SEND_SECONDS.time():
+                            await send(mux_channel.channel, message)
+                        _record_traces(session.session_id, traces, available_at)
+                    interactive = interactive or terminal_manager.scheduler.is_interactive(session.session_id)
+                
+                await asyncio.sleep(0.005 if interactive else 0.02)
+            except Exception as e:
+                log.error("Error sending output on multiplexed connection: %s", e)
+                websocket_active = False
+                break
+    
+    pump_task = asyncio.create_task(pump_output())
+    try:
+        while websocket_active:
+            try:
+                message = await asyncio.wait_for(websocket.receive_text(), timeout=0.1)
+            except asyncio.TimeoutError:
+                continue
+            try:
+                await handle(json.loads(message))
+            except (KeyError, TypeError, ValueError) as e:
+                # 单条消息格式错误不影响连接上的其他通道
+                log.warning("Invalid message on multiplexed connection: %s", e)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        log.error("Multiplexed WebSocket error: %s", e)
+    finally:
+        websocket_active = False
+        pump_task.cancel()
+        for mux_channel in list(channels.values()):
+            detach(mux_channel)
+        try:
+            await websocket.close()
+        except:
+            pass
+
+@router.websocket("/observe/{session_id}")
+async def observe_websocket(
+    websocket: WebSocket,
+    session_id: str,
+    username: str = Depends(get_websocket_user),
+    offset: int = Query(None),
+    epoch: str = Query(None)
+):
+    """只读观察者连接 - 用于演示和多人围观同一个会话
+    
+    观察者不能输入、不能调整窗口大小，也不计入会话的客户端。
+    输出帧每帧只编码一次，以 UTF-8 JSON 二进制帧发送给所有观察者；
+    发送跟不上时连接以 1013 关闭，可携带 offset/epoch 重连续传。
+    """
+    await websocket.accept()
+    session = terminal_manager.get_session(session_id)
+    if not session or not session.is_alive():
+        await websocket.send_json({
+            "type": "error",
+            "message": "会话不存在或未运行"
+        })
+        await websocket.close(code=1008)
+        return
+    
+    observer = Observer(websocket)
+    await websocket.send_json(observer_hub.attach(session, observer, offset, epoch))
+    writer_task = asyncio.create_task(observer.write_frames())
+    
+    async def receive():
+        while True:
+            data = json.loads(await websocket.receive_text())
+            if data.get("type") == "ping":
+                await websocket.send_json({"type": "pong"})
+            elif data.get("type") in ("input", "resize"):
+                await websocket.send_json({"type": "error", "message": "观察者为只读模式"})
+    
+    receive_task = asyncio.create_task(receive())
+    closed_task = asyncio.create_task(observer.closed.wait())
+    try:
+        # 客户端断开、发送失败或广播要求断开时结束
+        await asyncio.wait({receive_task, writer_task, closed_task}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (receive_task, writer_task, closed_task):
+            task.cancel()
+        observer_hub.detach(session, observer)
+        try:
+            await websocket.close(code=observer.close_code)
+        except:
+            pass
+
+def _parse_range_header(range_header: str, available_start: int, available_end: int) -> tuple[int, int]:
+    """解析 Range 请求头（bytes=a-b / bytes=a- / bytes=-n），返回 [start, end) 范围"""
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        raise HTTPException(status_code=416, detail="仅支持单个字节范围")
+    
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) + 1 if last else available_end
+        else:
+            # 后缀范围：最后 n 个字节
+            start = available_end - int(last)
+            end = available_end
+    except ValueError:
+        raise HTTPException(status_code=416, detail="无效的 Range 请求头")
+    
+    start = max(start, available_start)
+    end = min(end, available_end)
+    if start >= end:
+        raise HTTPException(
+            status_code=416,
+            detail="请求的范围不可用",
+            headers={"Content-Range": f"bytes */{available_end}"}
+        )
+    return start, end
+
+@router.get("/session/{session_id}/scrollback")
+def get_scrollback(
+    session_id: str,
+    request: Request,
+    username: str = Depends(get_current_user),
+    start: int = Query(None),
+    end: int = Query(None)
+):
+    """分页读取会话的历史输出
+    
+    通过 start/end 字节偏移或 Range 请求头指定范围，响应直接从持久化分块流式读取。
+    响应头 X-Scrollback-Start / X-Scrollback-End 为当前可读取的完整范围，
+    客户端可据此在向上滚动时按需加载更早的历史。
+    """
+    if not terminal_manager.is_session_owner(session_id, username):
+        raise HTTPException(status_code=404, detail="会话不存在")
+    
+    available_start, available_end = terminal_manager.get_scrollback_range(session_id)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "X-Scrollback-Start": str(available_start),
+        "X-Scrollback-End": str(available_end)
+    }
+    
+    range_header = request.headers.get("range")
+    if range_header:
+        range_start, range_end = _parse_range_header(range_header, available_start, available_end)
+        status_code = 206
+        headers["Content-Range"] = f"bytes {range_start}-{range_end - 1}/{available_end}"
+    else:
+        range_start = available_start if start is None else max(start, available_start)
+        range_end = available_end if end is None else min(end, available_end)
+        range_end = max(range_start, range_end)
+        status_code = 200
+    
+    return StreamingResponse(
+        terminal_manager.iter_scrollback(session_id, range_start, range_end),
+        status_code=status_code,
+        media_type="text/plain; charset=utf-8",
+        headers=headers
+    )
+
+@router.get("/session/{session_id}/archive")
+def get_session_archive(session_id: str, username: str = Depends(get_current_user)):
+    """下载已归档会话的输出（gzip 压缩的原始输出）"""
+    metadata = load_archive_metadata(session_id)
+    if not metadata or metadata.get("username") != username:
+        raise HTTPException(status_code=404, detail="归档不存在")
+    data_path, _ = get_archive_paths(session_id)
+    return FileResponse(
+        data_path,
+        media_type="application/gzip",
+        # 文件名按会话 ID 的哈希命名，下载时使用可读的名称
+        filename=re.sub(r'[^A-Za-z0-9_-]', '_', session_id) + ".log.gz",
+        headers={
+            "X-Scrollback-Start": str(metadata["start_offset"]),
+            "X-Scrollback-End": str(metadata["end_offset"])
+        }
+    )
+
+@router.post("/session/{session_id}/recording")
+def set_session_recording(session_id: str, enabled: bool = Query(...), username: str = Depends(get_current_user)):
+    """开启或停止会话录制（asciicast v2 格式）"""
+    session = terminal_manager.get_session(session_id)
+    if not session or session.username != username:
+        raise HTTPException(status_code=404, detail="会话不存在或未运行")
+    
+    if enabled:
+        session.start_recording()
+    else:
+        session.stop_recording()
+    
+    return {"recording": session.recorder is not None}
+
+@router.get("/session/{session_id}/recording")
+def play_session_recording(session_id: str, username: str = Depends(get_current_user), start: float = Query(0.0, ge=0)):
+    """回放会话录制
+    
+    通过关键帧索引二分查找 start（秒）之前最近的关键帧，从该位置开始流式返回；
+    响应首行为 asciicast 文件头，事件时间仍相对于录制开始。
+    """
+    if not terminal_manager.is_session_owner(session_id, username):
+        raise HTTPException(status_code=404, detail="会话不存在")
+    
+    cast_path, index_path = get_recording_paths(session_id)
+    header = read_recording_header(cast_path)
+    if not header or header.get("session_id") != session_id:
+        raise HTTPException(status_code=404, detail="会话没有录制")
+    
+    seek_time, position, seek_offset = find_keyframe(index_path, start)
+    return StreamingResponse(
+        iter_recording(session_id, position),
+        media_type="application/x-asciicast",
+        headers={
+            "X-Recording-Seek-Time": str(seek_time),
+            "X-Recording-Seek-Offset": str(seek_offset)
+        }
+    )
+
+@router.get("/latency")
+def get_latency_stats(username: str = Depends(get_current_user), session_id: str = Query(None)):
+    """回显延迟分位数（秒），全局统计加当前用户会话的统计"""
+    if session_id:
+        session_ids = [session_id] if terminal_manager.is_session_owner(session_id, username) else []
+    else:
+        session_ids = [sid for sid, session in list(terminal_manager.sessions.items()) if session.username == username]
+    return latency_tracker.summary(session_ids)
+
+@router.get("/search")
+def search_output(
+    q: str = Query(..., min_length=1),
+    username: str = Depends(get_current_user),
+    session_id: str = Query(None),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """在当前用户的会话输出历史中全文检索"""
+    if not output_indexer.enabled:
+        raise HTTPException(status_code=503, detail="全文检索不可用")
     
-    username = payload.get("sub")
     return {
-        "sessions": terminal_manager.list_sessions(username)
+        "results": output_indexer.search(username, q, session_id=session_id, limit=limit)
     }
 
+@router.get("/sessions")
+async def list_sessions(username: str = Depends(get_current_user)):
+    """列出所有活跃会话"""
+    # 列表只含基本类型，直接序列化，跳过逐项的 jsonable_encoder（会话多时占列表耗时的大半）
+    return JSONResponse({
+        "sessions": terminal_manager.list_sessions(username)
+    })
+
+def _batch_response(results: list) -> dict:
+    succeeded = sum(1 for result in results if result["ok"])
+    return {"results": results, "succeeded": succeeded, "failed": len(results) - succeeded}
+
+@router.post("/sessions/batch/create")
+def batch_create_sessions(request: BatchCreateRequest, username: str = Depends(get_current_user)):
+    """批量创建会话（shell 并行启动，会话记录在一个事务中保存），返回每个会话的结果"""
+    apply_config()
+    with BATCH_OPERATION_SECONDS.labels(op="create").time():
+        results = terminal_manager.create_sessions(username, [spec.model_dump() for spec in request.sessions])
+    return _batch_response(results)
+
+@router.post("/sessions/batch/close")
+def batch_close_sessions(request: BatchCloseRequest, username: str = Depends(get_current_user)):
+    """批量关闭会话，最终缓冲区和不活跃标记在一个事务中保存"""
+    with BATCH_OPERATION_SECONDS.labels(op="close").time():
+        results = terminal_manager.close_sessions(username, request.session_ids)
+    return _batch_response(results)
+
+@router.post("/sessions/batch/resize")
+def batch_resize_sessions(request: BatchResizeRequest, username: str = Depends(get_current_user)):
+    """批量调整运行中会话的终端尺寸"""
+    with BATCH_OPERATION_SECONDS.labels(op="resize").time():
+        results = terminal_manager.resize_sessions(username, [size.model_dump() for size in request.sessions])
+    return _batch_response(results)
+
+@router.post("/sessions/batch/input")
+def batch_write_sessions(request: BatchInputRequest, username: str = Depends(get_current_user)):
+    """向多个运行中的会话发送同一段输入（例如在所有主机上执行同一条命令）"""
+    with BATCH_OPERATION_SECONDS.labels(op="input").time():
+        results = terminal_manager.write_sessions(username, request.session_ids, request.data)
+    return _batch_response(results)
+
 @router.post("/cleanup")
 async def cleanup_sessions():
     """清理不活跃的会话"""
     terminal_manager.cleanup_inactive_sessions()
     return {"message": "清理完成"}
 
-@router.get("/session/{session_id}/status")
-async def check_session_status(session_id: str, token: str = Query(...)):
+@router.get("/session/{session_id}/status", dependencies=[Depends(get_current_user)])
+async def check_session_status(session_id: str):
     """检查会话状态"""
-    payload = decode_access_token(token)
-    if not payload:
-        raise HTTPException(status_code=401, detail="未授权")
-    
     session = terminal_manager.get_session(session_id)
     if session:
         return {
@@ -208,7 +772,14 @@ async def check_session_status(session_id: str, token: str = Query(...)):
             "running_in_background": not session.has_clients() and session.is_alive(),
             "rows": session.rows,
             "cols": session.cols,
-            "pid": session.child_pid
+            "pid": session.child_pid,
+            "recording": session.recorder is not None,
+            "observers": session.observers,
+            # 开启输出压缩的客户端节省的字节数
+            "compression": {
+                client_id: stats.to_dict()
+                for client_id, stats in list(session.compression_stats.items())
+            }
         }
     
     # 检查数据库中是否有记录
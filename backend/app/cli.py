@@ -0,0 +1,47 @@
+"""命令行管理工具
+
+用法（在 backend 目录下）:
+    python -m app.cli create-user alice              # 交互式输入密码
+    python -m app.cli create-user alice --password-stdin < password.txt
+"""
+import argparse
+import getpass
+import sys
+
+from .db.database import init_db
+from .services.users import user_store, UserExistsError
+
+def create_user(args) -> int:
+    if args.password_stdin:
+        password = sys.stdin.readline().rstrip("\n")
+    else:
+        password = getpass.getpass("Password: ")
+        if password != getpass.getpass("Repeat password: "):
+            print("Passwords do not match", file=sys.stderr)
+            return 1
+    if not password:
+        print("Password must not be empty", file=sys.stderr)
+        return 1
+
+    init_db()
+    try:
+        user_store.create_user(args.username, password)
+    except UserExistsError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"Created user {args.username}")
+    return 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="acweb management commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+    create = commands.add_parser("create-user", help="add a login user")
+    create.add_argument("username")
+    create.add_argument("--password-stdin", action="store_true", help="read the password from standard input")
+    create.set_defaults(handler=create_user)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
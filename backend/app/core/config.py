@@ -9,6 +9,15 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24  # 24 hours
     
+    RECORDINGS_DIR: str = "recordings"  # 会话录制文件目录
+    SPILL_DIR: str = "spill"  # 超出内存预算时换出的会话缓冲区目录
+    ARCHIVE_DIR: str = "archive"  # 已结束会话的输出归档目录
+    ADMIN_USERS: list[str] = ["admin"]  # 可以访问调试/性能分析接口的用户
+    LOGIN_WORKERS: int = 4  # 校验密码（bcrypt）的线程数
+    LOGIN_QUEUE_LIMIT: int = 32  # 正在校验和排队的登录请求上限，超出时直接返回 503
+    LOG_LEVEL: str = "INFO"  # 日志级别（DEBUG/INFO/WARNING/ERROR）
+    LOG_FORMAT: str = "text"  # 日志格式：text 或 json（每行一个 JSON 对象）
+    
     class Config:
         case_sensitive = True
 
@@ -0,0 +1,150 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+from .config import settings
+from .metrics import LOG_RECORDS_SUPPRESSED, LOG_RECORDS_DROPPED
+
+# 后端所有模块的日志都在该 logger 之下（logging.getLogger(__name__)）
+ROOT_LOGGER = "app"
+# 日志队列长度，输出跟不上时丢弃新日志而不是阻塞调用方
+LOG_QUEUE_SIZE = 10000
+# 同一位置的 WARNING 及以上日志每个窗口（秒）最多输出的条数
+ERROR_RATE_INTERVAL = 60.0
+ERROR_RATE_BURST = 5
+# 作为结构化字段输出的上下文
+CONTEXT_FIELDS = ("session_id", "client_id", "username", "suppressed")
+
+_exception_formatter = logging.Formatter()
+
+def _context(record: logging.LogRecord) -> dict:
+    return {field: getattr(record, field) for field in CONTEXT_FIELDS if getattr(record, field, None) is not None}
+
+class TextFormatter(logging.Formatter):
+    """单行文本，上下文字段以 key=value 追加在消息后面"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        text = super().formatMessage(record)
+        fields = _context(record)
+        if fields:
+            text += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return text
+
+class JsonFormatter(logging.Formatter):
+    """每条日志一个 JSON 对象"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(_context(record))
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class RateLimitFilter(logging.Filter):
+    """限制同一位置（文件和行号）重复的 WARNING 及以上日志
+
+    每个 interval 秒的窗口内最多放行 burst 条，其余丢弃并计数；
+    下一个窗口的第一条日志带上 suppressed 字段，说明上个窗口丢弃了多少条。
+    数据库故障时每次保存都会失败，这样不会刷屏。
+    """
+
+    def __init__(self, interval: float = ERROR_RATE_INTERVAL, burst: int = ERROR_RATE_BURST):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.windows: Dict[tuple, list] = {}  # {(文件, 行号): [窗口开始时间, 已放行条数, 已丢弃条数]}
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                if window and window[2]:
+                    record.suppressed = window[2]
+                self.windows[key] = [now, 1, 0]
+                return True
+            if window[1] < self.burst:
+                window[1] += 1
+                return True
+            window[2] += 1
+        LOG_RECORDS_SUPPRESSED.inc()
+        return False
+
+class NonBlockingQueueHandler(QueueHandler):
+    """把日志放入有界队列，队列满时丢弃并计数，调用方永远不会因为输出慢而阻塞"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 在调用线程中完成参数插值和异常格式化（参数对象不跨线程传递），其余格式化交给后台线程
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+class ContextLogger(logging.LoggerAdapter):
+    """附带上下文字段（session_id、client_id、username）的 logger
+
+    调用时传入的 extra 与绑定的上下文合并，而不是替换。
+    """
+
+    def process(self, msg, kwargs):
+        kwargs["extra"] = {**self.extra, **kwargs.get("extra", {})}
+        return msg, kwargs
+
+    def bind(self, **context) -> "ContextLogger":
+        """返回附加了更多上下文字段的 logger"""
+        return ContextLogger(self.logger, {**self.extra, **context})
+
+def get_logger(name: str, **context) -> ContextLogger:
+    return ContextLogger(logging.getLogger(name), context)
+
+_listener: Optional[QueueListener] = None
+
+def setup_logging(level: Optional[str] = None, log_format: Optional[str] = None):
+    """配置后端日志：记录放入有界队列，由后台线程写到 stderr。重复调用不生效"""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if (log_format or settings.LOG_FORMAT) == "json" else TextFormatter())
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    handler = NonBlockingQueueHandler(log_queue)
+    handler.addFilter(RateLimitFilter())
+
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel((level or settings.LOG_LEVEL).upper())
+    logger.addHandler(handler)
+    logger.propagate = False
+
+    _listener = QueueListener(log_queue, output)
+    _listener.start()
+    # 退出时写完队列中剩余的日志
+    atexit.register(_listener.stop)
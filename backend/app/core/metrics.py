@@ -0,0 +1,262 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(labels: dict, extra: dict = None) -> str:
+    items = dict(labels)
+    if extra:
+        items.update(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label_value(value)}"' for key, value in items.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _CounterChild:
+    __slots__ = ("value", "lock")
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        # 无竞争的锁开销在百纳秒以内，可以常开
+        with self.lock:
+            self.value += amount
+
+class _GaugeChild:
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """采集时调用 function 获取当前值"""
+        self.function = function
+
+    def get(self) -> float:
+        if self.function:
+            try:
+                return self.function()
+            except Exception:
+                return 0
+        return self.value
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count", "lock")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self.lock:
+            self.sum += value
+            self.count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+    @contextmanager
+    def time(self):
+        """统计代码块耗时（秒）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children: Dict[tuple, object] = {}
+        self.lock = threading.Lock()
+        if not self.labelnames:
+            self.children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, **labels):
+        """获取指定标签值的子指标，调用方可缓存返回值以避免重复查找"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self._new_child())
+        return child
+
+    def remove(self, **labels):
+        """移除指定标签值的子指标（会话或客户端结束时调用）"""
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self.lock:
+            self.children.pop(key, None)
+
+    def _items(self):
+        with self.lock:
+            items = list(self.children.items())
+        for key, child in items:
+            yield dict(zip(self.labelnames, key)), child
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._render_samples())
+        return lines
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self.children[()].inc(amount)
+
+    def _render_samples(self):
+        for labels, child in self._items():
+            yield f"{self.name}{_format_labels(labels)} {_format_value(child.value)}"
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self.children[()].set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        self.children[()].set_function(function)
+
+    def _render_samples(self):
+        for labels, child in self._items():
+            yield f"{self.name}{_format_labels(labels)} {_format_value(child.get())}"
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.children[()].observe(value)
+
+    def time(self):
+        return self.children[()].time()
+
+    def _render_samples(self):
+        for labels, child in self._items():
+            with child.lock:
+                counts = list(child.counts)
+                total, count = child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(child.buckets, counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket{_format_labels(labels, {'le': _format_value(bound)})} {cumulative}"
+            yield f"{self.name}_bucket{_format_labels(labels, {'le': '+Inf'})} {count}"
+            yield f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(labels)} {count}"
+
+class MetricsRegistry:
+    """指标注册表，按 Prometheus 文本格式输出"""
+
+    def __init__(self):
+        self.metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+# 终端热路径指标
+# /metrics 不需要登录，指标不带会话 ID、客户端 ID 等可识别用户的标签
+PTY_READ_BYTES = registry.counter(
+    "terminal_pty_read_bytes_total", "Bytes read from the PTY across all sessions")
+READ_LOOP_SECONDS = registry.histogram(
+    "terminal_read_loop_iteration_seconds", "PTY scheduler round time by phase (wait: select, work: collecting and serving sessions)",
+    ("phase",))
+DB_SAVE_SECONDS = registry.histogram(
+    "terminal_db_save_seconds", "Latency of saving session output to the database")
+WS_SEND_SECONDS = registry.histogram(
+    "terminal_ws_send_seconds", "Latency of sending a WebSocket frame to a client")
+WS_QUEUE_DEPTH = registry.gauge(
+    "terminal_ws_queue_depth", "Largest number of output chunks not yet sent to any client")
+ACTIVE_SESSIONS = registry.gauge(
+    "terminal_active_sessions", "Terminal sessions held in memory")
+CONNECTED_CLIENTS = registry.gauge(
+    "terminal_connected_clients", "WebSocket clients attached to terminal sessions")
+RECONNECTS = registry.counter(
+    "terminal_reconnects_total", "Client attaches to existing sessions by outcome", ("mode",))
+SCROLLBACK_RESIDENT_BYTES = registry.gauge(
+    "terminal_scrollback_resident_bytes", "Scrollback bytes held in memory across all sessions")
+SCROLLBACK_SPILLED_BYTES = registry.gauge(
+    "terminal_scrollback_spilled_bytes", "Scrollback bytes spilled to disk across all sessions")
+SCROLLBACK_SPILLS = registry.counter(
+    "terminal_scrollback_spills_total", "Scrollback moves between memory and spill files", ("direction",))
+WS_COMPRESSION_BYTES = registry.counter(
+    "terminal_ws_compression_bytes_total", "Bytes of compressed WebSocket connections before (raw) and after (sent) compression", ("kind",))
+OBSERVERS = registry.gauge(
+    "terminal_observers", "Read-only observers attached to terminal sessions")
+BROADCAST_FRAMES = registry.counter(
+    "terminal_broadcast_frames_total", "Output frames encoded once and written to every observer of a session")
+TOKEN_CACHE_LOOKUPS = registry.counter(
+    "auth_token_cache_lookups_total", "Verified-token cache lookups by result", ("result",))
+LOGIN_VERIFY_SECONDS = registry.histogram(
+    "auth_password_verify_seconds", "Time from admission to finished bcrypt verification, including queueing")
+LOGINS = registry.counter(
+    "auth_logins_total", "Login attempts by outcome", ("result",))
+SYSTEM_INFO_SECONDS = registry.histogram(
+    "system_info_handler_seconds", "Time spent in the /system/info handler")
+DB_SIZE_BYTES = registry.gauge(
+    "db_size_bytes", "SQLite database file, WAL file and free-page bytes", ("kind",))
+SESSIONS_ARCHIVED = registry.counter(
+    "terminal_sessions_archived_total", "Finished sessions moved from the database to archive files")
+LOG_RECORDS_SUPPRESSED = registry.counter(
+    "log_records_suppressed_total", "Repeated warning/error log records dropped by rate limiting")
+LOG_RECORDS_DROPPED = registry.counter(
+    "log_records_dropped_total", "Log records dropped because the log queue was full")
+APP_STARTUP_SECONDS = registry.gauge(
+    "app_startup_seconds", "Time spent in each startup phase of the current process", ("phase",))
+BATCH_OPERATION_SECONDS = registry.histogram(
+    "terminal_batch_operation_seconds", "Latency of batch session operations", ("op",))
@@ -1,14 +1,82 @@
 from datetime import datetime, timedelta
-from typing import Optional
-from jose import JWTError, jwt
+from collections import OrderedDict
+from typing import Dict, Optional
+from fastapi import Query, Header, HTTPException, WebSocketException, status
 import bcrypt
+import hashlib
+import threading
+import time
 from .config import settings
+from .metrics import TOKEN_CACHE_LOOKUPS
+from .logger import get_logger
+
+logger = get_logger(__name__)
+
+# 已验证 token 缓存的最大条目数
+TOKEN_CACHE_SIZE = 4096
+# 缓存条目最长有效期（秒），到期后重新校验签名；token 过期时间更早时以 exp 为准
+TOKEN_CACHE_TTL = 300.0
+
+class TokenCache:
+    """已验证 token 声明的 LRU 缓存，按 token 的 SHA-256 摘要索引，不保存 token 原文
+
+    同时维护吊销集合：吊销的 token 在其过期之前一律视为无效，过期后从集合中清除。
+    """
+
+    def __init__(self, size: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.entries: OrderedDict = OrderedDict()  # {摘要: (缓存失效时间, payload)}
+        self.revoked: Dict[bytes, float] = {}  # {摘要: token 过期时间}
+        self.lock = threading.Lock()
+
+    def get(self, digest: bytes) -> Optional[dict]:
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self.entries[digest]
+                return None
+            self.entries.move_to_end(digest)
+            return entry[1]
+
+    def put(self, digest: bytes, payload: dict):
+        expires_at = time.time() + self.ttl
+        if "exp" in payload:
+            expires_at = min(expires_at, float(payload["exp"]))
+        with self.lock:
+            self.entries[digest] = (expires_at, payload)
+            self.entries.move_to_end(digest)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def is_revoked(self, digest: bytes) -> bool:
+        return digest in self.revoked
+
+    def revoke(self, digest: bytes, expires_at: float):
+        now = time.time()
+        with self.lock:
+            self.entries.pop(digest, None)
+            # 清除已自然过期的吊销记录
+            for expired in [key for key, exp in self.revoked.items() if exp <= now]:
+                del self.revoked[expired]
+            self.revoked[digest] = expires_at
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+token_cache = TokenCache()
+
+def _token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode("utf-8")).digest()
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     try:
         return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
     except Exception as e:
-        print(f"Password verification error: {e}")
+        logger.error("Password verification error: %s", e)
         return False
 
 def get_password_hash(password: str) -> str:
@@ -21,12 +89,63 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
+    # jose 在第一次签发或校验时才导入，启动时不加载（启动完成后由后台线程预先导入）
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
 
 def decode_access_token(token: str) -> Optional[dict]:
+    """校验 token 并返回声明，无效、过期或已吊销时返回 None
+
+    校验通过的声明会被缓存，返回的 dict 由缓存共享，调用方不要修改。
+    """
+    digest = _token_digest(token)
+    if token_cache.is_revoked(digest):
+        return None
+    payload = token_cache.get(digest)
+    if payload is not None:
+        TOKEN_CACHE_LOOKUPS.labels(result="hit").inc()
+        return payload
+
+    TOKEN_CACHE_LOOKUPS.labels(result="miss").inc()
+    from jose import JWTError, jwt
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        return payload
     except JWTError:
         return None
+    token_cache.put(digest, payload)
+    return payload
+
+def revoke_access_token(token: str) -> bool:
+    """吊销 token（登出），立即生效；token 本身无效时返回 False"""
+    payload = decode_access_token(token)
+    if not payload:
+        return False
+    token_cache.revoke(_token_digest(token), float(payload.get("exp", time.time() + TOKEN_CACHE_TTL)))
+    return True
+
+def get_request_token(token: Optional[str] = Query(None), authorization: Optional[str] = Header(None)) -> Optional[str]:
+    """从 token 查询参数或 Authorization: Bearer 请求头中取 token"""
+    if token:
+        return token
+    if authorization and authorization.lower().startswith("bearer "):
+        return authorization[7:].strip()
+    return None
+
+def _authenticate(token: Optional[str]) -> Optional[str]:
+    payload = decode_access_token(token) if token else None
+    return payload.get("sub") if payload else None
+
+def get_current_user(token: Optional[str] = Query(None), authorization: Optional[str] = Header(None)) -> str:
+    """HTTP 接口的认证依赖，返回用户名，未认证时返回 401"""
+    username = _authenticate(get_request_token(token, authorization))
+    if not username:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="未授权")
+    return username
+
+def get_websocket_user(token: Optional[str] = Query(None)) -> str:
+    """WebSocket 接口的认证依赖，返回用户名，未认证时以 1008 关闭连接"""
+    username = _authenticate(token)
+    if not username:
+        raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION)
+    return username
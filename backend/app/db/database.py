@@ -1,16 +1,25 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./terminal_sessions.db"
 
+# 每个线程使用独立连接，写入冲突时等待而不是报错
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
+    connect_args={"check_same_thread": False, "timeout": 30},
 )
 
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragma(dbapi_connection, connection_record):
+    """启用 WAL，读取不阻塞写入；新建的数据库开启增量 VACUUM"""
+    cursor = dbapi_connection.cursor()
+    # 只对尚未建表的新数据库生效，已有数据库需要离线执行一次 VACUUM 才会切换
+    cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -25,3 +34,7 @@ def get_db():
 def init_db():
     """初始化数据库"""
     Base.metadata.create_all(bind=engine)
+    # create_all 跳过已存在的表，之后新增的索引需要单独创建
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
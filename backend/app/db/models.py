@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Text, Float, Boolean
+from sqlalchemy import Column, String, Integer, Text, Float, Boolean, Index
 from .database import Base
 import time
 
@@ -16,3 +16,34 @@ class TerminalSessionDB(Base):
     cwd = Column(String, nullable=True)
     rows = Column(Integer, default=24)  # 终端行数
     cols = Column(Integer, default=80)  # 终端列数
+    
+    __table_args__ = (
+        # 列表和启动核对只读这些列；buffer 存在行内且排在它们前面，不走索引时读取它们要先读完缓冲区的溢出页
+        Index("ix_terminal_sessions_listing", "is_active", "username", "last_activity",
+              "created_at", "name", "rows", "cols", "pid", "id"),
+    )
+
+class TerminalOutputChunkDB(Base):
+    """终端输出分块，按字节偏移追加保存，用于分页读取历史"""
+    __tablename__ = "terminal_output_chunks"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    session_id = Column(String, nullable=False)
+    start_offset = Column(Integer, nullable=False)  # 块起始字节偏移（UTF-8）
+    end_offset = Column(Integer, nullable=False)  # 块结束字节偏移（不含）
+    data = Column(Text, default="")
+    created_at = Column(Float, default=time.time)
+    
+    __table_args__ = (
+        Index("ix_terminal_output_chunks_session_offset", "session_id", "start_offset"),
+    )
+
+class UserDB(Base):
+    """登录用户"""
+    __tablename__ = "users"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    username = Column(String, unique=True, index=True, nullable=False)
+    hashed_password = Column(String, nullable=False)
+    is_active = Column(Boolean, default=True)
+    created_at = Column(Float, default=time.time)
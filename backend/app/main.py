@@ -1,16 +1,75 @@
+import time
+_import_started = time.perf_counter()
+
+import threading
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from .core.config import settings
-from .api import auth, terminal, system, config
+from .core.logger import setup_logging, get_logger
+from .api import auth, terminal, system, config, debug
 from .db.database import init_db
+from .services.search import output_indexer
+from .services.users import user_store
+from .services.retention import retention_job
+from .services.terminal import terminal_manager
+from .core.metrics import registry, APP_STARTUP_SECONDS
+
+logger = get_logger(__name__)
+
+# 日志写入后台线程，在其他初始化之前配置
+setup_logging()
 
-# 初始化数据库
-init_db()
+def _after_startup():
+    """启动完成后在后台执行的工作：标记超时的会话记录并清除失效的 pid，导入第一次登录或查看系统信息才用到的模块"""
+    updated = terminal_manager.expire_persisted_sessions()
+    if updated:
+        logger.info("Updated %d persisted sessions (timed out or stale pid)", updated)
+    try:
+        import jose.jwt  # noqa: F401
+        import psutil  # noqa: F401
+    except Exception as e:
+        logger.warning("Error prewarming imports: %s", e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """启动时初始化数据库和后台任务，各阶段耗时记录在 app_startup_seconds 指标中"""
+    phases = {"import": time.perf_counter() - _import_started}
+    
+    started = time.perf_counter()
+    init_db()
+    user_store.seed_default_users()
+    phases["init_db"] = time.perf_counter() - started
+    
+    # 先加载配置（会话超时），再核对上一个进程遗留的会话
+    started = time.perf_counter()
+    terminal.apply_config()
+    reconciled = terminal_manager.reconcile_persisted_sessions()
+    phases["reconcile"] = time.perf_counter() - started
+    
+    # 启动输出全文索引，以及已结束会话的归档和数据库压缩任务
+    started = time.perf_counter()
+    output_indexer.start()
+    retention_job.start()
+    phases["services"] = time.perf_counter() - started
+    
+    for phase, seconds in phases.items():
+        APP_STARTUP_SECONDS.labels(phase=phase).set(seconds)
+    logger.info(
+        "Startup finished in %.0f ms (%s); %d sessions restorable, %d timed out",
+        sum(phases.values()) * 1000,
+        ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in phases.items()),
+        reconciled["restorable"], reconciled["expired"]
+    )
+    threading.Thread(target=_after_startup, daemon=True).start()
+    yield
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 # CORS 配置
@@ -27,6 +86,7 @@ app.include_router(auth.router, prefix=f"{settings.API_V1_STR}/auth", tags=["aut
 app.include_router(terminal.router, prefix=f"{settings.API_V1_STR}/terminal", tags=["terminal"])
 app.include_router(system.router, prefix=f"{settings.API_V1_STR}/system", tags=["system"])
 app.include_router(config.router, prefix=f"{settings.API_V1_STR}/config", tags=["config"])
+app.include_router(debug.router, prefix=f"{settings.API_V1_STR}/debug", tags=["debug"])
 
 @app.get("/")
 async def root():
@@ -38,3 +98,8 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 格式的运行指标"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
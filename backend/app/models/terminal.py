@@ -0,0 +1,30 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+# 一次批量操作最多包含的会话数
+MAX_BATCH_SIZE = 100
+
+class SessionSpec(BaseModel):
+    session_id: str = Field(..., min_length=1)
+    name: str = "终端"
+    cols: int = Field(80, ge=1, le=1000)
+    rows: int = Field(24, ge=1, le=1000)
+    cwd: Optional[str] = None
+
+class BatchCreateRequest(BaseModel):
+    sessions: List[SessionSpec] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+class BatchCloseRequest(BaseModel):
+    session_ids: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+class SessionSize(BaseModel):
+    session_id: str
+    cols: int = Field(..., ge=1, le=1000)
+    rows: int = Field(..., ge=1, le=1000)
+
+class BatchResizeRequest(BaseModel):
+    sessions: List[SessionSize] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+
+class BatchInputRequest(BaseModel):
+    session_ids: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_SIZE)
+    data: str = Field(..., max_length=64 * 1024)
@@ -0,0 +1,120 @@
+import asyncio
+import json
+from typing import Dict, Optional
+from fastapi import WebSocket
+from ..core.metrics import OBSERVERS, BROADCAST_FRAMES
+from .terminal import terminal_manager, TerminalSession, OUTPUT_QUANTUM
+
+# 每个观察者最多积压的帧数，超过时断开该观察者（可带偏移重连续传）
+OBSERVER_QUEUE_FRAMES = 64
+
+class Observer:
+    """一个只读观察者连接"""
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=OBSERVER_QUEUE_FRAMES)
+        self.closed = asyncio.Event()
+        self.close_code = 1000
+
+    def close(self, code: int):
+        if not self.closed.is_set():
+            self.close_code = code
+            self.closed.set()
+
+    async def write_frames(self):
+        """依次发送广播帧，发送失败时结束"""
+        try:
+            while True:
+                frame = await self.queue.get()
+                await self.websocket.send_bytes(frame)
+        except Exception:
+            self.close(1000)
+
+class _SessionBroadcast:
+    """一个会话的所有观察者，共用一个读取位置和发送任务"""
+
+    def __init__(self, session: TerminalSession):
+        self.session = session
+        self.observers = set()
+        self.index: Optional[int] = None  # 已广播到的输出索引
+        self.task: Optional[asyncio.Task] = None
+
+    async def run(self):
+        """读取新输出，每帧只序列化一次，同一份字节放入所有观察者的队列"""
+        session = self.session
+        while self.observers and session.running:
+            output, self.index, end_offset = session.get_output_after(self.index, OUTPUT_QUANTUM)
+            if output:
+                frame = json.dumps(
+                    {"type": "output", "data": output, "offset": end_offset},
+                    ensure_ascii=False, separators=(",", ":")
+                ).encode("utf-8")
+                BROADCAST_FRAMES.inc()
+                for observer in list(self.observers):
+                    try:
+                        observer.queue.put_nowait(frame)
+                    except asyncio.QueueFull:
+                        # 观察者跟不上输出，断开它而不是拖慢其他观察者
+                        observer.close(1013)
+                # 让出事件循环，让观察者的发送任务写出这一帧
+                await asyncio.sleep(0)
+                continue
+
+            if terminal_manager.scheduler.is_interactive(session.session_id):
+                await asyncio.sleep(0.005)
+            else:
+                await asyncio.sleep(0.02)
+
+        # 会话已结束
+        for observer in list(self.observers):
+            observer.close(1000)
+
+class ObserverHub:
+    """管理所有会话的只读观察者
+
+    观察者不加入会话的 connected_clients，不能输入，也不影响会话的客户端计数。
+    每个被观察的会话只有一个广播任务：输出帧编码一次，以二进制帧发送给所有观察者，
+    服务端开销与观察者数量基本无关（只剩每个连接的写入）。
+    """
+
+    def __init__(self):
+        self.broadcasts: Dict[str, _SessionBroadcast] = {}
+        OBSERVERS.set_function(
+            lambda: sum(len(broadcast.observers) for broadcast in list(self.broadcasts.values()))
+        )
+
+    def attach(self, session: TerminalSession, observer: Observer,
+               offset: Optional[int] = None, epoch: Optional[str] = None) -> dict:
+        """添加观察者，返回需要先发给它的消息（快照或续传）"""
+        broadcast = self.broadcasts.get(session.session_id)
+        if broadcast is None or broadcast.session is not session:
+            broadcast = _SessionBroadcast(session)
+            self.broadcasts[session.session_id] = broadcast
+
+        data, data_offset, resumed, broadcast.index = session.add_observer(broadcast.index, offset, epoch)
+        broadcast.observers.add(observer)
+        if broadcast.task is None or broadcast.task.done():
+            broadcast.task = asyncio.create_task(broadcast.run())
+
+        return {
+            "type": "resume" if resumed else "reconnect",
+            "data": data,
+            "offset": data_offset,
+            "epoch": session.epoch,
+            "observers": len(broadcast.observers),
+        }
+
+    def detach(self, session: TerminalSession, observer: Observer):
+        broadcast = self.broadcasts.get(session.session_id)
+        if broadcast is None or observer not in broadcast.observers:
+            return
+        broadcast.observers.discard(observer)
+        session.remove_observer()
+        if not broadcast.observers:
+            # 最后一个观察者离开，广播任务随之结束
+            self.broadcasts.pop(session.session_id, None)
+            if broadcast.task:
+                broadcast.task.cancel()
+
+observer_hub = ObserverHub()
@@ -0,0 +1,63 @@
+import json
+import struct
+import zlib
+from typing import Optional, Union
+from ..core.metrics import WS_COMPRESSION_BYTES
+
+# 压缩级别：终端输出重复度高，中等级别已能得到大部分收益且延迟低
+COMPRESS_LEVEL = 5
+# 压缩窗口（raw deflate，32KB），跨帧保留上下文
+COMPRESS_WBITS = -15
+# 小于该字节数的消息（按键回显、心跳等）不压缩，直接以文本帧发送
+COMPRESS_MIN_BYTES = 512
+
+class CompressionStats:
+    """单个客户端的压缩统计"""
+
+    def __init__(self):
+        self.raw_bytes = 0  # 压缩前的 JSON 字节数
+        self.sent_bytes = 0  # 实际发送的字节数
+        self.compressed_frames = 0
+        self.plain_frames = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "raw_bytes": self.raw_bytes,
+            "sent_bytes": self.sent_bytes,
+            "saved_bytes": self.raw_bytes - self.sent_bytes,
+            "compressed_frames": self.compressed_frames,
+            "plain_frames": self.plain_frames,
+        }
+
+class OutputCompressor:
+    """一个 WebSocket 连接的输出压缩
+
+    整个连接共用一个 deflate 上下文，后面的帧可以引用前面帧中的重复内容。
+    较大的消息压缩后以二进制帧发送：4 字节大端序的原始长度 + 以同步刷新结尾的 raw deflate 数据，
+    客户端用一个持续的解压流依次解压；较小的消息不经过压缩上下文，直接以文本帧发送。
+    """
+
+    def __init__(self, level: int = COMPRESS_LEVEL):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, COMPRESS_WBITS)
+
+    def encode(self, message: dict, stats: Optional[CompressionStats] = None) -> Union[str, bytes]:
+        """编码一条消息，返回文本帧内容（str）或二进制帧内容（bytes）"""
+        text = json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+        data = text.encode("utf-8")
+        if len(data) < COMPRESS_MIN_BYTES:
+            frame = text
+            sent = len(data)
+        else:
+            frame = struct.pack(">I", len(data)) + self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+            sent = len(frame)
+
+        WS_COMPRESSION_BYTES.labels(kind="raw").inc(len(data))
+        WS_COMPRESSION_BYTES.labels(kind="sent").inc(sent)
+        if stats:
+            stats.raw_bytes += len(data)
+            stats.sent_bytes += sent
+            if isinstance(frame, bytes):
+                stats.compressed_frames += 1
+            else:
+                stats.plain_frames += 1
+        return frame
@@ -0,0 +1,88 @@
+import threading
+from collections import deque
+from typing import Dict, Optional
+from ..core.metrics import registry
+
+# 回显延迟的各个阶段
+STAGES = (
+    "receive_to_write",  # 收到输入消息 → 写入 PTY
+    "write_to_read",  # 写入 PTY → 调度线程读到回显（含等待调度的时间）
+    "read_to_send",  # 读到回显 → 发送第一帧输出（含发送循环轮询和发送耗时）
+    "server_total",  # 收到输入消息 → 发送第一帧输出
+    "client_rtt",  # 客户端上报的按键到回显的往返时间
+)
+
+ECHO_LATENCY_SECONDS = registry.histogram(
+    "terminal_echo_latency_seconds", "Keystroke echo latency by stage", ("stage",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.5),
+)
+
+def _percentile(sorted_samples: list, percent: float) -> float:
+    index = min(int(round(percent / 100 * (len(sorted_samples) - 1))), len(sorted_samples) - 1)
+    return sorted_samples[index]
+
+def _summarize(samples) -> dict:
+    ordered = sorted(samples)
+    if not ordered:
+        return {"count": 0}
+    return {
+        "count": len(ordered),
+        "p50": _percentile(ordered, 50),
+        "p90": _percentile(ordered, 90),
+        "p99": _percentile(ordered, 99),
+        "max": ordered[-1],
+    }
+
+class LatencyTracker:
+    """按会话和全局聚合回显延迟，保留每个阶段最近的样本用于计算分位数"""
+
+    def __init__(self, max_samples: int = 1000):
+        self.max_samples = max_samples
+        self.global_samples: Dict[str, deque] = {stage: deque(maxlen=max_samples) for stage in STAGES}
+        self.session_samples: Dict[str, Dict[str, deque]] = {}
+        self.lock = threading.Lock()
+        self.stage_metrics = {stage: ECHO_LATENCY_SECONDS.labels(stage=stage) for stage in STAGES}
+
+    def record(self, session_id: str, stage: str, seconds: float):
+        """记录一个阶段的耗时（秒）"""
+        if stage not in self.global_samples:
+            return
+        seconds = max(seconds, 0.0)
+        self.stage_metrics[stage].observe(seconds)
+        with self.lock:
+            self.global_samples[stage].append(seconds)
+            samples = self.session_samples.get(session_id)
+            if samples is None:
+                samples = {name: deque(maxlen=self.max_samples) for name in STAGES}
+                self.session_samples[session_id] = samples
+            samples[stage].append(seconds)
+
+    def record_echo(self, session_id: str, received_at: float, written_at: float, available_at: float, sent_at: float):
+        """记录一次完整的回显链路"""
+        self.record(session_id, "receive_to_write", written_at - received_at)
+        self.record(session_id, "write_to_read", available_at - written_at)
+        self.record(session_id, "read_to_send", sent_at - available_at)
+        self.record(session_id, "server_total", sent_at - received_at)
+
+    def remove_session(self, session_id: str):
+        with self.lock:
+            self.session_samples.pop(session_id, None)
+
+    def summary(self, session_ids: Optional[list] = None) -> dict:
+        """返回全局和指定会话各阶段的分位数（秒）"""
+        with self.lock:
+            global_copy = {stage: list(samples) for stage, samples in self.global_samples.items()}
+            sessions_copy = {
+                session_id: {stage: list(samples) for stage, samples in stages.items()}
+                for session_id, stages in self.session_samples.items()
+                if session_ids is None or session_id in session_ids
+            }
+        return {
+            "global": {stage: _summarize(samples) for stage, samples in global_copy.items()},
+            "sessions": {
+                session_id: {stage: _summarize(samples) for stage, samples in stages.items()}
+                for session_id, stages in sessions_copy.items()
+            },
+        }
+
+latency_tracker = LatencyTracker()
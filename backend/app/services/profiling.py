@@ -0,0 +1,104 @@
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+def sample_stacks(duration: float, interval: float) -> Counter:
+    """对所有线程（包括事件循环和会话读取线程）采样调用栈
+
+    返回 {折叠后的调用栈: 采样次数}，格式与 flamegraph.pl / speedscope 的 collapsed 格式一致。
+    """
+    own_ident = threading.get_ident()
+    stacks = Counter()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            stacks[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return stacks
+
+def format_collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+def tracemalloc_diff(duration: float, limit: int, group_by: str = "lineno", frames: int = 10) -> dict:
+    """在 duration 秒前后各取一次 tracemalloc 快照并比较
+
+    如果 tracemalloc 原本未开启，则临时开启并在结束后关闭。
+    """
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(frames)
+    try:
+        before = tracemalloc.take_snapshot()
+        time.sleep(duration)
+        after = tracemalloc.take_snapshot()
+        traced_current, traced_peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+
+    stats = after.compare_to(before, group_by)
+    return {
+        "duration_seconds": duration,
+        "group_by": group_by,
+        "traced_current_bytes": traced_current,
+        "traced_peak_bytes": traced_peak,
+        "top": [
+            {
+                "location": str(stat.traceback),
+                "size_bytes": stat.size,
+                "size_diff_bytes": stat.size_diff,
+                "count": stat.count,
+                "count_diff": stat.count_diff,
+            }
+            for stat in stats[:limit]
+        ],
+    }
+
+def session_memory_usage(session) -> dict:
+    """估算单个会话的内存占用（字节）
+
+    buffer 与 output_history 引用同一批字符串，共享的字符串只计入 buffer。
+    """
+    with session.lock:
+        buffer_ids = {id(chunk) for chunk in session.buffer}
+        buffer_bytes = sys.getsizeof(session.buffer) + sum(sys.getsizeof(chunk) for chunk in session.buffer)
+        history_bytes = sys.getsizeof(session.output_history)
+        for item in session.output_history:
+            history_bytes += sys.getsizeof(item)
+            for key, value in item.items():
+                if key != "data" or id(value) not in buffer_ids:
+                    history_bytes += sys.getsizeof(value)
+        clients = len(session.connected_clients)
+        clients_bytes = sys.getsizeof(session.connected_clients) + sum(
+            sys.getsizeof(client_id) + sys.getsizeof(index)
+            for client_id, index in session.connected_clients.items()
+        )
+        chunks = len(session.buffer)
+        history_items = len(session.output_history)
+    pending_input_bytes = sys.getsizeof(session.pending_input)
+
+    return {
+        "session_id": session.session_id,
+        "username": session.username,
+        "buffer_chunks": chunks,
+        "buffer_bytes": buffer_bytes,
+        "output_history_items": history_items,
+        "output_history_bytes": history_bytes,
+        "clients": clients,
+        "client_state_bytes": clients_bytes,
+        "pending_input_bytes": pending_input_bytes,
+        "spilled_bytes": session.spilled_bytes(),
+        "total_bytes": buffer_bytes + history_bytes + clients_bytes + pending_input_bytes,
+    }
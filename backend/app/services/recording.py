@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import queue
+import struct
+import threading
+import time
+from typing import Optional
+from ..core.config import settings
+from ..core.logger import get_logger
+
+# 关键帧索引记录：(相对时间, 录制文件字节位置, 输出偏移)，定长便于二分查找
+KEYFRAME_STRUCT = struct.Struct("<dQQ")
+KEYFRAME_INTERVAL = 5.0  # 秒
+KEYFRAME_BYTES = 256 * 1024  # 两个关键帧之间最多写入的字节数
+
+logger = get_logger(__name__)
+
+def get_recording_paths(session_id: str) -> tuple[str, str]:
+    """返回会话录制文件和关键帧索引文件的路径"""
+    # 会话 ID 由客户端指定，用其哈希作为文件名：不含路径字符，不同 ID 也不会映射到同一个文件
+    base = os.path.join(settings.RECORDINGS_DIR, hashlib.sha256(session_id.encode()).hexdigest())
+    return f"{base}.cast", f"{base}.idx"
+
+class SessionRecorder:
+    """单个会话的 asciicast v2 录制
+
+    read 路径只调用 record_output/record_resize 把事件放入写入队列，
+    文件写入、刷新和关键帧索引都在 RecordingWriter 线程中完成。
+    """
+
+    def __init__(self, session_id: str, cols: int, rows: int):
+        self.session_id = session_id
+        self.cast_path, self.index_path = get_recording_paths(session_id)
+        self.cols = cols
+        self.rows = rows
+        self.started_at = time.time()
+        # 以下字段只由写入线程访问
+        self.cast_file = None
+        self.index_file = None
+        self.position = 0
+        self.last_keyframe_time = None
+        self.last_keyframe_position = 0
+        self.closed = False
+
+    def record_output(self, data: str, offset: int):
+        """记录一段输出，offset 为该段输出的起始偏移"""
+        recording_writer.submit((self, "o", time.time(), data, offset))
+
+    def record_resize(self, cols: int, rows: int, offset: int):
+        """记录终端尺寸变化"""
+        recording_writer.submit((self, "r", time.time(), f"{cols}x{rows}", offset))
+
+    def stop(self):
+        """停止录制，写入线程会刷新并关闭文件"""
+        recording_writer.submit((self, "close", time.time(), None, 0))
+
+    def _open(self):
+        """打开录制文件，已有录制时继续追加（写入线程调用）"""
+        os.makedirs(os.path.dirname(self.cast_path) or ".", exist_ok=True)
+        header = read_recording_header(self.cast_path)
+        if header and header.get("session_id") != self.session_id:
+            # 不属于这个会话的文件，整体覆盖
+            header = None
+        if header:
+            # 沿用已有录制的起始时间，保证时间轴连续
+            self.started_at = header.get("timestamp", self.started_at)
+        mode = "ab" if header else "wb"
+        self.cast_file = open(self.cast_path, mode, buffering=64 * 1024)
+        self.index_file = open(self.index_path, mode, buffering=4 * 1024)
+        self.position = self.cast_file.tell()
+        if not header:
+            self._write_line({
+                "version": 2,
+                "width": self.cols,
+                "height": self.rows,
+                "timestamp": self.started_at,
+                "env": {"TERM": "xterm-256color"},
+                "session_id": self.session_id
+            })
+
+    def _write_line(self, value):
+        line = (json.dumps(value, ensure_ascii=False) + "\n").encode("utf-8")
+        self.cast_file.write(line)
+        self.position += len(line)
+
+    def _write_event(self, kind: str, timestamp: float, data: str, offset: int):
+        """写入一个事件，必要时先写入关键帧（写入线程调用）"""
+        if self.closed:
+            # 停止录制后才提交的事件（读取线程已取出旧的录制对象），不再重新打开文件
+            return
+        if self.cast_file is None:
+            self._open()
+
+        elapsed = max(timestamp - self.started_at, 0.0)
+        if (self.last_keyframe_time is None
+                or elapsed - self.last_keyframe_time >= KEYFRAME_INTERVAL
+                or self.position - self.last_keyframe_position >= KEYFRAME_BYTES):
+            self.index_file.write(KEYFRAME_STRUCT.pack(elapsed, self.position, offset))
+            self.last_keyframe_time = elapsed
+            self.last_keyframe_position = self.position
+
+        self._write_line([round(elapsed, 6), kind, data])
+
+    def _flush(self):
+        if self.cast_file:
+            self.cast_file.flush()
+            self.index_file.flush()
+
+    def _close(self):
+        self.closed = True
+        if self.cast_file:
+            self.cast_file.close()
+            self.index_file.close()
+            self.cast_file = None
+            self.index_file = None
+
+class RecordingWriter:
+    """所有会话共用的录制写入线程，带缓冲写入并定期刷新到磁盘"""
+
+    def __init__(self, flush_interval: float = 1.0, max_queue_size: int = 100000):
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.dropped = 0  # 队列已满时丢弃的事件数
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, event: tuple):
+        """提交录制事件（不阻塞）"""
+        if not self.thread:
+            self._start()
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self.lock:
+            if not self.thread:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        dirty = set()
+        last_flush = time.time()
+        while True:
+            try:
+                recorder, kind, timestamp, data, offset = self.queue.get(timeout=self.flush_interval)
+                if kind == "close":
+                    recorder._close()
+                    dirty.discard(recorder)
+                else:
+                    recorder._write_event(kind, timestamp, data, offset)
+                    dirty.add(recorder)
+            except queue.Empty:
+                pass
+            except Exception as e:
+                logger.error("Error writing recording: %s", e)
+
+            if dirty and time.time() - last_flush >= self.flush_interval:
+                for recorder in dirty:
+                    try:
+                        recorder._flush()
+                    except Exception as e:
+                        logger.error("Error flushing recording: %s", e, extra={"session_id": recorder.session_id})
+                dirty.clear()
+                last_flush = time.time()
+
+recording_writer = RecordingWriter()
+
+def read_recording_header(cast_path: str) -> Optional[dict]:
+    """读取录制文件头"""
+    if not os.path.exists(cast_path):
+        return None
+    with open(cast_path, "rb") as f:
+        line = f.readline()
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+def find_keyframe(index_path: str, seek_time: float) -> tuple[float, int, int]:
+    """在关键帧索引中二分查找不晚于 seek_time 的最后一个关键帧
+
+    返回 (相对时间, 录制文件字节位置, 输出偏移)，没有合适的关键帧时返回 (0, 0, 0)。
+    """
+    if not os.path.exists(index_path):
+        return 0.0, 0, 0
+
+    record_size = KEYFRAME_STRUCT.size
+    with open(index_path, "rb") as f:
+        count = os.fstat(f.fileno()).st_size // record_size
+        low, high = 0, count
+        found = (0.0, 0, 0)
+        while low < high:
+            mid = (low + high) // 2
+            f.seek(mid * record_size)
+            keyframe = KEYFRAME_STRUCT.unpack(f.read(record_size))
+            if keyframe[0] <= seek_time:
+                found = keyframe
+                low = mid + 1
+            else:
+                high = mid
+    return found
+
+def iter_recording(session_id: str, position: int = 0, chunk_size: int = 64 * 1024):
+    """从关键帧所在的文件位置开始读取录制内容，先输出文件头，再输出事件"""
+    cast_path, _ = get_recording_paths(session_id)
+
+    with open(cast_path, "rb") as f:
+        header = f.readline()
+        yield header
+        f.seek(max(position, len(header)))
+        pending = b""
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                break
+            # 只输出完整的行，正在写入的最后一行留到下次读取
+            data = pending + data
+            cut = data.rfind(b"\n") + 1
+            pending = data[cut:]
+            if cut:
+                yield data[:cut]
@@ -0,0 +1,291 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Optional
+from sqlalchemy import text
+from ..db.database import SessionLocal, engine
+from ..db.models import TerminalSessionDB, TerminalOutputChunkDB
+from ..core.config import settings
+from ..core.logger import get_logger
+from ..core.metrics import DB_SIZE_BYTES, SESSIONS_ARCHIVED
+from .search import output_indexer, FTS_TABLE
+from .terminal import terminal_manager
+
+logger = get_logger(__name__)
+
+# 两次清理之间的间隔（秒），以及启动后第一次清理前的等待时间
+RETENTION_INTERVAL = 3600.0
+RETENTION_START_DELAY = 60.0
+# 每次清理最多归档的会话数，其余留到下一次
+RETENTION_MAX_SESSIONS = 200
+# 每个事务最多删除的输出分块数（每块最大 64KB）
+CHUNK_DELETE_BATCH = 100
+# 每个事务最多删除的全文索引行数，删除索引行需要逐个移除其中的词条，代价与内容长度成正比
+FTS_DELETE_BATCH = 8
+# 每次增量 VACUUM 释放的页数，以及每次清理最多执行的步数
+VACUUM_STEP_PAGES = 256
+VACUUM_MAX_STEPS = 400
+# 每个写事务之后让出的时间（秒），前台写入不会被连续的清理事务挡住
+STEP_PAUSE = 0.05
+
+def get_archive_paths(session_id: str) -> tuple[str, str]:
+    """返回会话归档文件（gzip 压缩的输出）和元数据文件的路径"""
+    # 会话 ID 由客户端指定，用其哈希作为文件名：不含路径字符，不同 ID 也不会映射到同一个文件
+    base = os.path.join(settings.ARCHIVE_DIR, hashlib.sha256(session_id.encode()).hexdigest())
+    return f"{base}.log.gz", f"{base}.json"
+
+def load_archive_metadata(session_id: str) -> Optional[dict]:
+    """读取会话归档的元数据，不存在时返回 None"""
+    _, meta_path = get_archive_paths(session_id)
+    try:
+        with open(meta_path) as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return metadata if metadata.get("session_id") == session_id else None
+
+def _db_path() -> str:
+    return engine.url.database
+
+def _file_size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+DB_SIZE_BYTES.labels(kind="file").set_function(lambda: _file_size(_db_path()))
+DB_SIZE_BYTES.labels(kind="wal").set_function(lambda: _file_size(_db_path() + "-wal"))
+
+class RetentionJob:
+    """后台清理已结束的会话
+
+    不活跃时间超过 archive_after_days 的已结束会话：输出写入压缩归档文件，
+    随后删除会话记录、全文索引和输出分块。之后以增量 VACUUM 分步归还空闲页，
+    并执行 PRAGMA optimize。所有写操作都拆成短事务，事务之间让出时间，不会长时间阻塞前台写入。
+    """
+
+    def __init__(self):
+        self.archive_after_days = 30  # 0 表示不归档
+        self.thread = None
+        self.lock = threading.Lock()  # 同一时间只运行一次清理
+        self.swept = False  # 是否已清理过上次进程遗留的孤立分块和索引行
+        self.last_result: Optional[dict] = None
+        self.vacuum_notice = False  # 是否已提示过数据库未开启增量 VACUUM
+
+    def configure(self, archive_after_days: int = None):
+        if archive_after_days is not None:
+            self.archive_after_days = archive_after_days
+
+    def start(self):
+        if not self.thread:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        time.sleep(RETENTION_START_DELAY)
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.exception("Error running retention job: %s", e)
+            time.sleep(RETENTION_INTERVAL)
+
+    def run_once(self) -> dict:
+        """执行一次归档和压缩，返回统计结果"""
+        with self.lock:
+            started = time.time()
+            result = {"archived": 0, "archived_bytes": 0, "deleted_chunks": 0, "vacuumed_pages": 0}
+            # 超时但仍标记为活跃的会话先标记为已结束，之后才会被归档
+            terminal_manager.expire_persisted_sessions()
+            if self.archive_after_days > 0:
+                cutoff = started - self.archive_after_days * 86400
+                for session_id in self._find_expired(cutoff):
+                    archived_bytes, deleted_chunks = self._archive_session(session_id, cutoff)
+                    if archived_bytes is not None:
+                        result["archived"] += 1
+                        result["archived_bytes"] += archived_bytes
+                        result["deleted_chunks"] += deleted_chunks
+            if not self.swept:
+                result["deleted_chunks"] += self._sweep_orphans()
+                self.swept = True
+            result["vacuumed_pages"] = self._compact()
+            result["seconds"] = time.time() - started
+            self.last_result = result
+            if result["archived"] or result["vacuumed_pages"]:
+                logger.info(
+                    "Retention archived %d sessions (%d bytes), deleted %d chunks, vacuumed %d pages",
+                    result["archived"], result["archived_bytes"], result["deleted_chunks"], result["vacuumed_pages"]
+                )
+            return result
+
+    def _find_expired(self, cutoff: float) -> list:
+        db = SessionLocal()
+        try:
+            rows = db.query(TerminalSessionDB.id).filter(
+                TerminalSessionDB.is_active == False,
+                TerminalSessionDB.last_activity < cutoff
+            ).limit(RETENTION_MAX_SESSIONS).all()
+        finally:
+            db.close()
+        # 内存中仍有对象的会话（例如刚被重新创建）不处理
+        return [row.id for row in rows if row.id not in terminal_manager.sessions]
+
+    def _archive_session(self, session_id: str, cutoff: float) -> tuple:
+        """归档单个会话，返回 (归档的字节数, 删除的分块数)；会话已不满足条件时返回 (None, 0)"""
+        db = SessionLocal()
+        try:
+            session_db = db.query(TerminalSessionDB).filter(TerminalSessionDB.id == session_id).first()
+            if not session_db:
+                return None, 0
+            metadata = {
+                "session_id": session_db.id,
+                "username": session_db.username,
+                "name": session_db.name,
+                "cwd": session_db.cwd,
+                "created_at": session_db.created_at,
+                "last_activity": session_db.last_activity,
+            }
+        finally:
+            db.close()
+
+        start, end = terminal_manager.get_scrollback_range(session_id)
+        data_path, meta_path = get_archive_paths(session_id)
+        os.makedirs(settings.ARCHIVE_DIR, exist_ok=True)
+        # 先写临时文件再改名，进程中途退出不会留下不完整的归档
+        with gzip.open(data_path + ".tmp", "wb") as f:
+            for data in terminal_manager.iter_scrollback(session_id, start, end):
+                f.write(data)
+        metadata.update({
+            "start_offset": start,
+            "end_offset": end,
+            "archived_at": time.time(),
+            "compressed_bytes": _file_size(data_path + ".tmp"),
+        })
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(metadata, f, ensure_ascii=False)
+        os.replace(data_path + ".tmp", data_path)
+        os.replace(meta_path + ".tmp", meta_path)
+
+        # 先删除会话记录，之后即使中断也不会再次归档同一会话，遗留的索引和分块在下次启动时清理
+        db = SessionLocal()
+        try:
+            deleted = db.query(TerminalSessionDB).filter(
+                TerminalSessionDB.id == session_id,
+                TerminalSessionDB.is_active == False,
+                TerminalSessionDB.last_activity < cutoff
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+        if not deleted:
+            # 归档期间会话被重新使用，保留数据库中的数据
+            os.remove(data_path)
+            os.remove(meta_path)
+            return None, 0
+
+        SESSIONS_ARCHIVED.inc()
+        time.sleep(STEP_PAUSE)
+        if output_indexer.enabled:
+            self._delete_index_rows(f"SELECT rowid FROM {FTS_TABLE} WHERE session_id = :session_id", {"session_id": session_id})
+        return end - start, self._delete_chunks(session_id)
+
+    def _delete_index_rows(self, query: str, params: dict = None) -> int:
+        """分批删除全文索引行
+
+        session_id 在索引表中不建索引，按它删除要在写事务中扫描整张表；
+        先在读事务中查出 rowid（WAL 模式下不阻塞写入），写事务只按 rowid 删除。
+        """
+        db = SessionLocal()
+        try:
+            rowids = [row[0] for row in db.execute(text(query), params or {})]
+        finally:
+            db.close()
+
+        for index in range(0, len(rowids), FTS_DELETE_BATCH):
+            db = SessionLocal()
+            try:
+                db.execute(
+                    text(f"DELETE FROM {FTS_TABLE} WHERE rowid = :rowid"),
+                    [{"rowid": rowid} for rowid in rowids[index:index + FTS_DELETE_BATCH]]
+                )
+                db.commit()
+            finally:
+                db.close()
+            time.sleep(STEP_PAUSE)
+        return len(rowids)
+
+    def _delete_chunks(self, session_id: str) -> int:
+        """分批删除会话的输出分块，某一批不满时结束（不会追着新写入的分块一直删下去）"""
+        deleted = 0
+        while True:
+            db = SessionLocal()
+            try:
+                ids = [row.id for row in db.query(TerminalOutputChunkDB.id).filter(
+                    TerminalOutputChunkDB.session_id == session_id
+                ).limit(CHUNK_DELETE_BATCH).all()]
+                if ids:
+                    db.query(TerminalOutputChunkDB).filter(
+                        TerminalOutputChunkDB.id.in_(ids)
+                    ).delete(synchronize_session=False)
+                    db.commit()
+            finally:
+                db.close()
+            deleted += len(ids)
+            if len(ids) < CHUNK_DELETE_BATCH:
+                return deleted
+            time.sleep(STEP_PAUSE)
+
+    def _sweep_orphans(self) -> int:
+        """删除没有会话记录的输出分块和索引行（上次进程在删除途中退出时遗留），返回删除的分块数"""
+        db = SessionLocal()
+        try:
+            orphans = [row.session_id for row in db.query(TerminalOutputChunkDB.session_id).filter(
+                ~TerminalOutputChunkDB.session_id.in_(db.query(TerminalSessionDB.id))
+            ).distinct().all()]
+        finally:
+            db.close()
+        if output_indexer.enabled:
+            self._delete_index_rows(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE session_id NOT IN (SELECT id FROM terminal_sessions)"
+            )
+        return sum(
+            self._delete_chunks(session_id) for session_id in orphans
+            if session_id not in terminal_manager.sessions
+        )
+
+    def _compact(self) -> int:
+        """分步执行增量 VACUUM 并更新统计信息，返回归还的页数"""
+        vacuumed = 0
+        pooled = engine.raw_connection()
+        try:
+            conn = pooled.driver_connection
+
+            def pragma(statement: str):
+                return conn.execute(f"PRAGMA {statement}").fetchone()[0]
+
+            page_size = pragma("page_size")
+            incremental = pragma("auto_vacuum") == 2
+            if not incremental and not self.vacuum_notice:
+                logger.info("Incremental vacuum is off for this database; free pages are reused but not returned. Run VACUUM once while the server is stopped to enable it")
+                self.vacuum_notice = True
+            for _ in range(VACUUM_MAX_STEPS if incremental else 0):
+                free_pages = pragma("freelist_count")
+                if not free_pages:
+                    break
+                # execute 只执行一步（只归还一页），executescript 会执行到结束
+                conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})")
+                vacuumed += free_pages - pragma("freelist_count")
+                time.sleep(STEP_PAUSE)
+            conn.execute("PRAGMA optimize")
+            DB_SIZE_BYTES.labels(kind="free").set(pragma("freelist_count") * page_size)
+            # 把 WAL 中已提交的页写回数据库文件，不等待正在进行的读写
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+        finally:
+            pooled.close()
+        return vacuumed
+
+retention_job = RetentionJob()
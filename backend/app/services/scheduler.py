@@ -0,0 +1,271 @@
+import math
+import select
+import threading
+import time
+from typing import Dict, Optional
+from ..core.metrics import READ_LOOP_SECONDS
+from ..core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# 等待 PTY 就绪（select）与处理就绪会话分开统计，空闲时的等待不会掩盖处理耗时
+READ_LOOP_WAIT_SECONDS = READ_LOOP_SECONDS.labels(phase="wait")
+READ_LOOP_WORK_SECONDS = READ_LOOP_SECONDS.labels(phase="work")
+
+# 每轮每个会话增加的读取额度（字节）
+READ_QUANTUM = 16 * 1024
+# 单次 os.read 的最大字节数
+READ_SIZE = 10 * 1024
+# 每轮等待 PTY 就绪的最长时间（秒）
+SELECT_TIMEOUT = 0.1
+# 输出速率衰减的时间常数（秒），约等于统计最近 1 秒的输出量
+RATE_WINDOW = 1.0
+# 最近输出速率低于该值（字节/秒）的会话视为交互式会话，优先读取和发送
+INTERACTIVE_RATE = 16 * 1024
+# 定期强制保存的间隔（秒）
+SAVE_INTERVAL = 5.0
+# 大流量会话两次保存之间的最短间隔（秒），交互式会话有新输出时立即保存
+BULK_SAVE_INTERVAL = 0.1
+
+class TokenBucket:
+    """字节速率限制，rate 为 0 表示不限制；桶容量为 1 秒的额度"""
+
+    def __init__(self, rate: int = 0):
+        self.rate = rate
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+
+    def set_rate(self, rate: int):
+        if rate != self.rate:
+            self.rate = rate
+            self.tokens = min(self.tokens, float(rate))
+
+    def available(self, now: float) -> float:
+        if not self.rate:
+            return math.inf
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def consume(self, amount: int):
+        if self.rate:
+            self.tokens -= amount
+
+class _SessionState:
+    __slots__ = ("deficit", "rate", "rate_updated", "bucket", "dirty", "last_append", "last_save", "finished")
+
+    def __init__(self):
+        self.deficit = 0
+        self.rate = 0.0  # 按 RATE_WINDOW 指数衰减的输出字节数
+        self.rate_updated = time.monotonic()
+        self.bucket = TokenBucket()
+        self.dirty = False  # 有尚未保存到数据库的输出
+        self.last_append = time.monotonic()  # 最近一次追加分块的时间
+        self.last_save = time.monotonic()  # 最近一次完整保存缓冲区的时间
+        self.finished = False  # PTY 已关闭，最后一次保存后不再调度
+
+class FairScheduler:
+    """所有会话共用的 PTY 读取调度器
+
+    一个线程通过 select 等待所有会话的 PTY，按差额轮询（DRR）分配读取额度：
+    每轮每个就绪会话增加 READ_QUANTUM 字节额度，读到额度用完或 PTY 暂无数据为止，
+    交互式（低流量）会话排在每轮最前面。超过会话或用户速率限制的会话本轮不读取，
+    输出积压在 PTY 中，由内核阻塞写入方。
+    数据库保存由单独的线程完成，不阻塞读取。
+    """
+
+    def __init__(self, manager):
+        self.manager = manager
+        self.states: Dict[str, _SessionState] = {}
+        self.user_buckets: Dict[str, TokenBucket] = {}
+        self.session_rate = 0  # 每个会话的输出速率上限（字节/秒），0 表示不限制
+        self.user_rate = 0  # 每个用户所有会话合计的输出速率上限（字节/秒）
+        self.rotation = 0  # 同一优先级内的起始位置，每轮轮换
+        self.lock = threading.Lock()
+        self.reader_thread: Optional[threading.Thread] = None
+        self.saver_thread: Optional[threading.Thread] = None
+
+    def configure(self, session_rate: int = None, user_rate: int = None):
+        """更新速率限制（字节/秒）"""
+        with self.lock:
+            if session_rate is not None:
+                self.session_rate = session_rate
+                for state in self.states.values():
+                    state.bucket.set_rate(session_rate)
+            if user_rate is not None:
+                self.user_rate = user_rate
+                for bucket in self.user_buckets.values():
+                    bucket.set_rate(user_rate)
+
+    def start(self):
+        """启动读取线程和保存线程（已启动时忽略）"""
+        with self.lock:
+            if self.reader_thread and self.reader_thread.is_alive():
+                return
+            self.reader_thread = threading.Thread(target=self._read_loop, daemon=True)
+            self.saver_thread = threading.Thread(target=self._save_loop, daemon=True)
+        self.reader_thread.start()
+        self.saver_thread.start()
+        logger.info("Started PTY scheduler")
+
+    def add_session(self, session_id: str):
+        state = _SessionState()
+        state.bucket.set_rate(self.session_rate)
+        with self.lock:
+            self.states[session_id] = state
+
+    def remove_session(self, session_id: str):
+        with self.lock:
+            self.states.pop(session_id, None)
+
+    def output_rate(self, session_id: str) -> float:
+        """会话最近的输出速率（字节/秒）"""
+        state = self.states.get(session_id)
+        if not state:
+            return 0.0
+        return state.rate * math.exp(-(time.monotonic() - state.rate_updated) / RATE_WINDOW) / RATE_WINDOW
+
+    def is_interactive(self, session_id: str) -> bool:
+        """最近输出量低的会话视为交互式会话"""
+        return self.output_rate(session_id) < INTERACTIVE_RATE
+
+    def _user_bucket(self, username: str) -> TokenBucket:
+        bucket = self.user_buckets.get(username)
+        if bucket is None:
+            with self.lock:
+                bucket = self.user_buckets.setdefault(username, TokenBucket(self.user_rate))
+        return bucket
+
+    def _allowance(self, session, state: _SessionState, now: float) -> float:
+        """会话当前允许读取的字节数（受会话和用户速率限制）"""
+        return min(state.bucket.available(now), self._user_bucket(session.username).available(now))
+
+    def _read_loop(self):
+        while True:
+            try:
+                self._run_round()
+            except Exception as e:
+                logger.exception("Error in PTY scheduler: %s", e)
+                time.sleep(SELECT_TIMEOUT)
+
+    def _run_round(self):
+        """执行一轮调度，收集会话和处理就绪会话计入 work，select 等待计入 wait"""
+        started = time.perf_counter()
+        now = time.monotonic()
+        readers = {}
+        writers = {}
+        throttled = False
+        for session_id, session in list(self.manager.sessions.items()):
+            state = self.states.get(session_id)
+            if not state or state.finished or not session.fd or not session.running:
+                continue
+            if session.pending_input:
+                writers[session.fd] = session
+            if self._allowance(session, state, now) >= 1:
+                readers[session.fd] = (session, state)
+            else:
+                throttled = True
+
+        if not readers and not writers:
+            # 没有可读的会话，或全部被限速，等待额度恢复
+            time.sleep(0.01 if throttled else SELECT_TIMEOUT)
+            return
+
+        waiting = time.perf_counter()
+        try:
+            # 有会话被限速时缩短等待，以便额度恢复后及时读取
+            timeout = 0.01 if throttled else SELECT_TIMEOUT
+            ready, writable, _ = select.select(list(readers), list(writers), [], timeout)
+        except (OSError, ValueError):
+            # 某个 fd 已被关闭，下一轮会重新收集
+            return
+        selected = time.perf_counter()
+        READ_LOOP_WAIT_SECONDS.observe(selected - waiting)
+
+        self._handle_ready(readers, writers, ready, writable)
+        READ_LOOP_WORK_SECONDS.observe((waiting - started) + (time.perf_counter() - selected))
+
+    def _handle_ready(self, readers: dict, writers: dict, ready: list, writable: list):
+        """写入可写会话的待写输入，并按优先级读取就绪的会话"""
+        for fd in writable:
+            session = writers[fd]
+            with session.input_lock:
+                session._flush_input()
+
+        if not ready:
+            return
+
+        # 交互式会话优先，同一优先级内每轮轮换起始位置
+        self.rotation += 1
+        ready.sort()
+        offset = self.rotation % len(ready)
+        ordered = ready[offset:] + ready[:offset]
+        ordered.sort(key=lambda fd: not self.is_interactive(readers[fd][0].session_id))
+
+        for fd in ordered:
+            session, state = readers[fd]
+            self._serve(session, state)
+
+    def _serve(self, session, state: _SessionState):
+        """按额度读取一个会话"""
+        # 被限速时额度保留到下一轮，但不超过两轮的量
+        state.deficit = min(state.deficit + READ_QUANTUM, 2 * READ_QUANTUM)
+        user_bucket = self._user_bucket(session.username)
+        while state.deficit > 0:
+            allowance = min(state.deficit, READ_SIZE, self._allowance(session, state, time.monotonic()))
+            if allowance < 1:
+                break
+            try:
+                size = session.read_available(int(allowance))
+            except OSError:
+                # PTY 已关闭（子进程退出）
+                state.finished = True
+                state.dirty = True
+                session.log.info("PTY closed")
+                return
+            if size is None:
+                # PTY 暂时没有数据，按 DRR 清空额度
+                state.deficit = 0
+                return
+
+            state.deficit -= size
+            state.bucket.consume(size)
+            user_bucket.consume(size)
+            now = time.monotonic()
+            state.rate = state.rate * math.exp(-(now - state.rate_updated) / RATE_WINDOW) + size
+            state.rate_updated = now
+            state.dirty = True
+            if size < allowance:
+                # 已读空
+                state.deficit = 0
+                return
+
+    def _save_loop(self):
+        """依次把有新输出的会话追加到分块表，另外每 SAVE_INTERVAL 秒完整保存一次缓冲区
+
+        大流量会话最多每 BULK_SAVE_INTERVAL 秒保存一次，新输出合并为更少的提交。
+        """
+        while True:
+            saved = False
+            for session_id, session in list(self.manager.sessions.items()):
+                state = self.states.get(session_id)
+                if not state:
+                    continue
+                now = time.monotonic()
+                full = now - state.last_save >= SAVE_INTERVAL or (state.finished and state.dirty)
+                if not full:
+                    if not state.dirty:
+                        continue
+                    if now - state.last_append < BULK_SAVE_INTERVAL and not self.is_interactive(session_id):
+                        continue
+                state.dirty = False
+                state.last_append = now
+                if full:
+                    state.last_save = now
+                try:
+                    session._save_buffer_to_db(include_buffer=full)
+                except Exception as e:
+                    logger.error("Error saving session: %s", e, extra={"session_id": session_id})
+                saved = True
+            if not saved:
+                time.sleep(0.01)
@@ -0,0 +1,185 @@
+import queue
+import re
+import threading
+from typing import Optional
+from sqlalchemy import text
+from ..db.database import SessionLocal, engine
+from ..core.logger import get_logger
+
+logger = get_logger(__name__)
+
+FTS_TABLE = "terminal_output_fts"
+
+# ANSI 转义序列：CSI、OSC 以及其他两字节转义
+ANSI_ESCAPE_RE = re.compile(r'\x1b\[[0-?]*[ -/]*[@-~]|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)|\x1b[@-Z\\-_]')
+# 除换行和制表符外的控制字符
+CONTROL_CHARS_RE = re.compile(r'[\x00-\x08\x0b-\x1f\x7f]')
+# 分块末尾尚未结束的转义序列（被分块边界截断）
+ANSI_PARTIAL_RE = re.compile(r'\x1b(?:\[[0-?]*[ -/]*|\][^\x07\x1b]*\x1b?)?\Z')
+# 只在分块末尾这么长的范围内查找未结束的转义序列，更长的视为异常输出不再保留
+MAX_ESCAPE_CARRY = 4096
+
+def strip_ansi(data: str) -> str:
+    """去除 ANSI 转义序列和控制字符"""
+    return CONTROL_CHARS_RE.sub('', ANSI_ESCAPE_RE.sub('', data))
+
+def split_partial_escape(data: str) -> tuple[str, str]:
+    """把末尾未结束的转义序列切出来，返回 (完整部分, 未结束部分)"""
+    match = ANSI_PARTIAL_RE.search(data, max(len(data) - MAX_ESCAPE_CARRY, 0))
+    if not match:
+        return data, ''
+    return data[:match.start()], data[match.start():]
+
+def init_search_index() -> Optional[str]:
+    """创建 FTS5 全文索引表，返回使用的分词器，SQLite 不支持 FTS5 时返回 None"""
+    # trigram 分词支持子串和中文检索，旧版本 SQLite 回退到 unicode61
+    for tokenizer in ("trigram", "unicode61"):
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                    "content, session_id UNINDEXED, username UNINDEXED, "
+                    "start_offset UNINDEXED, end_offset UNINDEXED, "
+                    f"tokenize='{tokenizer}')"
+                ))
+            return tokenizer
+        except Exception as e:
+            last_error = e
+    logger.warning("Full-text search disabled, FTS5 not available: %s", last_error)
+    return None
+
+class OutputIndexer:
+    """后台批量建立输出全文索引
+
+    持久化路径只负责把新分块放入队列，索引线程批量去除 ANSI 并写入 FTS5 表，
+    不会阻塞 PTY 读取。被分块边界截断的转义序列留到同一会话的下一个分块再去除。
+    """
+
+    def __init__(self, batch_size: int = 500, flush_interval: float = 1.0, max_queue_size: int = 10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.enabled = False
+        self.tokenizer = None
+        self.dropped = 0  # 队列已满时丢弃的分块数
+        self.thread = None
+        self.escape_carry = {}  # 会话 ID -> 上一个分块末尾未结束的转义序列（只由索引线程访问）
+
+    def start(self):
+        """初始化索引表并启动后台线程"""
+        self.tokenizer = init_search_index()
+        self.enabled = self.tokenizer is not None
+        if self.enabled and not self.thread:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def submit(self, session_id: str, username: str, chunks: list):
+        """提交待索引的输出分块（不阻塞）"""
+        if not self.enabled:
+            return
+        for chunk in chunks:
+            try:
+                self.queue.put_nowait((session_id, username, chunk['start'], chunk['end'], ''.join(chunk['parts'])))
+            except queue.Full:
+                self.dropped += 1
+
+    def _run(self):
+        """后台循环：攒批后在单个事务中写入"""
+        while True:
+            try:
+                batch = [self.queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            self._index_batch(batch)
+
+    def _index_batch(self, batch: list):
+        """将一批分块写入全文索引"""
+        rows = []
+        for session_id, username, start, end, data in batch:
+            data, carry = split_partial_escape(self.escape_carry.pop(session_id, '') + data)
+            if carry:
+                self.escape_carry[session_id] = carry
+            content = strip_ansi(data)
+            if content.strip():
+                rows.append({
+                    "content": content,
+                    "session_id": session_id,
+                    "username": username,
+                    "start_offset": start,
+                    "end_offset": end
+                })
+
+        if not rows:
+            return
+
+        db = SessionLocal()
+        try:
+            db.execute(text(
+                f"INSERT INTO {FTS_TABLE} (content, session_id, username, start_offset, end_offset) "
+                "VALUES (:content, :session_id, :username, :start_offset, :end_offset)"
+            ), rows)
+            db.commit()
+        except Exception as e:
+            logger.error("Error indexing output: %s", e)
+            db.rollback()
+        finally:
+            db.close()
+
+    def search(self, username: str, query: str, session_id: str = None, limit: int = 20) -> list:
+        """在用户自己的会话输出中检索，返回会话 ID、偏移和摘要
+
+        索引以输出分块为单位，offset/end_offset 是命中分块在原始输出中的字节范围（不是匹配文本本身的位置），
+        可直接用于按偏移分页读取历史输出，匹配文本在摘要中。
+        """
+        if not self.enabled:
+            return []
+
+        if self.tokenizer == "trigram" and len(query) < 3:
+            # trigram 无法匹配不足 3 个字符的查询，回退为子串扫描
+            sql = (
+                f"SELECT session_id, start_offset, end_offset, "
+                f"substr(content, max(instr(content, :query) - 32, 1), 64 + length(:query)) AS snippet "
+                f"FROM {FTS_TABLE} WHERE instr(content, :query) > 0 AND username = :username"
+            )
+            params = {"query": query, "username": username, "limit": limit}
+            order_by = "rowid DESC"
+        else:
+            # 按短语检索，避免用户输入被解析为 FTS5 查询语法
+            sql = (
+                f"SELECT session_id, start_offset, end_offset, "
+                f"snippet({FTS_TABLE}, 0, '[', ']', '…', 64) AS snippet "
+                f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :query AND username = :username"
+            )
+            params = {"query": '"' + query.replace('"', '""') + '"', "username": username, "limit": limit}
+            order_by = "rank"
+        if session_id:
+            sql += " AND session_id = :session_id"
+            params["session_id"] = session_id
+        sql += f" ORDER BY {order_by} LIMIT :limit"
+
+        db = SessionLocal()
+        try:
+            result = db.execute(text(sql), params)
+            return [
+                {
+                    "session_id": row.session_id,
+                    "offset": row.start_offset,
+                    "end_offset": row.end_offset,
+                    "snippet": row.snippet
+                }
+                for row in result
+            ]
+        except Exception as e:
+            logger.error("Error searching output: %s", e)
+            return []
+        finally:
+            db.close()
+
+output_indexer = OutputIndexer()
@@ -0,0 +1,97 @@
+import hashlib
+import mmap
+import os
+from array import array
+from ..core.config import settings
+
+def get_spill_path(session_id: str) -> str:
+    """返回会话溢出文件的路径"""
+    # 会话 ID 由客户端指定，用其哈希作为文件名：不含路径字符，不同 ID 也不会映射到同一个文件
+    return os.path.join(settings.SPILL_DIR, hashlib.sha256(session_id.encode()).hexdigest() + ".spill")
+
+class SpillFile:
+    """会话较早的一段缓冲区被换出到磁盘后的存储
+
+    数据块按顺序以 UTF-8 追加写入文件，内存中只保留每块的字节长度。
+    淘汰最旧的块时只移动文件内的起始位置，死数据超过一半时整体压缩。
+    读取通过 mmap 进行，数据留在页缓存中而不是进程堆上。
+    调用方需持有会话锁。
+    """
+
+    def __init__(self, session_id: str):
+        os.makedirs(settings.SPILL_DIR, exist_ok=True)
+        self.path = get_spill_path(session_id)
+        self.file = open(self.path, "w+b")
+        self.lengths = array("I")  # 每块的字节长度
+        self.head = 0  # 第一个有效块在 lengths 中的下标
+        self.head_position = 0  # 第一个有效块在文件中的位置
+        self.size = 0  # 文件末尾位置
+
+    @property
+    def count(self) -> int:
+        """有效块数"""
+        return len(self.lengths) - self.head
+
+    @property
+    def live_bytes(self) -> int:
+        return self.size - self.head_position
+
+    def append(self, chunks: list):
+        """追加一批字符串块"""
+        encoded = [chunk.encode("utf-8") for chunk in chunks]
+        self.file.seek(self.size)
+        self.file.write(b"".join(encoded))
+        self.file.flush()
+        self.lengths.extend(len(data) for data in encoded)
+        self.size += sum(len(data) for data in encoded)
+
+    def drop_oldest(self) -> int:
+        """淘汰最旧的一块，返回其字节数"""
+        length = self.lengths[self.head]
+        self.head += 1
+        self.head_position += length
+        if self.head_position > self.live_bytes:
+            self._compact()
+        return length
+
+    def _compact(self):
+        """把有效数据移到文件开头"""
+        data = self._read(self.head_position, self.size)
+        self.file.seek(0)
+        self.file.write(data)
+        self.file.truncate(len(data))
+        self.file.flush()
+        del self.lengths[:self.head]
+        self.head = 0
+        self.head_position = 0
+        self.size = len(data)
+
+    def _read(self, start: int, end: int) -> bytes:
+        if end <= start:
+            return b""
+        with mmap.mmap(self.file.fileno(), self.size, access=mmap.ACCESS_READ) as mapped:
+            return mapped[start:end]
+
+    def read_text(self) -> str:
+        """读取全部有效数据"""
+        return self._read(self.head_position, self.size).decode("utf-8", errors="ignore")
+
+    def read_chunks(self) -> list:
+        """按块读取全部有效数据"""
+        chunks = []
+        if not self.count:
+            return chunks
+        with mmap.mmap(self.file.fileno(), self.size, access=mmap.ACCESS_READ) as mapped:
+            position = self.head_position
+            for length in self.lengths[self.head:]:
+                chunks.append(mapped[position:position + length].decode("utf-8", errors="ignore"))
+                position += length
+        return chunks
+
+    def close(self):
+        """关闭并删除溢出文件"""
+        try:
+            self.file.close()
+            os.remove(self.path)
+        except OSError:
+            pass
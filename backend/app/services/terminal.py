@@ -1,7 +1,5 @@
 import os
 import pty
-import select
-import subprocess
 import struct
 import fcntl
 import termios
@@ -9,15 +7,76 @@ import signal
 from typing import Dict, Optional
 import asyncio
 import time
+import uuid
+import codecs
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func, bindparam, case, and_, or_, false
 from sqlalchemy.orm import Session
 from ..db.database import SessionLocal
-from ..db.models import TerminalSessionDB
+from ..db.models import TerminalSessionDB, TerminalOutputChunkDB
+from ..core.logger import get_logger
+from ..core.metrics import (
+    PTY_READ_BYTES, DB_SAVE_SECONDS, ACTIVE_SESSIONS, CONNECTED_CLIENTS, WS_QUEUE_DEPTH,
+    SCROLLBACK_RESIDENT_BYTES, SCROLLBACK_SPILLED_BYTES, SCROLLBACK_SPILLS
+)
+from .search import output_indexer
+from .recording import SessionRecorder
+from .latency import latency_tracker
+from .spill import SpillFile
+from .scheduler import FairScheduler
+
+logger = get_logger(__name__)
+
+# 持久化时合并相邻输出块的最大字节数
+PERSIST_CHUNK_BYTES = 64 * 1024
+
+# 待写入 PTY 的输入超过高水位时暂停接收客户端输入，降到低水位以下后恢复
+INPUT_HIGH_WATER = 256 * 1024
+INPUT_LOW_WATER = 64 * 1024
+# 待写入 PTY 的输入上限，超出时拒绝整条输入（与 uvicorn 默认的 WebSocket 消息上限相同，
+# 遵守暂停通知的客户端一次粘贴不会超过它；不理会暂停的客户端不能无限占用内存）
+INPUT_MAX_PENDING = 16 * 1024 * 1024
+# 单次写入 PTY 的最大字节数
+INPUT_WRITE_SIZE = 16 * 1024
+
+# 每次发送给客户端的最大字符数
+OUTPUT_QUANTUM = 128 * 1024
+
+# 检查全局内存预算的间隔（秒）
+MEMORY_CHECK_INTERVAL = 1.0
+
+# 批量创建会话时并行启动 shell 的线程数
+SPAWN_WORKERS = 8
+
+def _batch_result(session_id: str, error: Optional[str] = None, **fields) -> dict:
+    """批量操作中单个会话的结果"""
+    if error:
+        return {"session_id": session_id, "ok": False, "error": error}
+    return {"session_id": session_id, "ok": True, **fields}
+
+def _process_exists(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except PermissionError:
+        # 进程存在但属于其他用户
+        return True
+    except (ProcessLookupError, OverflowError):
+        return False
+    return True
+
+class SessionLimitError(Exception):
+    """超过最大并发会话数"""
+
+class InputOverflowError(Exception):
+    """待写入 PTY 的输入超过上限"""
 
 class TerminalSession:
     def __init__(self, session_id: str, username: str, name: str, buffer_size: int = 1000):
         self.session_id = session_id
         self.username = username
         self.name = name
+        self.log = logger.bind(session_id=session_id, username=username)
         self.fd = None
         self.child_pid = None
         self.running = False
@@ -28,13 +87,29 @@ class TerminalSession:
         self.rows = 24  # 默认行数
         self.cols = 80  # 默认列数
         self.connected_clients = {}  # 跟踪连接的客户端 {client_id: last_output_index}
+        self.compression_stats = {}  # 开启输出压缩的客户端的压缩统计 {client_id: CompressionStats}
+        self.observers = 0  # 只读观察者数量，观察者共用一个广播位置，不在 connected_clients 中
         self.output_history = []  # 完整的输出历史，用于新客户端连接
         self.output_index = 0  # 当前输出索引
+        self.epoch = uuid.uuid4().hex[:12]  # 会话纪元，会话重建后变化，客户端偏移仅在同一纪元内有效
+        self.output_offset = 0  # 累计输出的字节偏移（UTF-8）
+        self.buffer_start_offset = 0  # buffer 中第一块数据的起始偏移
+        self.persisted_offset = 0  # 已追加到输出分块表的偏移
+        self.recorder: Optional[SessionRecorder] = None  # 会话录制（可选）
+        self.pending_input = bytearray()  # 尚未写入 PTY 的输入
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        self.spill: Optional[SpillFile] = None  # 换出到磁盘的较早缓冲区（位于 buffer 之前）
+        self.last_viewed = time.time()  # 最近一次有客户端连接或断开的时间
         import threading
         self.lock = threading.Lock()  # 线程锁，保护共享数据
+        self.input_lock = threading.Lock()  # 保护待写入的输入
+        self.save_lock = threading.Lock()  # 串行化缓冲区保存，避免重复追加分块
+        
+    def start(self, cols: int = 80, rows: int = 24, cwd: str = None, persist: bool = True):
+        """启动终端会话
         
-    def start(self, cols: int = 80, rows: int = 24, cwd: str = None):
-        """启动终端会话"""
+        persist 为 False 时不读写数据库，由调用方（批量创建）统一恢复偏移并保存会话记录。
+        """
         self.cwd = cwd
         self.child_pid, self.fd = pty.fork()
         
@@ -55,11 +130,16 @@ class TerminalSession:
             os.environ['TERM_PROGRAM'] = 'xterm'
             os.environ['TERM_PROGRAM_VERSION'] = '1.0'
             
-            subprocess.run([os.environ.get('SHELL', '/bin/bash')])
+            # 直接替换为 shell：不再复制一次服务进程，shell 退出时子进程也不会回到服务端代码继续执行
+            shell = os.environ.get('SHELL', '/bin/bash')
+            try:
+                os.execvp(shell, [shell])
+            finally:
+                os._exit(127)
         else:
             # 父进程
-            # 先设置窗口大小
-            self.set_winsize(rows, cols)
+            # 先设置窗口大小（随后保存会话记录时一起写入数据库）
+            self.set_winsize(rows, cols, persist=False)
             
             # 配置终端属性以支持交互式应用
             try:
@@ -97,7 +177,7 @@ class TerminalSession:
                 # 应用终端属性
                 termios.tcsetattr(self.fd, termios.TCSANOW, attrs)
             except Exception as e:
-                print(f"Warning: Could not set terminal attributes: {e}")
+                self.log.warning("Could not set terminal attributes: %s", e)
             
             self.running = True
             self.last_activity = time.time()
@@ -107,10 +187,12 @@ class TerminalSession:
             fcntl.fcntl(self.fd, fcntl.F_SETFL, flag | os.O_NONBLOCK)
             
             # 保存到数据库
-            self._save_to_db()
+            if persist:
+                self._load_output_offset()
+                self._save_to_db()
     
-    def set_winsize(self, rows: int, cols: int):
-        """设置终端窗口大小"""
+    def set_winsize(self, rows: int, cols: int, persist: bool = True):
+        """设置终端窗口大小，persist 为 False 时不更新数据库中的尺寸"""
         if self.fd:
             self.rows = rows
             self.cols = cols
@@ -124,100 +206,345 @@ class TerminalSession:
                     import signal
                     os.kill(self.child_pid, signal.SIGWINCH)
                 except Exception as e:
-                    print(f"Warning: Could not send SIGWINCH: {e}")
+                    self.log.warning("Could not send SIGWINCH: %s", e)
+            
+            # 录制可能被其他线程同时停止，先取出再使用
+            recorder = self.recorder
+            if recorder:
+                recorder.record_resize(cols, rows, self.output_offset)
             
             # 更新数据库中的尺寸
-            self._update_winsize_in_db()
+            if persist:
+                self._update_winsize_in_db()
     
-    def write(self, data: str):
-        """写入数据到终端"""
-        if self.fd and self.running:
-            self.last_activity = time.time()
-            os.write(self.fd, data.encode())
-            self._update_activity()
+    def start_recording(self):
+        """开始录制会话输出"""
+        if not self.recorder:
+            self.recorder = SessionRecorder(self.session_id, self.cols, self.rows)
+    
+    def stop_recording(self):
+        """停止录制会话输出"""
+        recorder, self.recorder = self.recorder, None
+        if recorder:
+            recorder.stop()
     
-    def read(self, timeout: float = 0.01) -> str:
-        """从终端读取数据"""
+    def write(self, data: str) -> int:
+        """写入数据到终端
+        
+        先尝试直接写入，PTY 暂时写不下的部分进入待写队列，
+        由后台读取线程在 fd 可写时继续写入，不会截断输入。
+        返回仍在排队的字节数；排队的输入会超过 INPUT_MAX_PENDING 时整条丢弃并抛出 InputOverflowError。
+        """
         if not self.fd or not self.running:
-            return ""
+            return 0
+        
+        encoded = data.encode()
+        self.last_activity = time.time()
+        with self.input_lock:
+            if len(self.pending_input) + len(encoded) > INPUT_MAX_PENDING:
+                raise InputOverflowError("输入积压过多，本次输入已丢弃")
+            self.pending_input += encoded
+            self._flush_input()
+            return len(self.pending_input)
+    
+    def pending_input_size(self) -> int:
+        """待写入 PTY 的字节数"""
+        return len(self.pending_input)
+    
+    def _flush_input(self):
+        """尽可能多地写入待写队列，直到 PTY 暂时不可写（调用方需持有 input_lock）"""
+        while self.pending_input:
+            try:
+                written = os.write(self.fd, self.pending_input[:INPUT_WRITE_SIZE])
+            except BlockingIOError:
+                return
+            except OSError:
+                # 终端已关闭，丢弃剩余输入
+                self.pending_input.clear()
+                return
+            del self.pending_input[:written]
+    
+    def read_available(self, max_bytes: int) -> Optional[int]:
+        """非阻塞地读取最多 max_bytes 字节并加入缓冲区，不保存到数据库
         
+        返回读取的字节数，暂时没有数据时返回 None，PTY 已关闭时抛出 OSError。
+        """
+        if not self.running:
+            return None
         try:
-            ready, _, _ = select.select([self.fd], [], [], timeout)
-            if ready:
-                data = os.read(self.fd, 1024 * 10)
-                output = data.decode('utf-8', errors='ignore')
-                self.last_activity = time.time()
-                
-                with self.lock:
-                    # 缓存输出到 buffer（用于 get_buffer）
-                    self.buffer.append(output)
-                    if len(self.buffer) > self.max_buffer_size:
-                        self.buffer.pop(0)
-                    
-                    # 添加到输出历史（用于多客户端同步）
-                    self.output_history.append({
-                        'index': self.output_index,
-                        'data': output,
-                        'timestamp': time.time()
-                    })
-                    self.output_index += 1
-                    
-                    # 限制历史记录大小
-                    if len(self.output_history) > self.max_buffer_size:
-                        self.output_history.pop(0)
-                
-                # 异步保存到数据库
-                self._save_buffer_to_db()
-                
-                return output
-        except OSError:
-            pass
-        return ""
+            data = os.read(self.fd, max_bytes)
+        except BlockingIOError:
+            return None
+        if not data:
+            raise OSError("PTY closed")
+        
+        PTY_READ_BYTES.inc(len(data))
+        # 增量解码，多字节字符跨两次读取时不会被丢弃
+        output = self.decoder.decode(data)
+        self.last_activity = time.time()
+        if not output:
+            return len(data)
+        
+        with self.lock:
+            # 缓存输出到 buffer（用于 get_buffer）
+            self.buffer.append(output)
+            output_start = self.output_offset
+            self.output_offset += len(output.encode('utf-8'))
+            
+            # 添加到输出历史（用于多客户端同步）
+            self.output_history.append({
+                'index': self.output_index,
+                'data': output,
+                'offset': self.output_offset,  # 该块结束处的偏移
+                'timestamp': time.time()
+            })
+            self.output_index += 1
+            
+            # 限制缓冲区和历史记录大小
+            while self._buffer_length() > self.max_buffer_size:
+                self.buffer_start_offset += self._drop_oldest_chunk()
+        
+        recorder = self.recorder
+        if recorder:
+            recorder.record_output(output, output_start)
+        
+        return len(data)
     
-    def get_new_output_for_client(self, client_id: str) -> str:
-        """获取客户端未读取的输出"""
+    def get_new_output_for_client(self, client_id: str, max_chars: Optional[int] = None) -> tuple[str, int]:
+        """获取客户端未读取的输出，返回 (输出, 输出结束处的偏移)
+        
+        指定 max_chars 时达到该长度后停止（至少返回一块），其余部分留到下次发送。
+        """
         with self.lock:
             if client_id not in self.connected_clients:
-                return ""
+                return "", self.output_offset
             
-            last_index = self.connected_clients[client_id]
-            new_outputs = []
-            
-            for item in self.output_history:
-                if item['index'] > last_index:
-                    new_outputs.append(item['data'])
-                    last_index = item['index']
+            output, last_index, end_offset = self._collect_output(self.connected_clients[client_id], max_chars)
             
             # 更新客户端的最后读取索引
-            if new_outputs:
-                self.connected_clients[client_id] = last_index
+            self.connected_clients[client_id] = last_index
             
-            return ''.join(new_outputs)
+            return output, end_offset
+    
+    def get_output_after(self, index: int, max_chars: Optional[int] = None) -> tuple[str, int, int]:
+        """获取索引 index 之后的输出，返回 (输出, 最后一块的索引, 输出结束处的偏移)"""
+        with self.lock:
+            return self._collect_output(index, max_chars)
+    
+    def _collect_output(self, last_index: int, max_chars: Optional[int]) -> tuple[str, int, int]:
+        """收集索引 last_index 之后的输出（调用方需持有锁）"""
+        new_outputs = []
+        end_offset = self.output_offset
+        
+        size = 0
+        for item in self.output_history:
+            if item['index'] > last_index:
+                new_outputs.append(item['data'])
+                last_index = item['index']
+                end_offset = item['offset']
+                size += len(item['data'])
+                if max_chars is not None and size >= max_chars:
+                    break
+        
+        return ''.join(new_outputs), last_index, end_offset
     
-    def add_client(self, client_id: str) -> str:
-        """添加连接的客户端，返回历史缓冲区"""
+    def add_client(self, client_id: str, offset: Optional[int] = None, epoch: Optional[str] = None) -> tuple[str, int, bool]:
+        """添加连接的客户端
+        
+        客户端提供上次收到的偏移和会话纪元时，只返回缺失的部分；
+        偏移已被淘汰或纪元不匹配时返回完整的历史缓冲区。
+        返回 (数据, 数据结束处的偏移, 是否为增量续传)
+        """
         with self.lock:
+            # 换出到磁盘的缓冲区在有客户端连接时读回内存
+            self._page_in()
+            self.last_viewed = time.time()
+            
             # 设置客户端的起始索引为当前索引
             self.connected_clients[client_id] = self.output_index - 1
-            print(f"Client {client_id} connected to session {self.session_id}. Total clients: {len(self.connected_clients)}")
+            self.log.info("Client connected, total clients: %d", len(self.connected_clients), extra={"client_id": client_id})
+            
+            if offset is not None and epoch == self.epoch:
+                missing = self._get_output_since(offset)
+                if missing is not None:
+                    return missing, self.output_offset, True
             
             # 返回完整的历史缓冲区
-            return self.get_buffer()
+            return self.get_buffer(), self.output_offset, False
+    
+    def _get_output_since(self, offset: int) -> Optional[str]:
+        """获取从指定偏移开始的输出，偏移不在缓冲区范围内时返回 None（调用方需持有锁）"""
+        if offset < self.buffer_start_offset or offset > self.output_offset:
+            return None
+        
+        # 从尾部向前收集，断线时间短时只需访问最后几块
+        parts = []
+        position = self.output_offset
+        for chunk in reversed(self.buffer):
+            if position <= offset:
+                break
+            encoded = chunk.encode('utf-8')
+            start = position - len(encoded)
+            if start < offset:
+                parts.append(encoded[offset - start:].decode('utf-8', errors='ignore'))
+            else:
+                parts.append(chunk)
+            position = start
+        
+        return ''.join(reversed(parts))
+    
+    def add_observer(self, broadcast_index: Optional[int], offset: Optional[int] = None,
+                     epoch: Optional[str] = None) -> tuple[str, int, bool, int]:
+        """添加只读观察者
+        
+        观察者的后续输出由广播统一发送，因此返回的数据截止到广播已发送的位置 broadcast_index
+        （None 表示还没有广播，从当前位置开始）。续传规则与 add_client 相同。
+        返回 (数据, 数据结束处的偏移, 是否为增量续传, 广播位置)
+        """
+        with self.lock:
+            self._page_in()
+            self.last_viewed = time.time()
+            self.observers += 1
+            
+            if broadcast_index is None:
+                broadcast_index = self.output_index - 1
+            # 广播尚未发送的部分留给广播
+            unsent = []
+            for item in reversed(self.output_history):
+                if item['index'] <= broadcast_index:
+                    break
+                unsent.append(item['data'])
+            unsent_chars = sum(len(data) for data in unsent)
+            end_offset = self.output_offset - sum(len(data.encode('utf-8')) for data in unsent)
+            
+            if offset is not None and epoch == self.epoch and offset <= end_offset:
+                missing = self._get_output_since(offset)
+                if missing is not None:
+                    return missing[:len(missing) - unsent_chars], end_offset, True, broadcast_index
+            
+            buffer = self.get_buffer()
+            return buffer[:len(buffer) - unsent_chars], end_offset, False, broadcast_index
+    
+    def remove_observer(self):
+        with self.lock:
+            self.observers = max(0, self.observers - 1)
+            self.last_viewed = time.time()
     
     def remove_client(self, client_id: str):
         """移除断开的客户端"""
         with self.lock:
             self.connected_clients.pop(client_id, None)
-            print(f"Client {client_id} disconnected from session {self.session_id}. Remaining clients: {len(self.connected_clients)}")
+            self.compression_stats.pop(client_id, None)
+            self.last_viewed = time.time()
+            self.log.info("Client disconnected, remaining clients: %d", len(self.connected_clients), extra={"client_id": client_id})
+    
+    def get_unread_output_time(self, client_id: str, since: float) -> Optional[float]:
+        """客户端未读输出中第一块不早于 since 的读取时间，用于计算回显延迟"""
+        with self.lock:
+            last_index = self.connected_clients.get(client_id)
+            if last_index is None:
+                return None
+            for item in self.output_history:
+                if item['index'] > last_index and item['timestamp'] >= since:
+                    return item['timestamp']
+        return None
+    
+    def get_client_backlog(self, client_id: str) -> int:
+        """客户端尚未收到的输出块数"""
+        last_index = self.connected_clients.get(client_id)
+        if last_index is None:
+            return 0
+        return self.output_index - 1 - last_index
     
     def has_clients(self) -> bool:
         """检查是否有客户端连接"""
         return len(self.connected_clients) > 0
     
     def get_buffer(self) -> str:
-        """获取缓存的输出"""
+        """获取缓存的输出（调用方需持有锁）"""
+        if self.spill:
+            return self.spill.read_text() + ''.join(self.buffer)
+        return ''.join(self.buffer)
+    
+    def get_resident_buffer(self) -> str:
+        """内存中的缓冲区，不读取换出到磁盘的部分（调用方需持有锁）"""
         return ''.join(self.buffer)
     
+    def _buffer_length(self) -> int:
+        """缓冲区总块数，包括换出到磁盘的部分"""
+        return len(self.buffer) + (self.spill.count if self.spill else 0)
+    
+    def _drop_oldest_chunk(self) -> int:
+        """淘汰缓冲区中最旧的一块，优先从磁盘部分淘汰，返回其字节数（调用方需持有锁）
+        
+        buffer 与 output_history 一一对应，从内存部分淘汰时同时移除对应的历史记录。
+        """
+        if self.spill and self.spill.count:
+            return self.spill.drop_oldest()
+        self.output_history.pop(0)
+        return len(self.buffer.pop(0).encode('utf-8'))
+    
+    def resident_bytes(self) -> int:
+        """内存中缓冲区的字节数（UTF-8），buffer 与 output_history 共享同一批字符串"""
+        return self.output_offset - self.buffer_start_offset - self.spilled_bytes()
+    
+    def spilled_bytes(self) -> int:
+        """换出到磁盘的缓冲区字节数"""
+        spill = self.spill
+        return spill.live_bytes if spill else 0
+    
+    def spill_scrollback(self) -> int:
+        """把已持久化的缓冲区换出到磁盘，返回换出的字节数
+        
+        有客户端或观察者连接时不换出；尚未写入分块表的输出留在内存中。
+        """
+        with self.lock:
+            if self.connected_clients or self.observers:
+                return 0
+            
+            # buffer 与 output_history 一一对应
+            count = 0
+            for item in self.output_history:
+                if item['offset'] > self.persisted_offset:
+                    break
+                count += 1
+            if not count:
+                return 0
+            
+            if self.spill is None:
+                self.spill = SpillFile(self.session_id)
+            before = self.spill.live_bytes
+            self.spill.append(self.buffer[:count])
+            del self.buffer[:count]
+            del self.output_history[:count]
+            SCROLLBACK_SPILLS.labels(direction="out").inc()
+            return self.spill.live_bytes - before
+    
+    def _page_in(self):
+        """把换出到磁盘的缓冲区读回内存（调用方需持有锁）"""
+        if not self.spill:
+            return
+        
+        chunks = self.spill.read_chunks()
+        first_index = self.output_index - len(self.output_history) - len(chunks)
+        end_offset = self.buffer_start_offset
+        now = time.time()
+        items = []
+        for i, chunk in enumerate(chunks):
+            end_offset += len(chunk.encode('utf-8'))
+            items.append({
+                'index': first_index + i,
+                'data': chunk,
+                'offset': end_offset,
+                'timestamp': now
+            })
+        
+        self.buffer[:0] = chunks
+        self.output_history[:0] = items
+        self.spill.close()
+        self.spill = None
+        SCROLLBACK_SPILLS.labels(direction="in").inc()
+    
     def is_alive(self) -> bool:
         """检查会话是否存活"""
         if not self.running or not self.child_pid:
@@ -265,7 +592,7 @@ class TerminalSession:
             finally:
                 db.close()
         except Exception as e:
-            print(f"Error saving session to DB: {e}")
+            self.log.error("Error saving session to DB: %s", e)
     
     def _update_winsize_in_db(self):
         """更新数据库中的终端尺寸 - 线程安全版本"""
@@ -285,55 +612,140 @@ class TerminalSession:
             finally:
                 db.close()
         except Exception as e:
-            print(f"Error updating winsize in DB: {e}")
+            self.log.error("Error updating winsize in DB: %s", e)
     
-    def _save_buffer_to_db(self):
-        """保存缓冲区到数据库 - 线程安全版本"""
+    def _load_output_offset(self):
+        """从输出分块表恢复偏移，保证同一会话 ID 重建后偏移继续递增"""
         try:
-            # 使用新的数据库会话，避免线程冲突
-            from ..db.database import SessionLocal
             db = SessionLocal()
-            
             try:
-                session_db = db.query(TerminalSessionDB).filter(
-                    TerminalSessionDB.id == self.session_id
-                ).first()
+                last_offset = db.query(func.max(TerminalOutputChunkDB.end_offset)).filter(
+                    TerminalOutputChunkDB.session_id == self.session_id
+                ).scalar()
+            finally:
+                db.close()
+        except Exception as e:
+            self.log.error("Error loading output offset: %s", e)
+            return
+        self._restore_output_offset(last_offset)
+    
+    def _restore_output_offset(self, last_offset: Optional[int]):
+        if last_offset:
+            with self.lock:
+                self.output_offset = last_offset
+                self.buffer_start_offset = last_offset
+                self.persisted_offset = last_offset
+    
+    def _collect_unpersisted_chunks(self) -> list:
+        """收集尚未追加到分块表的输出，相邻块合并为不超过 PERSIST_CHUNK_BYTES 的分块（调用方需持有锁）"""
+        pending = []
+        for item in reversed(self.output_history):
+            if item['offset'] <= self.persisted_offset:
+                break
+            pending.append(item)
+        pending.reverse()
+        
+        chunks = []
+        for item in pending:
+            encoded_size = len(item['data'].encode('utf-8'))
+            start = item['offset'] - encoded_size
+            if chunks and chunks[-1]['end'] == start and chunks[-1]['size'] + encoded_size <= PERSIST_CHUNK_BYTES:
+                chunks[-1]['parts'].append(item['data'])
+                chunks[-1]['end'] = item['offset']
+                chunks[-1]['size'] += encoded_size
+            else:
+                chunks.append({
+                    'start': start,
+                    'end': item['offset'],
+                    'size': encoded_size,
+                    'parts': [item['data']]
+                })
+        return chunks
+    
+    def _save_buffer_to_db(self, include_buffer: bool = True, include_spilled: bool = False):
+        """保存缓冲区到数据库 - 线程安全版本
+        
+        新输出按偏移追加到分块表，会话行保存最近的缓冲区。
+        include_buffer 为 False 时只追加分块，不重写会话行中的完整缓冲区。
+        会话行默认只保存内存中的部分：换出到磁盘的输出已在分块表中，定期保存时读回会抵消内存预算；
+        include_spilled 为 True（关闭会话时）才连同磁盘部分一起保存。
+        """
+        try:
+            with self.save_lock, DB_SAVE_SECONDS.time():
+                # 使用新的数据库会话，避免线程冲突
+                db = SessionLocal()
                 
-                if session_db:
-                    # 保存完整的缓冲区
-                    buffer_content = self.get_buffer()
-                    session_db.buffer = buffer_content
-                    session_db.last_activity = self.last_activity
+                try:
+                    chunks = self._write_buffer(db, include_buffer, include_spilled)
                     
                     # 立即提交
                     db.commit()
-                else:
-                    # 如果会话不存在，创建它
-                    session_db = TerminalSessionDB(
-                        id=self.session_id,
-                        username=self.username,
-                        name=self.name,
-                        last_activity=self.last_activity,
-                        created_at=time.time(),
-                        is_active=True,
-                        pid=self.child_pid,
-                        cwd=self.cwd,
-                        rows=self.rows,
-                        cols=self.cols,
-                        buffer=self.get_buffer()
-                    )
-                    db.add(session_db)
-                    db.commit()
-            finally:
-                db.close()
+                    self._mark_persisted(chunks)
+                finally:
+                    db.close()
                 
         except Exception as e:
-            print(f"Error saving buffer to DB: {e}")
-            import traceback
-            traceback.print_exc()
+            self.log.exception("Error saving buffer to DB: %s", e)
     
-    def _update_activity(self):
-        """更新最后活动时间 - 线程安全版本"""
+    def _write_buffer(self, db: Session, include_buffer: bool = True, include_spilled: bool = False) -> list:
+        """把缓冲区和新的输出分块写入 db，不提交（调用方需持有 save_lock），返回写入的分块
+        
+        提交后需调用 _mark_persisted。
+        """
+        with self.lock:
+            if not include_buffer:
+                buffer_content = None
+            elif include_spilled:
+                buffer_content = self.get_buffer()
+            else:
+                buffer_content = self.get_resident_buffer()
+            chunks = self._collect_unpersisted_chunks()
+        
+        session_db = db.query(TerminalSessionDB).filter(
+            TerminalSessionDB.id == self.session_id
+        ).first()
+        
+        if session_db:
+            # 保存完整的缓冲区
+            if include_buffer:
+                session_db.buffer = buffer_content
+            session_db.last_activity = self.last_activity
+        else:
+            # 如果会话不存在，创建它
+            session_db = TerminalSessionDB(
+                id=self.session_id,
+                username=self.username,
+                name=self.name,
+                last_activity=self.last_activity,
+                created_at=time.time(),
+                is_active=True,
+                pid=self.child_pid,
+                cwd=self.cwd,
+                rows=self.rows,
+                cols=self.cols,
+                buffer=buffer_content or ""
+            )
+            db.add(session_db)
+        
+        # 追加新的输出分块
+        for chunk in chunks:
+            db.add(TerminalOutputChunkDB(
+                session_id=self.session_id,
+                start_offset=chunk['start'],
+                end_offset=chunk['end'],
+                data=''.join(chunk['parts'])
+            ))
+        return chunks
+    
+    def _mark_persisted(self, chunks: list):
+        """_write_buffer 写入的分块提交后调用"""
+        if chunks:
+            self.persisted_offset = chunks[-1]['end']
+            # 交给后台线程建立全文索引
+            output_indexer.submit(self.session_id, self.username, chunks)
+    
+    def _mark_inactive_in_db(self):
+        """标记为不活跃 - 使用独立的数据库会话"""
         try:
             from ..db.database import SessionLocal
             db = SessionLocal()
@@ -344,41 +756,31 @@ class TerminalSession:
                 ).first()
                 
                 if session_db:
-                    session_db.last_activity = self.last_activity
+                    session_db.is_active = False
                     db.commit()
             finally:
                 db.close()
         except Exception as e:
-            print(f"Error updating activity: {e}")
+            self.log.error("Error marking session inactive: %s", e)
     
-    def close(self):
-        """关闭终端会话"""
+    def close(self, persist: bool = True):
+        """关闭终端会话，persist 为 False 时不把数据库中的记录标记为不活跃（由批量关闭统一更新）"""
         self.running = False
         
         # 只有在没有客户端连接时才真正关闭
         if self.has_clients():
-            print(f"Session {self.session_id} has active clients, keeping alive")
+            self.log.info("Session has active clients, keeping alive")
             return
         
-        print(f"Closing session {self.session_id}")
+        self.log.info("Closing session")
+        self.stop_recording()
+        with self.lock:
+            if self.spill:
+                self.spill.close()
+                self.spill = None
         
-        # 标记为不活跃 - 使用独立的数据库会话
-        try:
-            from ..db.database import SessionLocal
-            db = SessionLocal()
-            
-            try:
-                session_db = db.query(TerminalSessionDB).filter(
-                    TerminalSessionDB.id == self.session_id
-                ).first()
-                
-                if session_db:
-                    session_db.is_active = False
-                    db.commit()
-            finally:
-                db.close()
-        except Exception as e:
-            print(f"Error marking session inactive: {e}")
+        if persist:
+            self._mark_inactive_in_db()
         
         if self.fd:
             try:
@@ -396,17 +798,51 @@ class TerminalManager:
         self.sessions: Dict[str, TerminalSession] = {}
         self.session_timeout = 3600 * 24 * 7  # 默认7天，支持长时间运行的任务
         self.buffer_size = 1000  # 默认1000行，可通过配置更新
-        self.background_tasks = {}  # 存储后台读取任务
+        self.memory_budget = 256 * 1024 * 1024  # 所有会话常驻内存的缓冲区总字节数上限
+        self.max_sessions = 0  # 最大并发会话数，0 表示不限制
+        self.max_sessions_per_user = 0  # 每个用户的最大并发会话数，0 表示不限制
+        self.scheduler = FairScheduler(self)  # 所有会话共用的 PTY 读取调度
+        self.memory_governor = None  # 内存预算检查线程
+        self.spawn_executor = ThreadPoolExecutor(max_workers=SPAWN_WORKERS, thread_name_prefix="session-spawn")
+        self.reconciled_at: Optional[float] = None  # 核对遗留会话记录的时间，之前写入的 pid 属于上一个进程
+        self.surviving_session_ids: list = []  # 遗留记录中进程仍然存在的会话
+        ACTIVE_SESSIONS.set_function(lambda: len(self.sessions))
+        CONNECTED_CLIENTS.set_function(
+            lambda: sum(len(session.connected_clients) for session in list(self.sessions.values()))
+        )
+        WS_QUEUE_DEPTH.set_function(
+            lambda: max((session.get_client_backlog(client_id)
+                         for session in list(self.sessions.values())
+                         for client_id in list(session.connected_clients)), default=0)
+        )
+        SCROLLBACK_RESIDENT_BYTES.set_function(
+            lambda: sum(session.resident_bytes() for session in list(self.sessions.values()))
+        )
+        SCROLLBACK_SPILLED_BYTES.set_function(
+            lambda: sum(session.spilled_bytes() for session in list(self.sessions.values()))
+        )
         
-    def update_config(self, session_timeout: int = None, buffer_size: int = None):
+    def update_config(self, session_timeout: int = None, buffer_size: int = None, memory_budget_mb: int = None,
+                      max_sessions: int = None, max_sessions_per_user: int = None,
+                      session_rate_limit_kb: int = None, user_rate_limit_kb: int = None):
         """更新配置"""
         if session_timeout is not None:
             self.session_timeout = session_timeout
         if buffer_size is not None:
             self.buffer_size = buffer_size
+        if memory_budget_mb is not None:
+            self.memory_budget = memory_budget_mb * 1024 * 1024
+        if max_sessions is not None:
+            self.max_sessions = max_sessions
+        if max_sessions_per_user is not None:
+            self.max_sessions_per_user = max_sessions_per_user
+        self.scheduler.configure(
+            session_rate=session_rate_limit_kb * 1024 if session_rate_limit_kb is not None else None,
+            user_rate=user_rate_limit_kb * 1024 if user_rate_limit_kb is not None else None
+        )
         
     def create_session(self, session_id: str, username: str, name: str, cols: int = 80, rows: int = 24, cwd: str = None) -> TerminalSession:
-        """创建新的终端会话"""
+        """创建新的终端会话，超过最大并发会话数时抛出 SessionLimitError"""
         if session_id in self.sessions:
             # 如果会话已存在且还活着，直接返回
             if self.sessions[session_id].is_alive():
@@ -414,53 +850,69 @@ class TerminalManager:
             # 否则清理旧会话
             self.sessions[session_id].close()
         
+        self._check_session_limits(username)
+        
         session = TerminalSession(session_id, username, name, self.buffer_size)
         session.start(cols, rows, cwd)
         self.sessions[session_id] = session
         
-        # 启动后台读取任务，持续读取终端输出
-        self._start_background_reader(session_id)
+        # 交给调度器持续读取终端输出
+        self.scheduler.add_session(session_id)
+        self.scheduler.start()
+        self._start_memory_governor()
         
         return session
     
-    def _start_background_reader(self, session_id: str):
-        """启动后台任务持续读取终端输出"""
+    def _check_session_limits(self, username: str, reserved: int = 0):
+        """检查全局和单用户的并发会话数，reserved 为同一批中已通过检查、尚未启动的该用户会话数"""
+        alive = [session for session in list(self.sessions.values()) if session.is_alive()]
+        if self.max_sessions and len(alive) + reserved >= self.max_sessions:
+            raise SessionLimitError(f"会话数已达上限（{self.max_sessions}）")
+        if self.max_sessions_per_user:
+            owned = sum(1 for session in alive if session.username == username)
+            if owned + reserved >= self.max_sessions_per_user:
+                raise SessionLimitError(f"每个用户最多 {self.max_sessions_per_user} 个会话")
+    
+    def _start_memory_governor(self):
+        """启动后台线程，定期检查全局内存预算"""
         import threading
         
-        def read_loop():
-            """后台循环读取终端输出"""
-            last_save_time = time.time()
-            save_interval = 5  # 每5秒强制保存一次
-            
-            while session_id in self.sessions:
-                session = self.sessions.get(session_id)
-                if not session or not session.is_alive():
-                    break
-                
-                # 读取输出（即使没有客户端连接也继续读取）
-                session.read(timeout=0.1)
-                
-                # 定期强制保存到数据库
-                current_time = time.time()
-                if current_time - last_save_time >= save_interval:
-                    session._save_buffer_to_db()
-                    last_save_time = current_time
-                
-                time.sleep(0.01)
-            
-            # 退出前最后保存一次
-            if session_id in self.sessions:
-                session = self.sessions.get(session_id)
-                if session:
-                    session._save_buffer_to_db()
-            
-            print(f"Background reader for session {session_id} stopped")
+        if self.memory_governor and self.memory_governor.is_alive():
+            return
+        
+        def governor_loop():
+            while True:
+                time.sleep(MEMORY_CHECK_INTERVAL)
+                try:
+                    self.enforce_memory_budget()
+                except Exception as e:
+                    logger.exception("Error enforcing memory budget: %s", e)
         
-        # 创建并启动后台线程
-        thread = threading.Thread(target=read_loop, daemon=True)
-        thread.start()
-        self.background_tasks[session_id] = thread
-        print(f"Started background reader for session {session_id}")
+        self.memory_governor = threading.Thread(target=governor_loop, daemon=True)
+        self.memory_governor.start()
+    
+    def enforce_memory_budget(self) -> int:
+        """常驻缓冲区超过预算时，按最近查看时间从早到晚把无客户端会话的缓冲区换出到磁盘
+        
+        返回换出的字节数。
+        """
+        sessions = list(self.sessions.values())
+        excess = sum(session.resident_bytes() for session in sessions) - self.memory_budget
+        if excess <= 0:
+            return 0
+        
+        spilled = 0
+        idle_sessions = sorted(
+            (session for session in sessions if not session.connected_clients and not session.observers),
+            key=lambda session: session.last_viewed
+        )
+        for session in idle_sessions:
+            if spilled >= excess:
+                break
+            # 只有已写入分块表的输出可以换出
+            session._save_buffer_to_db()
+            spilled += session.spill_scrollback()
+        return spilled
     
     def get_session(self, session_id: str) -> Optional[TerminalSession]:
         """获取终端会话"""
@@ -474,7 +926,8 @@ class TerminalManager:
         # 先检查内存中的会话
         session = self.sessions.get(session_id)
         if session and session.is_alive():
-            buffer = session.get_buffer()
+            with session.lock:
+                buffer = session.get_buffer()
             return True, buffer
         
         # 从数据库恢复
@@ -498,17 +951,85 @@ class TerminalManager:
             
             return False, "会话不存在"
         except Exception as e:
-            print(f"Error reconnecting session: {e}")
+            logger.error("Error reconnecting session: %s", e, extra={"session_id": session_id})
             return False, f"重连失败: {str(e)}"
         finally:
             db.close()
     
-    def list_sessions(self, username: str = None) -> list:
-        """列出所有活跃的会话"""
+    def reconcile_persisted_sessions(self) -> dict:
+        """启动时核对上一个进程遗留的活跃会话记录，返回统计结果
+        
+        上一个进程的 shell 已随它退出，未超时的会话保持活跃，客户端重连时以同一 ID 重建 shell；
+        超时的会话由 expire_persisted_sessions 标记。只读取列表索引中的列，不加载缓冲区。
+        """
+        self.reconciled_at = time.time()
+        cutoff = self.reconciled_at - self.session_timeout
         db = SessionLocal()
         try:
-            query = db.query(TerminalSessionDB).filter(
+            rows = db.query(TerminalSessionDB.id, TerminalSessionDB.pid, TerminalSessionDB.last_activity).filter(
                 TerminalSessionDB.is_active == True
+            ).all()
+        finally:
+            db.close()
+        
+        # 记录的进程仍然存在（例如上一个进程被强制结束后 shell 未退出），只提示，不替用户结束
+        survivors = [row.id for row in rows if row.pid and _process_exists(row.pid)]
+        self.surviving_session_ids = survivors
+        for session_id in survivors:
+            logger.warning("Process of persisted session is still running and will not be reattached",
+                           extra={"session_id": session_id})
+        expired = sum(1 for row in rows if row.last_activity < cutoff)
+        return {"restorable": len(rows) - expired, "expired": expired, "survivors": len(survivors)}
+    
+    def expire_persisted_sessions(self) -> int:
+        """用一条 UPDATE 把超时的活跃会话记录标记为不活跃，并清除遗留记录中已失效的 pid，返回更新的行数
+        
+        核对之后没有重建过的遗留记录（最后活动早于核对时间），其 pid 属于已退出的 shell，
+        不清除的话进程号被复用后下次启动会误报进程仍在运行；进程仍然存在的记录保留 pid。
+        更新一行要重写行内的缓冲区，会话多时耗时较长，在启动完成后和定期清理中执行；
+        列表和重连按最后活动时间过滤，不依赖这里先执行。
+        """
+        timed_out = TerminalSessionDB.last_activity < time.time() - self.session_timeout
+        if self.reconciled_at is None:
+            stale_pid = false()
+        else:
+            stale_pid = and_(
+                TerminalSessionDB.pid.isnot(None),
+                TerminalSessionDB.last_activity < self.reconciled_at,
+                TerminalSessionDB.id.notin_(self.surviving_session_ids)
+            )
+        db = SessionLocal()
+        try:
+            updated = db.query(TerminalSessionDB).filter(
+                TerminalSessionDB.is_active == True,
+                or_(timed_out, stale_pid)
+            ).update({
+                TerminalSessionDB.is_active: case((timed_out, False), else_=True),
+                TerminalSessionDB.pid: case((stale_pid, None), else_=TerminalSessionDB.pid),
+            }, synchronize_session=False)
+            db.commit()
+            return updated
+        except Exception as e:
+            logger.error("Error expiring sessions: %s", e)
+            db.rollback()
+            return 0
+        finally:
+            db.close()
+    
+    def list_sessions(self, username: str = None) -> list:
+        """列出所有活跃的会话
+        
+        只查询列表索引中的列，不读取缓冲区；超时的会话不列出（由 expire_persisted_sessions 标记）。
+        """
+        db = SessionLocal()
+        try:
+            query = db.query(
+                TerminalSessionDB.id, TerminalSessionDB.name, TerminalSessionDB.username,
+                TerminalSessionDB.last_activity, TerminalSessionDB.created_at,
+                TerminalSessionDB.rows, TerminalSessionDB.cols
+            ).filter(
+                TerminalSessionDB.is_active == True,
+                TerminalSessionDB.last_activity >= time.time() - self.session_timeout
             )
             
             if username:
@@ -518,11 +1039,6 @@ class TerminalManager:
             
             result = []
             for session_db in sessions:
-                # 检查是否超时
-                if time.time() - session_db.last_activity > self.session_timeout:
-                    session_db.is_active = False
-                    continue
-                
                 result.append({
                     "id": session_db.id,
                     "name": session_db.name,
@@ -530,37 +1046,338 @@ class TerminalManager:
                     "last_activity": session_db.last_activity,
                     "created_at": session_db.created_at,
                     "running": session_db.id in self.sessions and self.sessions[session_db.id].is_alive(),
+                    "observers": self.sessions[session_db.id].observers if session_db.id in self.sessions else 0,
                     "rows": session_db.rows or 24,
                     "cols": session_db.cols or 80
                 })
-            
-            db.commit()
             return result
         except Exception as e:
-            print(f"Error listing sessions: {e}")
+            logger.error("Error listing sessions: %s", e)
             return []
         finally:
             db.close()
     
+    def is_session_owner(self, session_id: str, username: str) -> bool:
+        """检查会话是否属于指定用户"""
+        session = self.sessions.get(session_id)
+        if session:
+            return session.username == username
+        
+        db = SessionLocal()
+        try:
+            return db.query(TerminalSessionDB.id).filter(
+                TerminalSessionDB.id == session_id,
+                TerminalSessionDB.username == username
+            ).first() is not None
+        finally:
+            db.close()
+    
+    def get_scrollback_range(self, session_id: str) -> tuple[int, int]:
+        """获取已持久化历史的偏移范围 (起始, 结束)"""
+        session = self.sessions.get(session_id)
+        if session:
+            # 先把内存中的新输出写入分块表
+            session._save_buffer_to_db()
+        
+        db = SessionLocal()
+        try:
+            start, end = db.query(
+                func.min(TerminalOutputChunkDB.start_offset),
+                func.max(TerminalOutputChunkDB.end_offset)
+            ).filter(
+                TerminalOutputChunkDB.session_id == session_id
+            ).one()
+            return start or 0, end or 0
+        finally:
+            db.close()
+    
+    def iter_scrollback(self, session_id: str, start: int, end: int, page_size: int = 64):
+        """按偏移范围逐页读取持久化的历史，逐块生成 UTF-8 字节，不在内存中拼接完整历史
+        
+        只按 (session_id, start_offset) 索引定位：先找到起点所在的分块，之后每页从上一页
+        最后一块之后继续，不会为每页重新扫描之前的分块。
+        """
+        db = SessionLocal()
+        try:
+            # 起点所在的分块：起始偏移不大于 start 的最后一块
+            page_start = db.query(TerminalOutputChunkDB.start_offset).filter(
+                TerminalOutputChunkDB.session_id == session_id,
+                TerminalOutputChunkDB.start_offset <= start
+            ).order_by(TerminalOutputChunkDB.start_offset.desc()).limit(1).scalar()
+            if page_start is None:
+                page_start = start
+            position = start
+            while position < end:
+                chunks = db.query(TerminalOutputChunkDB).filter(
+                    TerminalOutputChunkDB.session_id == session_id,
+                    TerminalOutputChunkDB.start_offset >= page_start,
+                    TerminalOutputChunkDB.start_offset < end
+                ).order_by(TerminalOutputChunkDB.start_offset).limit(page_size).all()
+                
+                if not chunks:
+                    break
+                
+                for chunk in chunks:
+                    data = chunk.data.encode('utf-8')
+                    begin = max(position, chunk.start_offset) - chunk.start_offset
+                    stop = min(end, chunk.end_offset) - chunk.start_offset
+                    if stop > begin:
+                        yield data[begin:stop]
+                    position = max(position, chunk.end_offset)
+                page_start = chunks[-1].start_offset + 1
+                
+                # 释放已读取的分块对象
+                db.expunge_all()
+        finally:
+            db.close()
+    
     def close_session(self, session_id: str):
         """关闭终端会话"""
         if session_id in self.sessions:
             session = self.sessions[session_id]
             # 在关闭前保存最终的缓冲区
-            session._save_buffer_to_db()
-            
-            # 清除所有客户端连接
-            session.connected_clients.clear()
-            
-            # 关闭会话
-            session.close()
-            
-            # 从管理器中移除
-            del self.sessions[session_id]
+            session._save_buffer_to_db(include_spilled=True)
+            self._discard_session(session)
+    
+    def _discard_session(self, session: TerminalSession, persist: bool = True):
+        """断开客户端、结束进程并从管理器中移除（缓冲区已由调用方保存）"""
+        # 清除所有客户端连接
+        session.connected_clients.clear()
+        
+        # 关闭会话
+        session.close(persist=persist)
+        
+        # 从管理器中移除
+        if self.sessions.get(session.session_id) is session:
+            del self.sessions[session.session_id]
+        latency_tracker.remove_session(session.session_id)
+        self.scheduler.remove_session(session.session_id)
+    
+    def _load_owners(self, session_ids: list) -> Dict[str, str]:
+        """一次查询数据库中这些会话的所有者 {会话 ID: 用户名}（走列表索引）"""
+        if not session_ids:
+            return {}
+        db = SessionLocal()
+        try:
+            return dict(db.query(TerminalSessionDB.id, TerminalSessionDB.username).filter(
+                TerminalSessionDB.id.in_(session_ids)
+            ).all())
+        finally:
+            db.close()
+    
+    def create_sessions(self, username: str, specs: list) -> list:
+        """批量创建会话，返回与 specs 顺序一致的结果 [{"session_id", "ok", "created" 或 "error"}]
+        
+        specs 中每项为 {"session_id", "name", "cols", "rows", "cwd"}。已在运行的会话直接返回，
+        属于其他用户的会话和超过会话数上限的项返回错误。shell 在线程池中并行启动，
+        之后用一个事务恢复输出偏移并保存所有会话记录，最后一起交给调度器；
+        事务失败时结束这一批已启动的 shell，所有项都返回错误。
+        """
+        results = [None] * len(specs)
+        owners = self._load_owners([spec["session_id"] for spec in specs])
+        pending = []  # [(下标, spec)]
+        seen = set()
+        for index, spec in enumerate(specs):
+            session_id = spec["session_id"]
+            existing = self.sessions.get(session_id)
+            owner = existing.username if existing else owners.get(session_id, username)
+            if session_id in seen:
+                results[index] = _batch_result(session_id, "会话 ID 重复")
+            elif owner != username:
+                results[index] = _batch_result(session_id, "无权访问该会话")
+            elif existing and existing.is_alive():
+                results[index] = _batch_result(session_id, created=False)
+            else:
+                try:
+                    self._check_session_limits(username, reserved=len(pending))
+                    pending.append((index, spec))
+                except SessionLimitError as e:
+                    results[index] = _batch_result(session_id, str(e))
+            seen.add(session_id)
+        
+        def spawn(spec: dict) -> TerminalSession:
+            session = TerminalSession(spec["session_id"], username, spec["name"], self.buffer_size)
+            session.start(spec["cols"], spec["rows"], spec["cwd"], persist=False)
+            return session
+        
+        futures = [(index, self.spawn_executor.submit(spawn, spec)) for index, spec in pending]
+        started = []  # [(下标, 会话)]
+        for index, future in futures:
+            try:
+                started.append((index, future.result()))
+            except Exception as e:
+                logger.error("Error starting session: %s", e, extra={"session_id": specs[index]["session_id"]})
+                results[index] = _batch_result(specs[index]["session_id"], f"启动失败: {e}")
+        if not started:
+            return results
+        
+        try:
+            self._persist_started_sessions([session for _, session in started], owners)
+        except Exception as e:
+            logger.error("Error saving started sessions: %s", e)
+            for index, session in started:
+                session.close(persist=False)
+                results[index] = _batch_result(session.session_id, f"保存会话失败: {e}")
+            return results
+        
+        for index, session in started:
+            previous = self.sessions.get(session.session_id)
+            if previous:
+                # 已退出的旧会话，记录已在上面的事务中更新
+                previous.close(persist=False)
+            self.sessions[session.session_id] = session
+            self.scheduler.add_session(session.session_id)
+            results[index] = _batch_result(session.session_id, created=True)
+        self.scheduler.start()
+        self._start_memory_governor()
+        return results
+    
+    def _persist_started_sessions(self, sessions: list, owners: Dict[str, str]):
+        """在一个事务中恢复这些会话的输出偏移，并插入或更新会话记录"""
+        session_ids = [session.session_id for session in sessions]
+        db = SessionLocal()
+        try:
+            offsets = dict(db.query(
+                TerminalOutputChunkDB.session_id, func.max(TerminalOutputChunkDB.end_offset)
+            ).filter(
+                TerminalOutputChunkDB.session_id.in_(session_ids)
+            ).group_by(TerminalOutputChunkDB.session_id).all())
             
-            # 清理后台任务
-            if session_id in self.background_tasks:
-                del self.background_tasks[session_id]
+            now = time.time()
+            rows = [{
+                "id": session.session_id,
+                "last_activity": session.last_activity,
+                "is_active": True,
+                "pid": session.child_pid,
+                "cwd": session.cwd,
+                "rows": session.rows,
+                "cols": session.cols
+            } for session in sessions]
+            db.bulk_update_mappings(TerminalSessionDB, [row for row in rows if row["id"] in owners])
+            db.bulk_insert_mappings(TerminalSessionDB, [
+                dict(row, username=session.username, name=session.name, created_at=now, buffer="")
+                for row, session in zip(rows, sessions) if row["id"] not in owners
+            ])
+            db.commit()
+        finally:
+            db.close()
+        
+        for session in sessions:
+            session._restore_output_offset(offsets.get(session.session_id))
+    
+    def close_sessions(self, username: str, session_ids: list) -> list:
+        """批量关闭会话，返回与 session_ids 顺序一致的结果
+        
+        运行中的会话的最终缓冲区和数据库中的记录（包括可以恢复、尚未运行的会话）在一个事务中
+        保存并标记为不活跃，提交后再结束进程；事务失败时不关闭任何会话。
+        """
+        results = []
+        owners = self._load_owners(session_ids)
+        running = {}  # {会话 ID: 会话}
+        owned = []
+        for session_id in session_ids:
+            session = self.sessions.get(session_id)
+            owner = session.username if session else owners.get(session_id)
+            if owner is None:
+                results.append(_batch_result(session_id, "会话不存在"))
+            elif owner != username:
+                results.append(_batch_result(session_id, "无权访问该会话"))
+            else:
+                results.append(_batch_result(session_id))
+                owned.append(session_id)
+                if session:
+                    running[session_id] = session
+        if not owned:
+            return results
+        
+        # 按 ID 顺序获取保存锁，两个批量关闭不会互相等待
+        sessions = [running[session_id] for session_id in sorted(running)]
+        try:
+            with contextlib.ExitStack() as stack:
+                for session in sessions:
+                    stack.enter_context(session.save_lock)
+                db = SessionLocal()
+                try:
+                    written = [(session, session._write_buffer(db, include_spilled=True)) for session in sessions]
+                    db.flush()
+                    db.query(TerminalSessionDB).filter(
+                        TerminalSessionDB.id.in_(owned)
+                    ).update({TerminalSessionDB.is_active: False}, synchronize_session=False)
+                    db.commit()
+                finally:
+                    db.close()
+                for session, chunks in written:
+                    session._mark_persisted(chunks)
+        except Exception as e:
+            logger.error("Error closing sessions: %s", e)
+            return [
+                _batch_result(result["session_id"], f"保存会话失败: {e}") if result["ok"] else result
+                for result in results
+            ]
+        
+        for session in sessions:
+            self._discard_session(session, persist=False)
+        return results
+    
+    def resize_sessions(self, username: str, sizes: list) -> list:
+        """批量调整运行中会话的终端尺寸，sizes 中每项为 {"session_id", "rows", "cols"}
+        
+        PTY 尺寸立即生效，数据库中保存的尺寸在一个事务中更新。
+        """
+        results = []
+        updates = []
+        for size in sizes:
+            session, error = self._owned_running_session(size["session_id"], username)
+            if error:
+                results.append(_batch_result(size["session_id"], error))
+                continue
+            try:
+                session.set_winsize(size["rows"], size["cols"], persist=False)
+            except OSError as e:
+                results.append(_batch_result(size["session_id"], f"调整尺寸失败: {e}"))
+                continue
+            results.append(_batch_result(size["session_id"]))
+            updates.append({"session_id": size["session_id"], "rows": size["rows"], "cols": size["cols"]})
+        
+        if updates:
+            db = SessionLocal()
+            try:
+                table = TerminalSessionDB.__table__
+                db.execute(
+                    table.update().where(table.c.id == bindparam("session_id")).values(
+                        rows=bindparam("rows"), cols=bindparam("cols")
+                    ),
+                    updates
+                )
+                db.commit()
+            except Exception as e:
+                # 只影响重连恢复时使用的尺寸，不影响运行中的会话
+                logger.error("Error saving terminal sizes: %s", e)
+            finally:
+                db.close()
+        return results
+    
+    def write_sessions(self, username: str, session_ids: list, data: str) -> list:
+        """向多个运行中的会话写入同一段输入，结果中的 pending 为该会话仍在排队的输入字节数"""
+        results = []
+        for session_id in session_ids:
+            session, error = self._owned_running_session(session_id, username)
+            if error:
+                results.append(_batch_result(session_id, error))
+                continue
+            try:
+                results.append(_batch_result(session_id, pending=session.write(data)))
+            except InputOverflowError as e:
+                results.append(_batch_result(session_id, str(e)))
+        return results
+    
+    def _owned_running_session(self, session_id: str, username: str) -> tuple[Optional[TerminalSession], Optional[str]]:
+        session = self.get_session(session_id)
+        if not session:
+            return None, "会话未运行"
+        if session.username != username:
+            return None, "无权访问该会话"
+        return session, None
     
     def cleanup_inactive_sessions(self):
         """清理不活跃的会话"""
@@ -576,22 +1393,7 @@ class TerminalManager:
             self.close_session(session_id)
         
         # 清理数据库中的会话
-        db = SessionLocal()
-        try:
-            sessions = db.query(TerminalSessionDB).filter(
-                TerminalSessionDB.is_active == True
-            ).all()
-            
-            for session_db in sessions:
-                if current_time - session_db.last_activity > self.session_timeout:
-                    session_db.is_active = False
-            
-            db.commit()
-        except Exception as e:
-            print(f"Error cleaning up sessions: {e}")
-            db.rollback()
-        finally:
-            db.close()
+        self.expire_persisted_sessions()
     
     def close_all(self):
         """关闭所有会话"""
@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from sqlalchemy.exc import IntegrityError
+from ..db.database import SessionLocal
+from ..db.models import UserDB
+from ..core.config import settings
+from ..core.metrics import LOGIN_VERIFY_SECONDS
+from ..core.logger import get_logger
+from ..core.security import verify_password, get_password_hash
+
+logger = get_logger(__name__)
+
+# 用户表为空时创建的默认账号（admin / admin123）
+DEFAULT_USERS = {
+    "admin": "$2b$12$uosDjmfwSIh.wrGzjJGDjOb4XCIvn4HK/9JAP1OdoUfzyGMpxO71.",
+}
+
+# 用户查询缓存的有效期（秒）和最大条目数
+USER_CACHE_TTL = 60.0
+USER_CACHE_SIZE = 1024
+
+class LoginBusyError(Exception):
+    """正在校验的登录请求过多"""
+
+class UserExistsError(Exception):
+    """用户名已存在"""
+
+class UserStore:
+    """数据库中的用户，按用户名缓存查询结果（包括不存在的用户）"""
+
+    def __init__(self):
+        self.cache: Dict[str, tuple] = {}  # {username: (查询时间, 用户或 None)}
+        self.lock = threading.Lock()
+
+    def seed_default_users(self):
+        """用户表为空时写入默认账号"""
+        db = SessionLocal()
+        try:
+            if db.query(UserDB.id).first() is None:
+                for username, hashed_password in DEFAULT_USERS.items():
+                    db.add(UserDB(username=username, hashed_password=hashed_password))
+                db.commit()
+                logger.info("Created default users: %s", ", ".join(DEFAULT_USERS))
+        except Exception as e:
+            logger.error("Error seeding users: %s", e)
+            db.rollback()
+        finally:
+            db.close()
+
+    def get_user(self, username: str) -> Optional[dict]:
+        """按用户名查询启用的用户，返回 {"username", "hashed_password"}"""
+        now = time.monotonic()
+        cached = self.cache.get(username)
+        if cached and now - cached[0] < USER_CACHE_TTL:
+            return cached[1]
+
+        db = SessionLocal()
+        try:
+            user_db = db.query(UserDB).filter(
+                UserDB.username == username,
+                UserDB.is_active == True
+            ).first()
+            user = {"username": user_db.username, "hashed_password": user_db.hashed_password} if user_db else None
+        finally:
+            db.close()
+
+        with self.lock:
+            if len(self.cache) >= USER_CACHE_SIZE:
+                # 大量不同用户名（例如撞库）时整体清空，避免缓存无限增长
+                self.cache.clear()
+            self.cache[username] = (now, user)
+        return user
+
+    def create_user(self, username: str, password: str):
+        """创建用户（同步执行 bcrypt，不要在事件循环中调用），用户名已存在时抛出 UserExistsError"""
+        db = SessionLocal()
+        try:
+            db.add(UserDB(username=username, hashed_password=get_password_hash(password)))
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            raise UserExistsError(f"用户 {username} 已存在")
+        finally:
+            db.close()
+        self.invalidate(username)
+
+    def invalidate(self, username: str):
+        with self.lock:
+            self.cache.pop(username, None)
+
+class PasswordVerifier:
+    """在线程池中校验密码，不阻塞事件循环
+
+    bcrypt 计算期间释放 GIL，线程池即可并行。正在校验和排队的请求超过 queue_limit 时
+    直接抛出 LoginBusyError，突发登录不会无限排队。计数只在事件循环中修改，不需要加锁。
+    """
+
+    def __init__(self, workers: int, queue_limit: int):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-verify")
+        self.queue_limit = queue_limit
+        self.pending = 0
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        if self.pending >= self.queue_limit:
+            raise LoginBusyError("登录请求过多，请稍后重试")
+        self.pending += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, verify_password, password, hashed_password)
+        finally:
+            self.pending -= 1
+            LOGIN_VERIFY_SECONDS.observe(time.perf_counter() - started)
+
+user_store = UserStore()
+password_verifier = PasswordVerifier(settings.LOGIN_WORKERS, settings.LOGIN_QUEUE_LIMIT)
@@ -0,0 +1,96 @@
+"""批量会话操作测试
+
+在本机回环地址上启动独立的后端进程，比较两种方式打开和关闭 N 个会话的耗时：
+每个会话一个 WebSocket 连接（并发打开，等待所有连接收到 attached），
+以及一次 /sessions/batch/create 请求；之后用批量接口发送输入、调整尺寸并关闭。
+输出 JSON 报告。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.batchbench --sessions 50
+"""
+import argparse
+import asyncio
+import json
+import time
+import urllib.request
+
+import websockets
+
+from .loadtest import ServerProcess, _free_port
+from app.core.security import create_access_token
+
+def _post(base_url: str, path: str, token: str, body: dict) -> tuple:
+    """返回 (响应, 耗时)"""
+    request = urllib.request.Request(
+        f"{base_url}/api/v1/terminal{path}", data=json.dumps(body).encode(),
+        headers={"Content-Type": "application/json", "Authorization": f"Bearer {token}"},
+    )
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=120) as response:
+        result = json.loads(response.read())
+    return result, time.perf_counter() - started
+
+async def _open_websockets(base_url: str, token: str, session_ids: list) -> float:
+    """每个会话一个 WebSocket 连接，并发打开，返回所有会话可用的耗时；之后逐个发送 close"""
+    ws_url = base_url.replace("http://", "ws://")
+
+    async def attach(session_id: str):
+        ws = await websockets.connect(f"{ws_url}/api/v1/terminal/ws/{session_id}?token={token}", max_size=None)
+        while json.loads(await ws.recv())["type"] != "attached":
+            pass
+        return ws
+
+    started = time.perf_counter()
+    connections = await asyncio.gather(*(attach(session_id) for session_id in session_ids))
+    elapsed = time.perf_counter() - started
+    for ws in connections:
+        await ws.send(json.dumps({"type": "close"}))
+        await ws.close()
+    return elapsed
+
+def run(args) -> dict:
+    server = ServerProcess(_free_port(), 1000)
+    server.start()
+    token = create_access_token({"sub": "admin"})
+    report = {"config": {"sessions": args.sessions}}
+    try:
+        # 预热：第一次创建会话时启动调度器等后台线程
+        _post(server.base_url, "/sessions/batch/create", token, {"sessions": [{"session_id": "warmup"}]})
+        _post(server.base_url, "/sessions/batch/close", token, {"session_ids": ["warmup"]})
+
+        ws_ids = [f"ws-{i}" for i in range(args.sessions)]
+        report["websocket_open_ms"] = asyncio.run(_open_websockets(server.base_url, token, ws_ids)) * 1000
+
+        single, elapsed = _post(server.base_url, "/sessions/batch/create", token, {"sessions": [{"session_id": "single"}]})
+        report["batch_create_one_ms"] = elapsed * 1000
+        _post(server.base_url, "/sessions/batch/close", token, {"session_ids": ["single"]})
+
+        ids = [f"batch-{i}" for i in range(args.sessions)]
+        steps = [
+            ("create", "/sessions/batch/create", {"sessions": [{"session_id": session_id} for session_id in ids]}),
+            ("input", "/sessions/batch/input", {"session_ids": ids, "data": "echo ready\n"}),
+            ("resize", "/sessions/batch/resize", {"sessions": [{"session_id": session_id, "rows": 40, "cols": 120} for session_id in ids]}),
+            ("close", "/sessions/batch/close", {"session_ids": ids}),
+        ]
+        for name, path, body in steps:
+            result, elapsed = _post(server.base_url, path, token, body)
+            report[f"batch_{name}_ms"] = elapsed * 1000
+            report[f"batch_{name}_failed"] = result["failed"]
+    finally:
+        server.stop()
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch session operations benchmark")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    output = json.dumps(run(args), indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+if __name__ == "__main__":
+    main()
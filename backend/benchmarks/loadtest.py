@@ -0,0 +1,339 @@
+"""WebSocket 终端服务负载测试
+
+在本机回环地址上启动一个独立的后端进程（临时工作目录，独立数据库），
+打开 N 个会话、每个会话 M 个客户端（可另加只读观察者），按工作负载驱动输入，
+输出机器可读的 JSON 报告：吞吐、回显延迟分位数、服务端 CPU/RSS 和数据库写入速率。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.loadtest --sessions 4 --clients 2 --duration 20 --workload mixed --output report.json
+    python -m benchmarks.loadtest --baseline report.json   # 与之前的报告对比
+    python -m benchmarks.loadtest --sessions 1 --observers 200 --workload cat   # 观察者广播
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import psutil
+import websockets
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKLOADS = ("typing", "yes", "cat", "resize")
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _percentile(values: list, percent: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(round(percent / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+def _http_get(url: str) -> str:
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return response.read().decode()
+
+def _http_post_json(url: str, body: dict) -> dict:
+    request = urllib.request.Request(
+        url, data=json.dumps(body).encode(), headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return json.loads(response.read())
+
+def _metric_value(metrics_text: str, name: str) -> float:
+    """读取 /metrics 中不带标签的样本值"""
+    match = re.search(rf"^{re.escape(name)} (\S+)$", metrics_text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+class ServerProcess:
+    """在临时目录中启动后端，避免影响开发数据库"""
+
+    def __init__(self, port: int, buffer_size: int):
+        self.port = port
+        self.workdir = tempfile.mkdtemp(prefix="acweb-loadtest-")
+        with open(os.path.join(self.workdir, "terminal_config.json"), "w") as f:
+            json.dump({"shell": "/bin/sh", "buffer_size": buffer_size, "default_path": self.workdir}, f)
+        self.process = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self) -> float:
+        """启动后端并等待 /health 可以访问，返回从启动进程到第一次请求成功的秒数"""
+        env = dict(os.environ, PYTHONPATH=BACKEND_DIR, SHELL="/bin/sh")
+        started = time.perf_counter()
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(self.port),
+             "--log-level", "warning"],
+            cwd=self.workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.time() + 30
+        while time.time() < deadline:
+            try:
+                _http_get(f"{self.base_url}/health")
+                return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.01)
+        raise RuntimeError("server did not start within 30s")
+
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+class ResourceSampler:
+    """定期采样服务端进程（不含 shell 子进程）的 CPU 和 RSS"""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.cpu = []
+        self.rss = []
+
+    async def run(self, stop: asyncio.Event):
+        self.process.cpu_percent(None)
+        while not stop.is_set():
+            await asyncio.sleep(self.interval)
+            try:
+                self.cpu.append(self.process.cpu_percent(None))
+                self.rss.append(self.process.memory_info().rss)
+            except psutil.Error:
+                break
+
+class ClientStats:
+    def __init__(self, workload: str):
+        self.workload = workload
+        self.bytes_received = 0
+        self.frames = 0
+        self.echo_latencies = []
+        self.errors = 0
+
+async def run_client(ws_url: str, stats: ClientStats, driver: bool, workload: str, stop: asyncio.Event, big_file: str,
+                     session_ready: asyncio.Event, observer: bool = False):
+    """一个 WebSocket 客户端；driver 为 True 时负责向会话发送负载，会话创建后设置 session_ready"""
+    sent_at = {}
+    if observer:
+        # 观察者只能连接已存在的会话
+        await session_ready.wait()
+    async with websockets.connect(ws_url, max_size=None) as ws:
+        if driver:
+            await ws.recv()
+            session_ready.set()
+        async def receive():
+            async for raw in ws:
+                message = json.loads(raw)
+                if message.get("type") in ("output", "resume", "reconnect"):
+                    stats.bytes_received += len(message.get("data", "").encode())
+                    stats.frames += 1
+                    seq = message.get("echo_seq")
+                    if seq in sent_at:
+                        stats.echo_latencies.append(time.perf_counter() - sent_at.pop(seq))
+
+        receiver = asyncio.create_task(receive())
+        try:
+            if driver:
+                await drive(ws, workload, stop, sent_at, big_file)
+            else:
+                await stop.wait()
+            if driver and workload in ("yes", "cat"):
+                await ws.send(json.dumps({"type": "input", "data": "\x03"}))
+            await asyncio.sleep(0.2)
+        except websockets.ConnectionClosed:
+            stats.errors += 1
+        finally:
+            receiver.cancel()
+
+async def drive(ws, workload: str, stop: asyncio.Event, sent_at: dict, big_file: str):
+    """按工作负载驱动会话输入"""
+    await asyncio.sleep(0.5)
+    if workload == "yes":
+        await ws.send(json.dumps({"type": "input", "data": "yes\n"}))
+        await stop.wait()
+    elif workload == "cat":
+        await ws.send(json.dumps({"type": "input", "data": f"while true; do cat {big_file}; done\n"}))
+        await stop.wait()
+    elif workload == "resize":
+        while not stop.is_set():
+            await ws.send(json.dumps({"type": "resize", "rows": random.randint(20, 60), "cols": random.randint(60, 200)}))
+            await asyncio.sleep(0.01)
+    else:
+        # 交互式输入：每 50ms 一个字符，定期用 Ctrl-U 清空当前行
+        seq = 0
+        while not stop.is_set():
+            seq += 1
+            data = "\x15" if seq % 60 == 0 else random.choice("abcdefghijklmnopqrstuvwxyz")
+            sent_at[seq] = time.perf_counter()
+            await ws.send(json.dumps({"type": "input", "data": data, "seq": seq, "ts": int(time.time() * 1000)}))
+            await asyncio.sleep(0.05)
+
+async def run_load(args, server: ServerProcess) -> dict:
+    token = _http_post_json(f"{server.base_url}/api/v1/auth/login",
+                            {"username": args.username, "password": args.password})["access_token"]
+    big_file = os.path.join(server.workdir, "big.txt")
+    with open(big_file, "w") as f:
+        line = "".join(chr(32 + i % 95) for i in range(120)) + "\n"
+        f.write(line * (args.cat_size_mb * 1024 * 1024 // len(line)))
+
+    run_id = int(time.time())
+    stop = asyncio.Event()
+    sampler = ResourceSampler(server.process.pid)
+    metrics_before = _http_get(f"{server.base_url}/metrics")
+
+    stats = []
+    clients = []
+    for i in range(args.sessions):
+        workload = WORKLOADS[i % len(WORKLOADS)] if args.workload == "mixed" else args.workload
+        ws_url = f"ws://127.0.0.1:{server.port}/api/v1/terminal/ws/loadtest-{run_id}-{i}?token={token}"
+        session_ready = asyncio.Event()
+        for j in range(args.clients):
+            client_stats = ClientStats(workload)
+            stats.append(client_stats)
+            clients.append(run_client(ws_url, client_stats, j == 0, workload, stop, big_file, session_ready))
+        observe_url = f"ws://127.0.0.1:{server.port}/api/v1/terminal/observe/loadtest-{run_id}-{i}?token={token}"
+        for _ in range(args.observers):
+            client_stats = ClientStats("observer")
+            stats.append(client_stats)
+            clients.append(run_client(observe_url, client_stats, False, workload, stop, big_file, session_ready, observer=True))
+
+    started = time.perf_counter()
+    sampler_task = asyncio.create_task(sampler.run(stop))
+    client_tasks = [asyncio.create_task(client) for client in clients]
+    await asyncio.sleep(args.duration)
+    stop.set()
+    await asyncio.gather(*client_tasks, return_exceptions=True)
+    await sampler_task
+    elapsed = time.perf_counter() - started
+    metrics_after = _http_get(f"{server.base_url}/metrics")
+
+    db_saves = (_metric_value(metrics_after, "terminal_db_save_seconds_count")
+                - _metric_value(metrics_before, "terminal_db_save_seconds_count"))
+    latencies = [value for client in stats for value in client.echo_latencies]
+    total_bytes = sum(client.bytes_received for client in stats)
+
+    by_workload = {}
+    for client in stats:
+        entry = by_workload.setdefault(client.workload, {"clients": 0, "bytes": 0, "frames": 0})
+        entry["clients"] += 1
+        entry["bytes"] += client.bytes_received
+        entry["frames"] += client.frames
+    for entry in by_workload.values():
+        entry["throughput_mb_s"] = entry["bytes"] / elapsed / 1e6
+
+    def ms(value):
+        return None if value is None else value * 1000
+
+    return {
+        "config": {
+            "sessions": args.sessions,
+            "clients_per_session": args.clients,
+            "observers_per_session": args.observers,
+            "duration_s": args.duration,
+            "workload": args.workload,
+            "buffer_size": args.buffer_size,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": psutil.cpu_count(),
+        },
+        "elapsed_s": elapsed,
+        "throughput": {
+            "bytes_delivered": total_bytes,
+            "mb_per_s": total_bytes / elapsed / 1e6,
+            "by_workload": by_workload,
+        },
+        "echo_latency_ms": {
+            "count": len(latencies),
+            "p50": ms(_percentile(latencies, 50)),
+            "p90": ms(_percentile(latencies, 90)),
+            "p99": ms(_percentile(latencies, 99)),
+            "max": ms(max(latencies)) if latencies else None,
+        },
+        "server": {
+            "cpu_percent_avg": sum(sampler.cpu) / len(sampler.cpu) if sampler.cpu else None,
+            "cpu_percent_max": max(sampler.cpu) if sampler.cpu else None,
+            "rss_bytes_avg": sum(sampler.rss) / len(sampler.rss) if sampler.rss else None,
+            "rss_bytes_max": max(sampler.rss) if sampler.rss else None,
+        },
+        "db": {
+            "saves": db_saves,
+            "saves_per_s": db_saves / elapsed,
+        },
+        "client_errors": sum(client.errors for client in stats),
+    }
+
+def compare(report: dict, baseline: dict) -> list:
+    """与基线报告对比关键指标"""
+    rows = []
+    for label, path in (
+        ("throughput MB/s", ("throughput", "mb_per_s")),
+        ("echo p50 ms", ("echo_latency_ms", "p50")),
+        ("echo p99 ms", ("echo_latency_ms", "p99")),
+        ("server CPU % avg", ("server", "cpu_percent_avg")),
+        ("server RSS max", ("server", "rss_bytes_max")),
+        ("DB saves/s", ("db", "saves_per_s")),
+    ):
+        current, previous = report, baseline
+        for key in path:
+            current = (current or {}).get(key)
+            previous = (previous or {}).get(key)
+        change = None
+        if current is not None and previous:
+            change = (current - previous) / previous * 100
+        rows.append({"metric": label, "baseline": previous, "current": current, "change_percent": change})
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the WebSocket terminal service")
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--clients", type=int, default=1, help="clients per session")
+    parser.add_argument("--observers", type=int, default=0, help="read-only observers per session")
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds of load")
+    parser.add_argument("--workload", choices=WORKLOADS + ("mixed",), default="mixed")
+    parser.add_argument("--buffer-size", type=int, default=2500)
+    parser.add_argument("--cat-size-mb", type=int, default=8)
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin123")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="compare against a previous JSON report")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    server = ServerProcess(args.port or _free_port(), args.buffer_size)
+    server.start()
+    try:
+        report = asyncio.run(run_load(args, server))
+    finally:
+        server.stop()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(report, json.load(f))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""登录吞吐和事件循环延迟测试
+
+在本机回环地址上启动独立的后端进程，并发发起登录请求，同时每隔 10ms 请求一次 /health，
+以 /health 的响应时间衡量登录期间事件循环（也就是终端 I/O）受到的影响。
+输出 JSON 报告：登录吞吐、登录延迟分位数、被拒绝的请求数，以及空闲和登录期间的 /health 延迟。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.loginbench --logins 64 --concurrency 16
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from .loadtest import ServerProcess, _free_port, _percentile
+
+def _login(base_url: str, username: str, password: str) -> tuple:
+    """返回 (HTTP 状态码, 耗时)"""
+    request = urllib.request.Request(
+        f"{base_url}/api/v1/auth/login",
+        data=json.dumps({"username": username, "password": password}).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=120) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - started
+
+class LoopProbe:
+    """定期请求 /health，记录响应时间"""
+
+    def __init__(self, base_url: str, interval: float):
+        self.base_url = base_url
+        self.interval = interval
+        self.samples = []
+        self.stop = threading.Event()
+        self.thread = None
+
+    def _run(self):
+        while not self.stop.is_set():
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(f"{self.base_url}/health", timeout=30) as response:
+                    response.read()
+                self.samples.append(time.perf_counter() - started)
+            except OSError:
+                pass
+            time.sleep(self.interval)
+
+    def start(self):
+        self.samples = []
+        self.stop.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def finish(self) -> list:
+        self.stop.set()
+        self.thread.join()
+        return self.samples
+
+def _summary_ms(samples: list) -> dict:
+    def ms(value):
+        return None if value is None else value * 1000
+    return {
+        "count": len(samples),
+        "p50": ms(_percentile(samples, 50)),
+        "p90": ms(_percentile(samples, 90)),
+        "p99": ms(_percentile(samples, 99)),
+        "max": ms(max(samples)) if samples else None,
+    }
+
+def run(args, server: ServerProcess) -> dict:
+    probe = LoopProbe(server.base_url, args.probe_interval)
+    probe.start()
+    time.sleep(1.0)
+    idle = probe.finish()
+
+    probe.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        futures = [executor.submit(_login, server.base_url, args.username, args.password) for _ in range(args.logins)]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+    loaded = probe.finish()
+
+    succeeded = [duration for status, duration in results if status == 200]
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    return {
+        "config": {
+            "logins": args.logins,
+            "concurrency": args.concurrency,
+        },
+        "elapsed_s": elapsed,
+        "statuses": statuses,
+        "logins_per_s": len(succeeded) / elapsed,
+        "login_latency_ms": _summary_ms(succeeded),
+        "loop_probe_ms": {
+            "idle": _summary_ms(idle),
+            "during_logins": _summary_ms(loaded),
+        },
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Login throughput and event-loop latency benchmark")
+    parser.add_argument("--logins", type=int, default=64, help="total login requests")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent login requests")
+    parser.add_argument("--probe-interval", type=float, default=0.01, help="seconds between /health probes")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin123")
+    parser.add_argument("--port", type=int, default=0, help="0 picks a free port")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    server = ServerProcess(args.port or _free_port(), 1000)
+    server.start()
+    try:
+        report = run(args, server)
+    finally:
+        server.stop()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+if __name__ == "__main__":
+    main()
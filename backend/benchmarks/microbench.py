@@ -0,0 +1,247 @@
+"""TerminalSession 与持久化内部热路径的微基准
+
+PTY 数据通过 os.openpty() 创建的 fd 对输入，数据库使用临时目录中的独立文件。
+每个基准自动校准迭代次数，取多轮中最快一轮的单次耗时，与 baseline.json 对比，
+超过容差即以非零状态退出。对比前先用一段固定的纯 Python 计算（calibration）估计
+本次运行相对基线机器的快慢，再按这个比例换算各项耗时，机器或负载不同时不会整体误报。
+依赖磁盘和 PTY 调度的基准抖动较大，只输出结果，不参与回归判定。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.microbench                    # 运行并与基线对比
+    python -m benchmarks.microbench --update-baseline  # 重新生成基线
+    python -m benchmarks.microbench --filter get_new_output --threshold 0.5
+"""
+import argparse
+import atexit
+import json
+import os
+import select
+import shutil
+import sys
+import tempfile
+import time
+import tty
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# 数据库路径相对于当前目录，必须在导入 app 之前切换到临时目录
+_WORKDIR = tempfile.mkdtemp(prefix="acweb-microbench-")
+atexit.register(shutil.rmtree, _WORKDIR, True)
+os.chdir(_WORKDIR)
+sys.path.insert(0, BACKEND_DIR)
+
+from app.db.database import init_db  # noqa: E402
+from app.services.terminal import TerminalSession  # noqa: E402
+from app.services.scheduler import READ_SIZE  # noqa: E402
+from app.core.security import create_access_token, decode_access_token, token_cache  # noqa: E402
+
+CHUNK = ("drwxr-xr-x  2 user staff  4096 Jan  1 00:00 some-directory-name\n" * 64)[:4096]
+
+def _make_session(history: int, buffer_size: int = 2500) -> TerminalSession:
+    """构造一个已填充 history 块输出的会话（不启动 shell）"""
+    session = TerminalSession("bench", "bench", "bench", buffer_size)
+    session.running = True
+    size = len(CHUNK.encode("utf-8"))
+    for _ in range(history):
+        session.buffer.append(CHUNK)
+        session.output_offset += size
+        session.output_history.append({
+            "index": session.output_index,
+            "data": CHUNK,
+            "offset": session.output_offset,
+            "timestamp": time.time(),
+        })
+        session.output_index += 1
+    return session
+
+def bench_read_available(history: int):
+    """调度器对就绪会话的读取：read_available(READ_SIZE) 与缓冲区维护"""
+    master, slave = os.openpty()
+    tty.setraw(slave)  # 关闭换行转换，读取字节数与写入一致
+    os.set_blocking(master, False)
+    session = _make_session(history)
+    session.fd = master
+    payload = CHUNK.encode()
+
+    def run():
+        os.write(slave, payload)
+        # PTY 异步转发数据，可能分多次读到
+        remaining = len(payload)
+        while remaining > 0:
+            select.select([master], [], [], 1)
+            remaining -= session.read_available(READ_SIZE) or 0
+
+    def cleanup():
+        os.close(master)
+        os.close(slave)
+
+    return run, cleanup
+
+def bench_get_new_output(history: int, clients: int):
+    """每个客户端落后一块时为所有客户端取新输出"""
+    session = _make_session(history)
+    client_ids = [f"client-{i}" for i in range(clients)]
+
+    def run():
+        behind = session.output_index - 2
+        for client_id in client_ids:
+            session.connected_clients[client_id] = behind
+            session.get_new_output_for_client(client_id)
+
+    return run, None
+
+def bench_get_buffer(history: int):
+    session = _make_session(history)
+    return session.get_buffer, None
+
+def bench_save_buffer(history: int):
+    """追加一块输出后保存到数据库"""
+    session = _make_session(history)
+    session.persisted_offset = session.output_offset
+    size = len(CHUNK.encode("utf-8"))
+
+    def run():
+        with session.lock:
+            session.buffer.append(CHUNK)
+            session.buffer.pop(0)
+            session.output_offset += size
+            session.output_history.append({
+                "index": session.output_index,
+                "data": CHUNK,
+                "offset": session.output_offset,
+                "timestamp": time.time(),
+            })
+            session.output_history.pop(0)
+            session.output_index += 1
+        session._save_buffer_to_db()
+
+    return run, None
+
+def bench_decode_token(cached: bool):
+    token = create_access_token({"sub": "admin"})
+    if cached:
+        return lambda: decode_access_token(token), None
+
+    def run():
+        token_cache.clear()
+        decode_access_token(token)
+    return run, None
+
+def _calibration_loop():
+    """固定的纯 Python 计算，用来估计当前机器与负载下的相对速度"""
+    total = 0
+    for i in range(20000):
+        total += i * i % 7
+    return total
+
+CALIBRATION = "calibration"
+
+BENCHMARKS = {
+    "read_available[history=2500]": lambda: bench_read_available(2500),
+    "get_new_output[history=100,clients=1]": lambda: bench_get_new_output(100, 1),
+    "get_new_output[history=2500,clients=1]": lambda: bench_get_new_output(2500, 1),
+    "get_new_output[history=2500,clients=10]": lambda: bench_get_new_output(2500, 10),
+    "get_new_output[history=2500,clients=50]": lambda: bench_get_new_output(2500, 50),
+    "get_buffer[history=100]": lambda: bench_get_buffer(100),
+    "get_buffer[history=2500]": lambda: bench_get_buffer(2500),
+    "save_buffer_to_db[history=2500]": lambda: bench_save_buffer(2500),
+    "decode_access_token": lambda: bench_decode_token(True),
+    "decode_access_token[uncached]": lambda: bench_decode_token(False),
+}
+
+# I/O 密集，耗时取决于磁盘与调度而不是代码本身，只作参考
+INFORMATIONAL = {
+    "read_available[history=2500]",
+    "save_buffer_to_db[history=2500]",
+}
+
+def measure(run, min_time: float, repeats: int) -> float:
+    """返回单次调用的最短平均耗时（秒）"""
+    iterations = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or iterations >= 1 << 20:
+            break
+        iterations *= 2
+
+    best = elapsed / iterations
+    for _ in range(repeats - 1):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            run()
+        best = min(best, (time.perf_counter() - start) / iterations)
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for terminal session internals")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--threshold", type=float, default=0.5,
+                        help="allowed slowdown relative to baseline (0.5 = 50%%)")
+    parser.add_argument("--min-time", type=float, default=0.1, help="minimum seconds per repeat")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args()
+
+    init_db()
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    calibration = measure(_calibration_loop, args.min_time, args.repeats)
+    results = {CALIBRATION: calibration}
+    # 大于 1 表示本次运行比生成基线时慢，各项耗时先除以它再与基线比较
+    speed = calibration / baseline[CALIBRATION] if baseline.get(CALIBRATION) else 1.0
+    regressions = []
+    print(f"calibration {calibration * 1e6:.2f}us, scale {speed:.2f}x relative to baseline\n")
+    print(f"{'benchmark':<45} {'time/op':>12} {'baseline':>12} {'change':>16}")
+    for name, factory in BENCHMARKS.items():
+        if args.filter and args.filter not in name:
+            continue
+        run, cleanup = factory()
+        try:
+            seconds = measure(run, args.min_time, args.repeats)
+        finally:
+            if cleanup:
+                cleanup()
+        results[name] = seconds
+
+        previous = baseline.get(name)
+        change = ""
+        if previous:
+            ratio = seconds / speed / previous - 1
+            change = f"{ratio * 100:+.1f}%"
+            if name in INFORMATIONAL:
+                change += " (info)"
+            elif ratio > args.threshold:
+                regressions.append(name)
+                change += " !"
+        print(f"{name:<45} {seconds * 1e6:>10.2f}us "
+              f"{(previous * 1e6 if previous else 0):>10.2f}us {change:>16}")
+
+    if args.update_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                merged = json.load(f)
+        else:
+            merged = {}
+        merged.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(merged, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return
+
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) slower than baseline by more than {args.threshold * 100:.0f}%:")
+        for name in regressions:
+            print(f"  {name}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""冷启动测试
+
+在临时工作目录中反复冷启动后端进程，测量从启动进程到第一次请求成功的时间，
+以及第一次列出会话（需要认证）的时间。数据库中可以预先放入上一个进程遗留的会话记录
+（pid 已不存在，其中一部分已超时），用来衡量启动时核对这些会话的开销。
+输出 JSON 报告，包含服务端在 /metrics 中报告的各启动阶段耗时。
+
+用法（在 backend 目录下）:
+    python -m benchmarks.startupbench --runs 5 --persisted 2000 --buffer-kb 16
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import sqlite3
+import time
+import urllib.request
+
+from .loadtest import ServerProcess, _free_port, _percentile, _http_get
+from app.core.security import create_access_token
+
+# 记录的 pid 超过 Linux 的 pid 上限，保证不对应任何进程
+DEAD_PID_BASE = 1 << 23
+
+def _seed(db_path: str, persisted: int, buffer_kb: int):
+    """写入上一个进程遗留的活跃会话记录，一半已超过默认会话超时"""
+    now = time.time()
+    buffer = ("x" * 79 + "\n") * (buffer_kb * 1024 // 80)
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO terminal_sessions (id, username, name, buffer, last_activity, created_at, is_active, pid, rows, cols) "
+        "VALUES (?, 'admin', ?, ?, ?, ?, 1, ?, 24, 80)",
+        [
+            (f"persisted-{i}", f"终端 {i}", buffer, now - (30 * 86400 if i % 2 else 60), now - 40 * 86400, DEAD_PID_BASE + i)
+            for i in range(persisted)
+        ],
+    )
+    conn.commit()
+    conn.close()
+
+def _startup_phases(metrics_text: str) -> dict:
+    return {
+        match.group(1): float(match.group(2))
+        for match in re.finditer(r'^app_startup_seconds\{phase="([^"]+)"\} (\S+)$', metrics_text, re.MULTILINE)
+    }
+
+def _timed_get(url: str, token: str) -> tuple:
+    started = time.perf_counter()
+    request = urllib.request.Request(url, headers={"Authorization": f"Bearer {token}"})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        body = json.loads(response.read())
+    return time.perf_counter() - started, body
+
+def run(args) -> dict:
+    # 先启动一次建立数据库结构，作为每次冷启动的模板
+    template = ServerProcess(_free_port(), 1000)
+    template.start()
+    template.process.terminate()
+    template.process.wait(timeout=10)
+    template_db = os.path.join(template.workdir, "terminal_sessions.db")
+    _seed(template_db, args.persisted, args.buffer_kb)
+
+    token = create_access_token({"sub": "admin"})
+    runs = []
+    try:
+        for _ in range(args.runs):
+            server = ServerProcess(_free_port(), 1000)
+            shutil.copy(template_db, os.path.join(server.workdir, "terminal_sessions.db"))
+            try:
+                to_health = server.start()
+                list_seconds, body = _timed_get(f"{server.base_url}/api/v1/terminal/sessions", token)
+                runs.append({
+                    "to_first_request_ms": to_health * 1000,
+                    "first_list_ms": list_seconds * 1000,
+                    "listed_sessions": len(body["sessions"]),
+                    "phases_ms": {
+                        phase: seconds * 1000
+                        for phase, seconds in _startup_phases(_http_get(f"{server.base_url}/metrics")).items()
+                    },
+                })
+            finally:
+                server.stop()
+    finally:
+        shutil.rmtree(template.workdir, ignore_errors=True)
+
+    def summary(values):
+        return {"p50": _percentile(values, 50), "min": min(values), "max": max(values)}
+
+    return {
+        "config": {"runs": args.runs, "persisted": args.persisted, "buffer_kb": args.buffer_kb},
+        "to_first_request_ms": summary([run["to_first_request_ms"] for run in runs]),
+        "first_list_ms": summary([run["first_list_ms"] for run in runs]),
+        "runs": runs,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--persisted", type=int, default=2000, help="session rows left by a previous process")
+    parser.add_argument("--buffer-kb", type=int, default=16, help="buffer column size of each persisted session")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run(args)
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,18 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 数据库、溢出文件等路径相对于当前目录，必须在导入 app 之前切换到临时目录
+_WORKDIR = tempfile.mkdtemp(prefix="acweb-tests-")
+atexit.register(shutil.rmtree, _WORKDIR, True)
+os.chdir(_WORKDIR)
+sys.path.insert(0, BACKEND_DIR)
+
+import app.db.models  # noqa: E402,F401
+from app.db.database import init_db  # noqa: E402
+
+init_db()
@@ -0,0 +1,19 @@
+import io
+
+from app import cli
+from app.core.security import verify_password
+from app.services.users import user_store
+
+def test_create_user_can_log_in(monkeypatch, capsys):
+    monkeypatch.setattr("sys.stdin", io.StringIO("s3cret\n"))
+    assert cli.main(["create-user", "cli-alice", "--password-stdin"]) == 0
+
+    user = user_store.get_user("cli-alice")
+    assert user is not None
+    assert verify_password("s3cret", user["hashed_password"])
+
+    # 重复创建时报错，不修改已有用户
+    monkeypatch.setattr("sys.stdin", io.StringIO("other\n"))
+    assert cli.main(["create-user", "cli-alice", "--password-stdin"]) == 1
+    assert "已存在" in capsys.readouterr().err
+    assert verify_password("s3cret", user_store.get_user("cli-alice")["hashed_password"])
@@ -0,0 +1,65 @@
+import os
+import random
+import select
+import time
+
+import pytest
+
+from app.services import terminal
+from app.services.terminal import InputOverflowError, TerminalSession
+
+def _wait_for(predicate, timeout: float = 10.0):
+    deadline = time.time() + timeout
+    while not predicate():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+@pytest.fixture
+def cat_session(tmp_path, monkeypatch):
+    """一个把输入原样写入文件的会话：raw 模式下的 cat，不回显也不做行规程转换"""
+    ready = tmp_path / "ready"
+    output = tmp_path / "output"
+    shell = tmp_path / "cat.sh"
+    shell.write_text(f"#!/bin/sh\nstty raw -echo\n: > '{ready}'\nexec cat > '{output}'\n")
+    shell.chmod(0o755)
+    monkeypatch.setenv("SHELL", str(shell))
+
+    session = TerminalSession("input-backpressure", "tester", "cat")
+    session.start(persist=False)
+    _wait_for(ready.exists)
+    try:
+        yield session, output
+    finally:
+        session.close(persist=False)
+        os.waitpid(session.child_pid, 0)
+
+def test_large_input_reaches_pty_byte_for_byte(cat_session):
+    session, output = cat_session
+    rng = random.Random(0)
+    alphabet = "abcdefghijklmnopqrstuvwxyz0123456789 \r\n\t\x1b[;终端输入"
+    pieces = ["".join(rng.choice(alphabet) for _ in range(256 * 1024)) for _ in range(12)]
+    expected = "".join(pieces).encode()
+    assert len(expected) > 3 * 1024 * 1024
+
+    for piece in pieces:
+        session.write(piece)
+    assert session.pending_input_size() > 0
+
+    while session.pending_input_size():
+        select.select([], [session.fd], [], 1)
+        with session.input_lock:
+            session._flush_input()
+
+    _wait_for(lambda: output.stat().st_size >= len(expected))
+    assert output.read_bytes() == expected
+
+def test_write_rejects_input_above_cap(cat_session, monkeypatch):
+    session, _ = cat_session
+    monkeypatch.setattr(terminal, "INPUT_MAX_PENDING", 1024)
+    with session.input_lock:
+        session.pending_input += b"x" * 1000
+
+    with pytest.raises(InputOverflowError):
+        session.write("y" * 100)
+    # 被拒绝的输入整条丢弃，已排队的部分保持不变
+    assert session.pending_input_size() == 1000
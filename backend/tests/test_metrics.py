@@ -0,0 +1,20 @@
+from fastapi.testclient import TestClient
+
+from app.core.security import create_access_token
+from app.main import app
+
+def test_metrics_do_not_expose_sessions_or_users(tmp_path, monkeypatch):
+    shell = tmp_path / "idle.sh"
+    shell.write_text("#!/bin/sh\nexec sleep 30\n")
+    shell.chmod(0o755)
+    monkeypatch.setenv("SHELL", str(shell))
+
+    token = create_access_token({"sub": "metrics-user"})
+    client = TestClient(app)
+    with client.websocket_connect(f"/api/v1/terminal/ws/metrics-session?token={token}") as ws:
+        ws.receive_json()
+        body = client.get("/metrics").text
+        assert "terminal_ws_queue_depth " in body
+        assert "metrics-session" not in body
+        assert "metrics-user" not in body
+        ws.send_json({"type": "close"})
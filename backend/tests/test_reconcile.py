@@ -0,0 +1,66 @@
+import os
+import time
+
+from app.db.database import SessionLocal
+from app.db.models import TerminalSessionDB
+from app.services.terminal import TerminalManager
+
+def _exited_pid() -> int:
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)
+    os.waitpid(pid, 0)
+    return pid
+
+def _insert(db, session_id: str, pid: int, last_activity: float):
+    db.add(TerminalSessionDB(
+        id=session_id, username="tester", name=session_id, last_activity=last_activity,
+        created_at=last_activity, is_active=True, pid=pid, rows=24, cols=80
+    ))
+
+def test_expire_clears_pids_of_exited_shells():
+    manager = TerminalManager()
+    now = time.time()
+    dead_pid = _exited_pid()
+    db = SessionLocal()
+    try:
+        _insert(db, "reconcile-stale", dead_pid, now - 10)
+        _insert(db, "reconcile-survivor", os.getpid(), now - 10)
+        _insert(db, "reconcile-expired", dead_pid, now - manager.session_timeout - 10)
+        _insert(db, "reconcile-reattached", dead_pid, now - 10)
+        db.commit()
+    finally:
+        db.close()
+
+    result = manager.reconcile_persisted_sessions()
+    assert result["survivors"] >= 1
+    assert "reconcile-survivor" in manager.surviving_session_ids
+
+    # 核对之后客户端重连，以同一 ID 重建了 shell
+    db = SessionLocal()
+    try:
+        db.query(TerminalSessionDB).filter(TerminalSessionDB.id == "reconcile-reattached").update(
+            {TerminalSessionDB.pid: os.getpid(), TerminalSessionDB.last_activity: time.time()}
+        )
+        db.commit()
+    finally:
+        db.close()
+
+    manager.expire_persisted_sessions()
+
+    db = SessionLocal()
+    try:
+        rows = {
+            row.id: (row.is_active, row.pid)
+            for row in db.query(TerminalSessionDB.id, TerminalSessionDB.is_active, TerminalSessionDB.pid).filter(
+                TerminalSessionDB.id.like("reconcile-%")
+            )
+        }
+    finally:
+        db.close()
+    assert rows == {
+        "reconcile-stale": (True, None),
+        "reconcile-survivor": (True, os.getpid()),
+        "reconcile-expired": (False, None),
+        "reconcile-reattached": (True, os.getpid()),
+    }
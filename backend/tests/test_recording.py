@@ -0,0 +1,39 @@
+import time
+
+from app.services.recording import SessionRecorder, read_recording_header
+from app.services.terminal import TerminalSession
+
+def test_events_after_stop_do_not_reopen_recording(monkeypatch):
+    session = TerminalSession("recording-stop", "tester", "recording")
+    session.start_recording()
+    recorder = session.recorder
+    submitted = []
+    monkeypatch.setattr("app.services.recording.recording_writer.submit", submitted.append)
+
+    session.stop_recording()
+    assert session.recorder is None
+    # 读取线程在停止前取出了录制对象，停止后才提交输出
+    recorder.record_output("after stop", 0)
+    assert [event[1] for event in submitted] == ["close", "o"]
+
+    # 在当前线程按写入线程的顺序处理：停止前的输出、关闭、停止后的输出
+    recorder._write_event("o", time.time(), "before stop", 0)
+    recorder._close()
+    recorder._write_event("o", time.time(), "after stop", 0)
+    assert recorder.cast_file is None
+    with open(recorder.cast_path) as f:
+        lines = f.read().splitlines()
+    assert read_recording_header(recorder.cast_path)["width"] == session.cols
+    assert len(lines) == 2 and "before stop" in lines[1]
+
+def test_similar_session_ids_record_to_separate_files():
+    recorders = [SessionRecorder(session_id, 80, 24) for session_id in ("rec:a", "rec.a", "rec_a")]
+    assert len({recorder.cast_path for recorder in recorders}) == 3
+    for recorder in recorders:
+        recorder._write_event("o", time.time(), recorder.session_id, 0)
+        recorder._close()
+
+    for recorder in recorders:
+        assert read_recording_header(recorder.cast_path)["session_id"] == recorder.session_id
+        with open(recorder.cast_path) as f:
+            assert len(f.read().splitlines()) == 2
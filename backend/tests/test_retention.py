@@ -0,0 +1,27 @@
+import time
+
+from app.db.database import SessionLocal
+from app.db.models import TerminalSessionDB
+from app.services.retention import RetentionJob, load_archive_metadata
+
+def test_similar_session_ids_keep_separate_archives():
+    session_ids = ["archive:a", "archive.a", "archive_a"]
+    last_activity = time.time() - 3600
+    db = SessionLocal()
+    try:
+        for session_id in session_ids:
+            db.add(TerminalSessionDB(
+                id=session_id, username="tester", name=session_id, last_activity=last_activity,
+                created_at=last_activity, is_active=False, rows=24, cols=80
+            ))
+        db.commit()
+    finally:
+        db.close()
+
+    job = RetentionJob()
+    for session_id in session_ids:
+        job._archive_session(session_id, time.time())
+
+    for session_id in session_ids:
+        metadata = load_archive_metadata(session_id)
+        assert metadata is not None and metadata["name"] == session_id
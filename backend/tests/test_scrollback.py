@@ -0,0 +1,22 @@
+from app.db.database import SessionLocal
+from app.db.models import TerminalOutputChunkDB
+from app.services.terminal import terminal_manager
+
+def test_iter_scrollback_pages_through_ranges():
+    chunks = [f"{i:03d}-chunk\n" for i in range(200)]  # 每块 10 字节
+    db = SessionLocal()
+    try:
+        offset = 0
+        for data in chunks:
+            db.add(TerminalOutputChunkDB(
+                session_id="scrollback-pages", start_offset=offset, end_offset=offset + len(data), data=data
+            ))
+            offset += len(data)
+        db.commit()
+    finally:
+        db.close()
+
+    full = "".join(chunks).encode()
+    for start, end in [(0, len(full)), (5, 1995), (640, 655), (1000, 1000), (1990, 5000)]:
+        data = b"".join(terminal_manager.iter_scrollback("scrollback-pages", start, end, page_size=7))
+        assert data == full[start:min(end, len(full))]
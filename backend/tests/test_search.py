@@ -0,0 +1,23 @@
+from app.services.search import OutputIndexer, init_search_index
+
+def _indexer() -> OutputIndexer:
+    indexer = OutputIndexer()
+    indexer.tokenizer = init_search_index()
+    indexer.enabled = indexer.tokenizer is not None
+    return indexer
+
+def test_escape_split_across_chunks_is_not_indexed():
+    indexer = _indexer()
+    indexer._index_batch([
+        ("search-split", "tester", 0, 12, "build \x1b[38;5"),
+        ("search-split", "tester", 12, 30, ";196mFAILED\x1b[0m\r\n"),
+        ("search-split", "tester", 30, 45, "title \x1b]0;secretname"),
+        ("search-split", "tester", 45, 60, "trail\x07 done\r\n"),
+    ])
+
+    assert indexer.search("tester", "196m") == []
+    assert indexer.search("tester", "secretname") == []
+    assert indexer.search("tester", "trail") == []
+    assert [hit["offset"] for hit in indexer.search("tester", "FAILED")] == [12]
+    assert [hit["offset"] for hit in indexer.search("tester", "done")] == [45]
+    assert indexer.escape_carry == {}
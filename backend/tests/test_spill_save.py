@@ -0,0 +1,61 @@
+import time
+
+from app.db.database import SessionLocal
+from app.db.models import TerminalSessionDB
+from app.services.spill import SpillFile
+from app.services.terminal import TerminalSession
+
+CHUNK = "0123456789abcdef" * 256  # 4KB
+
+def _append_output(session: TerminalSession, count: int):
+    size = len(CHUNK.encode("utf-8"))
+    for _ in range(count):
+        session.buffer.append(CHUNK)
+        session.output_offset += size
+        session.output_history.append({
+            "index": session.output_index,
+            "data": CHUNK,
+            "offset": session.output_offset,
+            "timestamp": time.time(),
+        })
+        session.output_index += 1
+
+def _stored_buffer(session_id: str) -> str:
+    db = SessionLocal()
+    try:
+        return db.query(TerminalSessionDB.buffer).filter(TerminalSessionDB.id == session_id).scalar()
+    finally:
+        db.close()
+
+def test_periodic_save_keeps_spilled_output_on_disk(monkeypatch):
+    session = TerminalSession("spill-save", "tester", "spill", buffer_size=1000)
+    _append_output(session, 200)
+    session._save_buffer_to_db()
+    assert session.spill_scrollback() == 200 * len(CHUNK)
+    assert session.resident_bytes() == 0
+
+    # 定期保存不能把换出的部分读回内存
+    monkeypatch.setattr(session.spill, "read_text", lambda: (_ for _ in ()).throw(AssertionError("spill read")))
+    _append_output(session, 3)
+    for _ in range(5):
+        session._save_buffer_to_db(include_buffer=True)
+        assert session.resident_bytes() == 3 * len(CHUNK)
+    assert session.spilled_bytes() == 200 * len(CHUNK)
+    assert _stored_buffer(session.session_id) == CHUNK * 3
+    monkeypatch.undo()
+
+    # 关闭时连同磁盘部分一起保存
+    session._save_buffer_to_db(include_spilled=True)
+    assert _stored_buffer(session.session_id) == CHUNK * 203
+    session.spill.close()
+
+def test_spill_files_do_not_collide_for_similar_ids():
+    spills = [SpillFile(session_id) for session_id in ("a:b", "a.b", "a_b")]
+    try:
+        assert len({spill.path for spill in spills}) == 3
+        for i, spill in enumerate(spills):
+            spill.append([f"session {i}"])
+        assert [spill.read_text() for spill in spills] == ["session 0", "session 1", "session 2"]
+    finally:
+        for spill in spills:
+            spill.close()
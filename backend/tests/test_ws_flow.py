@@ -0,0 +1,31 @@
+from fastapi.testclient import TestClient
+
+from app.core.security import create_access_token
+from app.main import app
+from app.services.terminal import INPUT_HIGH_WATER, terminal_manager
+
+def _receive_until(ws, message_type: str) -> dict:
+    while True:
+        message = ws.receive_json()
+        if message["type"] == message_type:
+            return message
+
+def test_paused_input_keeps_processing_messages(tmp_path, monkeypatch):
+    # shell 不读取标准输入，粘贴的内容一直积压
+    shell = tmp_path / "stall.sh"
+    shell.write_text("#!/bin/sh\nstty raw -echo\nexec sleep 30\n")
+    shell.chmod(0o755)
+    monkeypatch.setenv("SHELL", str(shell))
+
+    token = create_access_token({"sub": "tester"})
+    client = TestClient(app)
+    with client.websocket_connect(f"/api/v1/terminal/ws/ws-flow?token={token}") as ws:
+        ws.send_json({"type": "input", "data": "x" * (4 * INPUT_HIGH_WATER)})
+        assert _receive_until(ws, "flow")["state"] == "pause"
+
+        # 暂停期间仍然响应心跳和关闭
+        ws.send_json({"type": "ping"})
+        _receive_until(ws, "pong")
+        ws.send_json({"type": "close"})
+
+    assert "ws-flow" not in terminal_manager.sessions
@@ -46,6 +46,25 @@ export const terminalApi = {
   getSessionStatus: (sessionId) => {
     const token = localStorage.getItem('token')
     return api.get(`/api/v1/terminal/session/${sessionId}/status?token=${token}`)
+  },
+  
+  // 按字节范围读取历史输出（向上滚动时按需加载）
+  getScrollback: (sessionId, start, end) => {
+    const token = localStorage.getItem('token')
+    return api.get(`/api/v1/terminal/session/${sessionId}/scrollback?token=${token}`, {
+      headers: { Range: `bytes=${start}-${end - 1}` },
+      responseType: 'text'
+    })
+  },
+  
+  // 全文检索会话输出历史
+  searchOutput: (q, sessionId = null) => {
+    const token = localStorage.getItem('token')
+    const params = { q, token }
+    if (sessionId) {
+      params.session_id = sessionId
+    }
+    return api.get('/api/v1/terminal/search', { params })
   }
 }
 
@@ -0,0 +1,195 @@
+// 多路复用终端连接：所有标签页共用一个 WebSocket，每个会话是其中的一个通道
+// openChannel 返回的对象与 WebSocket 接口一致（send / close / readyState / on* 回调），
+// 终端页面可以像使用独立连接一样使用它
+
+const MUX_URL = 'ws://localhost:8000/api/v1/terminal/mux'
+const HEARTBEAT_INTERVAL = 30000
+
+let socket = null
+let socketToken = null
+let socketCompress = false
+let heartbeat = null
+let nextChannel = 1
+const channels = new Map()
+
+// 压缩的二进制帧：4 字节大端序原始长度 + raw deflate 数据（同步刷新结尾）
+// 整个连接共用一个解压流，与服务端的压缩上下文对应
+class Inflater {
+  constructor () {
+    const stream = new DecompressionStream('deflate-raw')
+    this.writer = stream.writable.getWriter()
+    this.reader = stream.readable.getReader()
+    this.decoder = new TextDecoder()
+  }
+
+  async inflate (buffer) {
+    const length = new DataView(buffer).getUint32(0)
+    this.writer.write(new Uint8Array(buffer, 4))
+    const output = new Uint8Array(length)
+    let received = 0
+    while (received < length) {
+      const { value, done } = await this.reader.read()
+      if (done) {
+        throw new Error('inflate stream closed')
+      }
+      output.set(value, received)
+      received += value.length
+    }
+    return this.decoder.decode(output)
+  }
+}
+
+const ensureSocket = (token, compress) => {
+  if (socket && socketToken === token && socketCompress === compress && socket.readyState <= WebSocket.OPEN) {
+    return socket
+  }
+
+  socketToken = token
+  socketCompress = compress
+  socket = new WebSocket(`${MUX_URL}?token=${token}${compress ? '&compress=deflate' : ''}`)
+  socket.binaryType = 'arraybuffer'
+  const current = socket
+  const inflater = compress ? new Inflater() : null
+  // 解压是异步的，按到达顺序依次处理消息
+  let received = Promise.resolve()
+
+  current.onopen = () => {
+    for (const channel of channels.values()) {
+      if (channel.socket === current) {
+        channel._open()
+      }
+    }
+    // 整个连接共用一个心跳
+    heartbeat = setInterval(() => {
+      if (current.readyState === WebSocket.OPEN) {
+        current.send(JSON.stringify({ type: 'ping' }))
+      }
+    }, HEARTBEAT_INTERVAL)
+  }
+
+  const dispatch = (text) => {
+    const data = JSON.parse(text)
+    const channel = channels.get(data.channel)
+    if (!channel) {
+      return
+    }
+    if (data.type === 'detached') {
+      channel._closed(data.code)
+      return
+    }
+    if (channel.onmessage) {
+      // 附带解析好的消息，避免重复解析
+      channel.onmessage({ data: text, parsed: data })
+    }
+  }
+
+  current.onmessage = (event) => {
+    if (!inflater) {
+      dispatch(event.data)
+      return
+    }
+    received = received
+      .then(() => (typeof event.data === 'string' ? event.data : inflater.inflate(event.data)))
+      .then(dispatch)
+      .catch((error) => {
+        console.error('Failed to decode message:', error)
+        current.close(1002)
+      })
+  }
+
+  current.onerror = (error) => {
+    for (const channel of channels.values()) {
+      if (channel.socket === current && channel.onerror) {
+        channel.onerror(error)
+      }
+    }
+  }
+
+  current.onclose = (event) => {
+    clearInterval(heartbeat)
+    heartbeat = null
+    if (socket === current) {
+      socket = null
+    }
+    for (const channel of [...channels.values()]) {
+      if (channel.socket === current) {
+        channel._closed(event.code, event.reason)
+      }
+    }
+  }
+
+  return current
+}
+
+class MuxChannel {
+  constructor (socket, attach) {
+    this.id = nextChannel++
+    this.socket = socket
+    this.attach = attach
+    this.readyState = WebSocket.CONNECTING
+    this.onopen = null
+    this.onmessage = null
+    this.onerror = null
+    this.onclose = null
+  }
+
+  _open () {
+    if (this.readyState !== WebSocket.CONNECTING) {
+      return
+    }
+    this.socket.send(JSON.stringify({ ...this.attach, type: 'attach', channel: this.id }))
+    this.readyState = WebSocket.OPEN
+    if (this.onopen) {
+      this.onopen()
+    }
+  }
+
+  _closed (code, reason = '') {
+    if (this.readyState === WebSocket.CLOSED) {
+      return
+    }
+    this.readyState = WebSocket.CLOSED
+    channels.delete(this.id)
+    if (this.onclose) {
+      this.onclose({ code, reason })
+    }
+    const inUse = [...channels.values()].some((channel) => channel.socket === this.socket)
+    if (!inUse && this.socket.readyState === WebSocket.OPEN) {
+      // 连接上没有通道时关闭共享连接
+      this.socket.close(1000)
+    }
+  }
+
+  send (text) {
+    if (this.readyState !== WebSocket.OPEN) {
+      throw new Error('channel is not open')
+    }
+    const message = JSON.parse(text)
+    if (message.type === 'ping') {
+      // 心跳由共享连接统一发送
+      return
+    }
+    message.channel = this.id
+    this.socket.send(JSON.stringify(message))
+  }
+
+  close (code = 1000) {
+    if (this.readyState === WebSocket.OPEN && this.socket.readyState === WebSocket.OPEN) {
+      this.socket.send(JSON.stringify({ type: 'detach', channel: this.id }))
+    }
+    this._closed(code)
+  }
+}
+
+// attach: { session_id, name, cwd, reconnect, offset, epoch }
+// compress: 是否请求服务端压缩输出（同一时间所有通道使用同一设置）
+export const openChannel = (token, attach, compress = false) => {
+  const current = ensureSocket(token, compress)
+  const channel = new MuxChannel(current, attach)
+  channels.set(channel.id, channel)
+  if (current.readyState === WebSocket.OPEN) {
+    // 共享连接已建立，异步触发 onopen，与 WebSocket 的行为一致
+    setTimeout(() => channel._open(), 0)
+  }
+  return channel
+}
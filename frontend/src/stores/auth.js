@@ -17,6 +17,12 @@ export const useAuthStore = defineStore('auth', () => {
   }
   
   function logout() {
+    // 通知后端吊销 token，失败不影响本地登出
+    if (token.value) {
+      api.post('/api/v1/auth/logout', null, {
+        headers: { Authorization: `Bearer ${token.value}` }
+      }).catch(() => {})
+    }
     token.value = ''
     localStorage.removeItem('token')
   }
@@ -10,7 +10,11 @@ export const useConfigStore = defineStore('config', () => {
     theme: 'dark',
     refresh_interval: 3,
     session_timeout: 3600,  // 会话超时（秒）
-    buffer_size: 1000  // 缓存行数
+    buffer_size: 1000,  // 缓存行数
+    memory_budget_mb: 256,  // 输出缓存内存预算（MB）
+    latency_tracing: false,  // 回显延迟追踪
+    output_compression: false,  // WebSocket 输出压缩
+    archive_after_days: 30  // 已结束会话归档天数，0 表示不归档
   })
   
   async function loadConfig() {